@@ -4,11 +4,14 @@ Uses OpenAI LLM to analyze findings and suggest defensive actions.
 """
 
 from llm.llm_router import llm_complete
+from llm.prompt_compaction import compact_for_prompt
 
 def run_blue_team_simulation(findings):
     """Simulate blue team response using LLM."""
     print(f"[blue_team] Simulating blue team for findings: {findings}")
-    findings_text = "\n".join([str(f) for f in findings])
+    compacted = compact_for_prompt(findings)
+    findings_text = compacted.text
+    print(f"[blue_team] Findings compacted: {compacted.original_tokens} -> {compacted.compacted_tokens} tokens")
     prompt = f"You are a blue team security analyst. Given these pentest findings, suggest detection, response, and remediation actions.\nFindings:\n{findings_text}"
     try:
         blue_team_response = llm_complete(prompt, provider="groq")
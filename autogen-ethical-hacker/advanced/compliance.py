@@ -4,16 +4,55 @@ Uses OpenAI LLM to map findings to compliance frameworks and generate a report.
 """
 
 from llm.llm_router import llm_complete
+from llm.async_llm_router import llm_complete_many
+from llm.prompt_compaction import compact_for_prompt
+from llm.model_tiering import model_tiering
+from llm.request_scheduler import priority_scope
 
+@priority_scope("background")
 def generate_compliance_report(findings, framework="PCI DSS"):
     """Generate a compliance report using LLM."""
     print(f"[compliance] Generating report for {framework}")
-    findings_text = "\n".join([str(f) for f in findings])
+    compacted = compact_for_prompt(findings)
+    findings_text = compacted.text
+    print(f"[compliance] Findings compacted: {compacted.original_tokens} -> {compacted.compacted_tokens} tokens")
     prompt = f"You are a compliance auditor. Map the following pentest findings to the {framework} framework and generate a professional report.\nFindings:\n{findings_text}"
     try:
-        report = llm_complete(prompt, provider="groq")
+        report = llm_complete(prompt, provider="groq", **model_tiering.params("compliance_report", "groq"))
         print(f"[compliance] LLM report: {report}")
         return report
     except Exception as e:
         print(f"[compliance] Error: {e}")
         return f"Compliance report for {framework} (error: {e})"
+
+def _framework_prompt(findings_text, framework):
+    return f"You are a compliance auditor. Map the following pentest findings to the {framework} framework and generate a professional report.\nFindings:\n{findings_text}"
+
+@priority_scope("background")
+def generate_compliance_reports(findings, frameworks=("PCI DSS", "HIPAA", "ISO 27001"), max_concurrency=None):
+    """Generate one compliance report per framework concurrently. Returns {framework: report}."""
+    frameworks = list(frameworks)
+    print(f"[compliance] Generating reports for {', '.join(frameworks)}")
+    findings_text = compact_for_prompt(findings).text
+    results = llm_complete_many([_framework_prompt(findings_text, fw) for fw in frameworks],
+                                provider="groq", max_concurrency=max_concurrency,
+                                **model_tiering.params("compliance_report", "groq"))
+    reports = {}
+    for framework, item in zip(frameworks, results):
+        if not item.ok:
+            print(f"[compliance] Error for {framework}: {item.error}")
+        reports[framework] = item.result if item.ok else f"Compliance report for {framework} (error: {item.error})"
+    return reports
+
+@priority_scope("background")
+def map_findings_to_framework(findings, framework="PCI DSS", max_concurrency=None):
+    """Map each finding to framework controls individually, in batch. Returns one mapping per finding."""
+    print(f"[compliance] Mapping {len(findings)} findings to {framework}")
+    prompts = [
+        f"You are a compliance auditor. Map this pentest finding to the specific {framework} requirements it violates, with a one-line justification for each.\nFinding:\n{compact_for_prompt(f).text}"
+        for f in findings
+    ]
+    # Per-finding mapping is classification work: small tier, unusable answers re-run on the large one
+    results = model_tiering.complete_many(prompts, "compliance_mapping", provider="groq", max_concurrency=max_concurrency,
+                                          on_result=lambda item: print(f"[compliance] Mapped finding {item.index + 1}/{len(prompts)}"))
+    return [item.result if item.ok else f"Mapping unavailable (error: {item.error})" for item in results]
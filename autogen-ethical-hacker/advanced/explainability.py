@@ -3,18 +3,36 @@ Explainability Agent
 Uses OpenAI LLM to summarize/explain a step and its context.
 """
 
-from llm.llm_router import llm_complete
+from llm.prompt_compaction import compact_for_prompt
+from llm.model_tiering import model_tiering
+
+def _explain_prompt(step, context=None):
+    prompt = f"Explain the following pentest step in plain language.\nStep: {step}"
+    if context:
+        prompt += f"\nContext: {compact_for_prompt(context).text}"
+    return prompt
 
 def explain_step(step, context=None):
     """Summarize/explain a step and its context using LLM."""
     print(f"[explainability] Explaining step: {step}")
-    prompt = f"Explain the following pentest step in plain language.\nStep: {step}"
-    if context:
-        prompt += f"\nContext: {context}"
+    prompt = _explain_prompt(step, context)
     try:
-        explanation = llm_complete(prompt, provider="groq")
+        # Small-tier task: escalates to the large model only if the answer comes back unusable
+        explanation = model_tiering.complete(prompt, "explain", provider="groq")
         print(f"[explainability] LLM explanation: {explanation}")
         return explanation
     except Exception as e:
         print(f"[explainability] Error: {e}")
         return f"Explanation for: {step} (error: {e})"
+
+def explain_steps(steps, context=None, max_concurrency=None):
+    """Explain many steps concurrently. Returns explanations in the order of steps."""
+    print(f"[explainability] Explaining {len(steps)} steps")
+    results = model_tiering.complete_many([_explain_prompt(step, context) for step in steps], "explain",
+                                          provider="groq", max_concurrency=max_concurrency)
+    explanations = []
+    for step, item in zip(steps, results):
+        if not item.ok:
+            print(f"[explainability] Error for step {step}: {item.error}")
+        explanations.append(item.result if item.ok else f"Explanation for: {step} (error: {item.error})")
+    return explanations
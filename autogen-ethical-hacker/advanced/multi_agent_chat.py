@@ -10,26 +10,32 @@ import asyncio
 
 def run_multi_agent_chat(task, agents=None):
     print("[multi_agent_chat] Starting real multi-agent chat workflow...")
+    # One event loop for the whole workflow so every agent shares the async router's connection pool
+    return asyncio.run(run_multi_agent_chat_async(task, agents))
+
+async def run_multi_agent_chat_async(task, agents=None):
+    # All agents share one client backed by the process-wide async LLM router
+    model_client = LLMCompleteWrapper()
     # Define agents for each role
     recon = AssistantAgent(
         "ReconAgent",
         system_message=ROLES[0]["description"],
-        model_client=LLMCompleteWrapper(),
+        model_client=model_client,
     )
     exploit = AssistantAgent(
         "ExploitAgent",
         system_message=ROLES[1]["description"],
-        model_client=LLMCompleteWrapper(),
+        model_client=model_client,
     )
     blue = AssistantAgent(
         "BlueTeamAgent",
         system_message=ROLES[2]["description"],
-        model_client=LLMCompleteWrapper(),
+        model_client=model_client,
     )
     report = AssistantAgent(
         "ReportAgent",
         system_message=ROLES[3]["description"],
-        model_client=LLMCompleteWrapper(),
+        model_client=model_client,
     )
 
     # Critic and user proxy agents can be added here if supported in your AutoGen version
@@ -38,16 +44,16 @@ def run_multi_agent_chat(task, agents=None):
     chat_history = []
     # Simulate a round-robin workflow
     print("[multi_agent_chat] Recon agent starts...")
-    recon_msg = asyncio.run(recon.run(task=task))
+    recon_msg = await recon.run(task=task)
     chat_history.append(("ReconAgent", recon_msg))
     print("[multi_agent_chat] Exploit agent responds...")
-    exploit_msg = asyncio.run(exploit.run(task=f"Based on recon: {recon_msg}"))
+    exploit_msg = await exploit.run(task=f"Based on recon: {recon_msg}")
     chat_history.append(("ExploitAgent", exploit_msg))
     print("[multi_agent_chat] Blue team agent responds...")
-    blue_msg = asyncio.run(blue.run(task=f"Analyze exploit: {exploit_msg}"))
+    blue_msg = await blue.run(task=f"Analyze exploit: {exploit_msg}")
     chat_history.append(("BlueTeamAgent", blue_msg))
     print("[multi_agent_chat] Report agent responds...")
-    report_msg = asyncio.run(report.run(task=f"Summarize findings: {recon_msg}, {exploit_msg}, {blue_msg}"))
+    report_msg = await report.run(task=f"Summarize findings: {recon_msg}, {exploit_msg}, {blue_msg}")
     chat_history.append(("ReportAgent", report_msg))
     # Optionally, add a critic step if CriticAgent is available
     print("[multi_agent_chat] Workflow complete.")
@@ -2,17 +2,22 @@
 
 from autogen_agentchat.agents import AssistantAgent
 from llm.multi_api_manager import llm_ensemble_reasoning
-from groq import Groq
+from llm.prompt_compaction import compact_for_prompt
+from llm.autogen_client import model_client_for
+from llm.llm_router import llm_stream
+from llm.telemetry import agent_scope
+from llm.local_backend import local_backend
 
 
 class AnalysisAgent(AssistantAgent):
     def __init__(self, apis, lab_scope, tools_config):
         groq_api = apis.get('groq', {}).get('api_key', '')
         google_api = apis.get('google', {}).get('api_key', '')
-        self.groq_client = Groq(api_key=groq_api)
+        # None lets the router fall back to GROQ_API_KEY
+        self.groq_api_key = groq_api or None
         super().__init__(
             name="AnalysisAgent",
-            model_client=self.groq_client,
+            model_client=model_client_for(apis),
             system_message="You perform ensemble reasoning and risk analysis using Groq and Gemini."
         )
         self.lab_scope = lab_scope
@@ -21,30 +26,36 @@ class AnalysisAgent(AssistantAgent):
         self.local_tools = {}
         self.local_tools['ensemble_reasoning_tool'] = self.ensemble_reasoning_tool
 
-    def ensemble_reasoning_tool(self, exploit_results):
+    def stream_analysis(self, exploit_results):
+        """Yield Groq analysis tokens as they arrive so callers can parse partial output."""
+        compacted = compact_for_prompt(exploit_results)
+        prompt = compacted.text
+        print(f"[AnalysisAgent] Prompt compacted: {compacted.original_tokens} -> {compacted.compacted_tokens} tokens")
+        # The router brings caching, output budgets, continuation, scheduling, telemetry and cost tracking
+        with agent_scope("AnalysisAgent"):
+            started = False
+            try:
+                for token in llm_stream(prompt, provider="groq", api_key=self.groq_api_key,
+                                        temperature=1, top_p=1, reasoning_effort="medium"):
+                    started = True
+                    yield token
+            except Exception as e:
+                if started or not local_backend.available:
+                    raise
+                # Groq failed before the first token: keep the step alive on the local CPU model
+                print(f"[AnalysisAgent] Groq analysis failed ({e}), falling back to the local model")
+                yield from llm_stream(prompt, provider="local")
+
+    def ensemble_reasoning_tool(self, exploit_results, on_token=None):
         if not exploit_results:
             print("[AnalysisAgent] No exploit results provided.")
             return {}
         try:
-            # Use Groq client for completion
-            completion = self.groq_client.chat.completions.create(
-                model="groq/llama3-70b-8192",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": str(exploit_results)
-                    }
-                ],
-                temperature=1,
-                max_completion_tokens=8192,
-                top_p=1,
-                reasoning_effort="medium",
-                stream=True,
-                stop=None
-            )
             response = ""
-            for chunk in completion:
-                response += chunk.choices[0].delta.content or ""
+            for token in self.stream_analysis(exploit_results):
+                response += token
+                if on_token:
+                    on_token(token)
             return {"groq_analysis": response}
         except Exception as e:
             print(f"[AnalysisAgent] Groq analysis failed: {e}")
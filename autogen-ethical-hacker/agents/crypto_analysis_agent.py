@@ -1,6 +1,7 @@
 # AutoGen imports
 from autogen_agentchat.agents import AssistantAgent
-from groq import Groq
+from llm.client_pool import client_registry
+from llm.autogen_client import model_client_for
 
 class CryptoAnalysisAgent(AssistantAgent):
     """
@@ -9,10 +10,10 @@ class CryptoAnalysisAgent(AssistantAgent):
     """
     def __init__(self, apis, lab_scope, tools_config):
         groq_api = apis.get('groq', {}).get('api_key', '')
-        self.groq_client = Groq(api_key=groq_api)
+        self.groq_client = client_registry.get_groq_client(groq_api)
         super().__init__(
             name="CryptoAnalysisAgent",
-            model_client=self.groq_client,
+            model_client=model_client_for(apis),
             system_message="""You are a cryptographic security expert specializing in:
             - SSL/TLS certificate analysis and validation
             - Encryption algorithm assessment (strength, implementation flaws)
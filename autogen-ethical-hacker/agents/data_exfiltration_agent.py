@@ -1,6 +1,6 @@
 # AutoGen imports
 from autogen_agentchat.agents import AssistantAgent
-from groq import Groq
+from llm.autogen_client import model_client_for
 
 class DataExfiltrationAgent(AssistantAgent):
     """
@@ -8,11 +8,9 @@ class DataExfiltrationAgent(AssistantAgent):
     AI-powered sensitive data discovery and secure exfiltration techniques
     """
     def __init__(self, apis, lab_scope, tools_config):
-        groq_api = apis.get('groq', {}).get('api_key', '')
-        self.groq_client = Groq(api_key=groq_api)
         super().__init__(
             name="DataExfiltrationAgent",
-            model_client=self.groq_client,
+            model_client=model_client_for(apis),
             system_message="""You are an expert in data discovery and exfiltration specializing in:
             - Sensitive data identification and classification
             - File system scanning for valuable information
@@ -1,15 +1,13 @@
 from autogen_agentchat.agents import AssistantAgent
 from sandbox.docker_runner import run_in_sandbox
-from groq import Groq
+from llm.autogen_client import model_client_for
 
 
 class ExecutorAgent(AssistantAgent):
     def __init__(self, apis, lab_scope, tools_config):
-        groq_api = apis.get('groq', {}).get('api_key', '')
-        self.groq_client = Groq(api_key=groq_api)
         super().__init__(
             name="ExecutorAgent",
-            model_client=self.groq_client,
+            model_client=model_client_for(apis),
             system_message="You execute tasks in Docker sandbox for safety and isolation."
         )
         self.lab_scope = lab_scope
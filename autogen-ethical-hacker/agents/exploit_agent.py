@@ -1,15 +1,13 @@
 from autogen_agentchat.agents import AssistantAgent
 from tools.metasploit_tool import run_exploits
-from groq import Groq
+from llm.autogen_client import model_client_for
 
 
 class ExploitAgent(AssistantAgent):
     def __init__(self, apis, lab_scope, tools_config):
-        groq_api = apis.get('groq', {}).get('api_key', '')
-        self.groq_client = Groq(api_key=groq_api)
         super().__init__(
             name="ExploitAgent",
-            model_client=self.groq_client,
+            model_client=model_client_for(apis),
             system_message="You execute exploits and post-exploitation modules using Metasploit."
         )
         self.lab_scope = lab_scope
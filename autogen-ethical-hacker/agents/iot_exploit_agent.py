@@ -1,6 +1,6 @@
 # AutoGen imports
 from autogen_agentchat.agents import AssistantAgent
-from groq import Groq
+from llm.autogen_client import model_client_for
 
 class IoTExploitAgent(AssistantAgent):
     """
@@ -8,11 +8,9 @@ class IoTExploitAgent(AssistantAgent):
     AI-powered IoT security testing and firmware analysis
     """
     def __init__(self, apis, lab_scope, tools_config):
-        groq_api = apis.get('groq', {}).get('api_key', '')
-        self.groq_client = Groq(api_key=groq_api)
         super().__init__(
             name="IoTExploitAgent",
-            model_client=self.groq_client,
+            model_client=model_client_for(apis),
             system_message="""You are an IoT and embedded systems security expert specializing in:
             - IoT device discovery and fingerprinting
             - Firmware analysis and reverse engineering
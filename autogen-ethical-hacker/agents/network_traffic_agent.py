@@ -1,6 +1,6 @@
 # AutoGen imports
 from autogen_agentchat.agents import AssistantAgent
-from groq import Groq
+from llm.autogen_client import model_client_for
 
 class NetworkTrafficAgent(AssistantAgent):
     """
@@ -8,11 +8,9 @@ class NetworkTrafficAgent(AssistantAgent):
     AI-powered network monitoring and traffic analysis for anomaly detection
     """
     def __init__(self, apis, lab_scope, tools_config):
-        groq_api = apis.get('groq', {}).get('api_key', '')
-        self.groq_client = Groq(api_key=groq_api)
         super().__init__(
             name="NetworkTrafficAgent",
-            model_client=self.groq_client,
+            model_client=model_client_for(apis),
             system_message="""You are a network traffic analysis expert specializing in:
             - Deep packet inspection and protocol analysis
             - Network anomaly detection using AI/ML techniques
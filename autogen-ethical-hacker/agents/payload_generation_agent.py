@@ -1,6 +1,6 @@
 # AutoGen imports
 from autogen_agentchat.agents import AssistantAgent
-from groq import Groq
+from llm.autogen_client import model_client_for
 
 class PayloadGenerationAgent(AssistantAgent):
     """
@@ -8,11 +8,9 @@ class PayloadGenerationAgent(AssistantAgent):
     Advanced AI-driven exploit and payload creation system
     """
     def __init__(self, apis, lab_scope, tools_config):
-        groq_api = apis.get('groq', {}).get('api_key', '')
-        self.groq_client = Groq(api_key=groq_api)
         super().__init__(
             name="PayloadGenerationAgent",
-            model_client=self.groq_client,
+            model_client=model_client_for(apis),
             system_message="""You are an advanced AI payload generation specialist with expertise in:
             - Dynamic shellcode generation and polymorphic techniques
             - AI-driven exploit development and customization
@@ -2,19 +2,14 @@
 
 from autogen_agentchat.agents import AssistantAgent
 from tools.nmap_tool import run_nmap
-from groq import Groq
+from llm.autogen_client import model_client_for
 
 
 class ReconAgent(AssistantAgent):
     def __init__(self, apis, lab_scope, tools_config):
-        groq_api = apis.get('groq', {}).get('api_key', '')
-        google_api = apis.get('google', {}).get('api_key', '')
-
-        # Initialize Groq client
-        self.groq_client = Groq(api_key=groq_api)
         super().__init__(
             name="ReconAgent",
-            model_client=self.groq_client,  # Pass Groq client as model_client
+            model_client=model_client_for(apis),
             system_message="You are a reconnaissance specialist. Your goal is to perform network scans and enumeration on the targets defined in the scope. You must use the 'run_nmap_scan' tool to gather information about open ports, services, and versions. Once you have the results, clearly state that reconnaissance is complete and pass the findings on for vulnerability analysis."
         )
         self.lab_scope = lab_scope
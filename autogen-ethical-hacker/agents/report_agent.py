@@ -2,16 +2,14 @@
 
 from autogen_agentchat.agents import AssistantAgent
 from persistence.audit_logger import generate_report
-from groq import Groq
+from llm.autogen_client import model_client_for
 
 
 class ReportAgent(AssistantAgent):
     def __init__(self, apis, lab_scope, tools_config):
-        groq_api = apis.get('groq', {}).get('api_key', '')
-        self.groq_client = Groq(api_key=groq_api)
         super().__init__(
             name="ReportAgent",
-            model_client=self.groq_client,
+            model_client=model_client_for(apis),
             system_message="You generate structured reports and audit logs for all findings."
         )
         self.lab_scope = lab_scope
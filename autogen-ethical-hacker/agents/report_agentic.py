@@ -3,12 +3,19 @@ Automated report generation using LLMs for pentest findings.
 """
 from autogen_agentchat.agents import AssistantAgent
 from llm.llm_complete_wrapper import LLMCompleteWrapper
+from llm.async_llm_router import async_llm_router
+from llm.request_scheduler import priority_scope
+import asyncio
 
 def generate_pentest_report(findings: list, target: str) -> str:
     """
     findings: list of dicts, each with keys: 'title', 'description', 'evidence', 'remediation'
     target: scanned target
     """
+    return asyncio.run(generate_pentest_report_async(findings, target))
+
+async def generate_pentest_report_async(findings: list, target: str) -> str:
+    """Async variant for callers already running an event loop (shares the async LLM router)."""
     agent = AssistantAgent(
         "report_agent",
         system_message="You are a cybersecurity expert. Write a detailed, professional pentest report based on the findings provided.",
@@ -18,8 +25,9 @@ def generate_pentest_report(findings: list, target: str) -> str:
         f"Title: {f['title']}\nDescription: {f['description']}\nEvidence: {f['evidence']}\nRemediation: {f['remediation']}\n" for f in findings
     ])
     prompt = f"Generate a pentest report for target {target} with the following findings.\n\n{findings_text}"
-    import asyncio
-    result = asyncio.run(agent.run(task=prompt))
+    # Bulk report writing yields to interactive work queued on the same providers
+    with priority_scope("background"):
+        result = await agent.run(task=prompt)
     # Try to extract text from common TaskResult fields
     for attr in ("content", "text", "result", "output"):
         if hasattr(result, attr):
@@ -27,3 +35,33 @@ def generate_pentest_report(findings: list, target: str) -> str:
             if isinstance(val, str):
                 return val
     return str(result)
+
+def generate_finding_narratives(findings: list, target: str, max_concurrency: int = None) -> list:
+    """
+    Write a standalone narrative for each finding, in batch.
+    Returns one narrative per finding, in the order of findings.
+    """
+    async def run():
+        try:
+            return await generate_finding_narratives_async(findings, target, max_concurrency)
+        finally:
+            await async_llm_router.aclose()
+    return asyncio.run(run())
+
+async def generate_finding_narratives_async(findings: list, target: str, max_concurrency: int = None) -> list:
+    """Async variant of generate_finding_narratives."""
+    prompts = [
+        [
+            {"role": "system", "content": "You are a cybersecurity expert writing one section of a professional pentest report."},
+            {"role": "user", "content": f"Write the report section for this finding on target {target}.\n\n"
+                                        f"Title: {f.get('title', '')}\nDescription: {f.get('description', '')}\n"
+                                        f"Evidence: {f.get('evidence', '')}\nRemediation: {f.get('remediation', '')}"},
+        ]
+        for f in findings
+    ]
+    with priority_scope("background"):
+        results = await async_llm_router.complete_many(prompts, max_concurrency=max_concurrency)
+    return [
+        item.result if item.ok else f"## {f.get('title', 'Finding')}\n(narrative unavailable: {item.error})"
+        for f, item in zip(findings, results)
+    ]
@@ -1,6 +1,6 @@
 # AutoGen imports  
 from autogen_agentchat.agents import AssistantAgent
-from groq import Groq
+from llm.autogen_client import model_client_for
 
 class SocialEngineeringAgent(AssistantAgent):
     """
@@ -8,11 +8,9 @@ class SocialEngineeringAgent(AssistantAgent):
     AI-powered intelligence gathering and social engineering analysis
     """
     def __init__(self, apis, lab_scope, tools_config):
-        groq_api = apis.get('groq', {}).get('api_key', '')
-        self.groq_client = Groq(api_key=groq_api)
         super().__init__(
             name="SocialEngineeringAgent", 
-            model_client=self.groq_client,
+            model_client=model_client_for(apis),
             system_message="""You are an expert OSINT analyst and social engineering specialist.
             You gather intelligence through:
             - Advanced OSINT techniques (passive reconnaissance)
@@ -1,6 +1,6 @@
 # AutoGen imports
 from autogen_agentchat.agents import AssistantAgent
-from groq import Groq
+from llm.autogen_client import model_client_for
 
 class SteganographyAgent(AssistantAgent):
     """
@@ -8,11 +8,9 @@ class SteganographyAgent(AssistantAgent):
     AI-powered data hiding and covert channel establishment
     """
     def __init__(self, apis, lab_scope, tools_config):
-        groq_api = apis.get('groq', {}).get('api_key', '')
-        self.groq_client = Groq(api_key=groq_api)
         super().__init__(
             name="SteganographyAgent",
-            model_client=self.groq_client,
+            model_client=model_client_for(apis),
             system_message="""You are an expert in steganography and covert communications specializing in:
             - Image, audio, and video steganography techniques
             - Network protocol steganography and covert channels
@@ -2,16 +2,15 @@
 
 from autogen_agentchat.agents import AssistantAgent
 from tools.cve_lookup import lookup_cves
-from groq import Groq
+from tools.nmap_xml import hosts_from_results
+from llm.autogen_client import model_client_for
 
 
 class VulnAgent(AssistantAgent):
     def __init__(self, apis, lab_scope, tools_config):
-        groq_api = apis.get('groq', {}).get('api_key', '')
-        self.groq_client = Groq(api_key=groq_api)
         super().__init__(
             name="VulnAgent",
-            model_client=self.groq_client,
+            model_client=model_client_for(apis),
             system_message="You map services to CVEs and assess vulnerabilities."
         )
         self.lab_scope = lab_scope
@@ -24,8 +23,13 @@ class VulnAgent(AssistantAgent):
         if not recon_results:
             print("[VulnAgent] No recon results provided.")
             return {}
+        # Typed host records from the nmap XML parser; other result shapes are passed through as before
+        hosts = hosts_from_results(recon_results)
+        for target, record in hosts.items():
+            if record.get('error'):
+                print(f"[VulnAgent] Scan of {target} failed: {record['error']}")
         try:
-            return lookup_cves(recon_results)
+            return lookup_cves(hosts or recon_results)
         except Exception as e:
             print(f"[VulnAgent] CVE lookup failed: {e}")
             return {"error": str(e)}
@@ -1,6 +1,6 @@
 # AutoGen imports
 from autogen_agentchat.agents import AssistantAgent
-from groq import Groq
+from llm.autogen_client import model_client_for
 
 class WebAppAgent(AssistantAgent):
     """
@@ -8,11 +8,9 @@ class WebAppAgent(AssistantAgent):
     State-of-the-art web app penetration testing with AI-powered vulnerability discovery
     """
     def __init__(self, apis, lab_scope, tools_config):
-        groq_api = apis.get('groq', {}).get('api_key', '')
-        self.groq_client = Groq(api_key=groq_api)
         super().__init__(
             name="WebAppAgent",
-            model_client=self.groq_client,
+            model_client=model_client_for(apis),
             system_message="""You are an elite web application security expert with advanced AI capabilities. 
             You perform comprehensive web app penetration testing including:
             - Advanced SQL injection (time-based, boolean-based, error-based)
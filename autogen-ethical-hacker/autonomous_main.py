@@ -159,19 +159,24 @@ class AutonomousEthicalHacker:
             user_lines.append(line)
         long_task = " ".join(user_lines)
         print(f"\n[System] Summarizing and planning for: {long_task}\n")
-        # Use Groq LLM to summarize and plan steps
+        # Use Groq LLM to summarize and plan steps, streaming the plan as it is generated
         try:
-            from groq import Groq
-            groq_api = self.api_manager.apis.get('groq', {}).get('api_key', '')
-            client = Groq(api_key=groq_api)
+            from llm.llm_router import llm_stream
+            from llm.request_scheduler import priority_scope
             prompt = f"You are an expert pentest orchestrator. Given this user objective, break it down into a step-by-step plan, select the best agents/tools for each step, and output a JSON plan. Objective: {long_task}"
-            response = client.chat.completions.create(
-                model="groq/gpt-oss-120b",
-                messages=[{"role": "system", "content": "You are a pentest orchestrator."},
-                          {"role": "user", "content": prompt}]
-            )
-            plan = response.choices[0].message.content
-            print(f"[System] LLM-generated plan:\n{plan}\n")
+            groq = self.api_manager.apis.get('groq', {})
+            # The configured key, else the first of the managed ones (None falls back to GROQ_API_KEY)
+            api_key = groq.get('api_key') or next(iter(groq.get('api_keys', [])), None)
+            print("[System] LLM-generated plan:")
+            parts = []
+            # Chat answers go ahead of queued report and compliance work; the router's default model answers
+            with priority_scope("interactive"):
+                for token in llm_stream(prompt, provider="groq", api_key=api_key,
+                                        system="You are a pentest orchestrator."):
+                    parts.append(token)
+                    print(token, end="", flush=True)
+            plan = "".join(parts)
+            print("\n")
         except Exception as e:
             print(f"[System] LLM planning failed: {e}")
             plan = None
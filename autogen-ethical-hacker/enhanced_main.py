@@ -21,6 +21,7 @@ sys.path.append(str(Path(__file__).parent))
 # Import self-healing components
 from system.self_healing_manager import self_healing_manager
 from llm.enhanced_llm_router import enhanced_llm_router
+from llm.request_scheduler import priority_scope
 from tools.enhanced_tool_wrapper import enhanced_tool_wrapper
 
 class EnhancedEthicalHacker:
@@ -194,11 +195,19 @@ class EnhancedEthicalHacker:
         """
         
         print("🤖 Analyzing with enhanced AI (auto-failover enabled)...")
-        result = enhanced_llm_router.llm_complete(prompt)
-        
         print("🤖 Enhanced AI Analysis Results:")
         print("-" * 60)
-        print(result)
+        
+        # Render tokens as they arrive instead of waiting for the full answer
+        # The operator is waiting on this answer: schedule it ahead of queued batch work
+        parts = []
+        with priority_scope('interactive'):
+            for token in enhanced_llm_router.llm_stream(prompt):
+                parts.append(token)
+                print(token, end="", flush=True)
+        result = "".join(parts)
+        
+        print()
         print("-" * 60)
         
         return result
@@ -346,7 +355,8 @@ class EnhancedEthicalHacker:
         """
         
         print("🤖 Creating enhanced penetration testing plan with AI failover...")
-        plan = enhanced_llm_router.llm_complete(prompt)
+        with priority_scope('interactive'):
+            plan = enhanced_llm_router.llm_complete(prompt)
         
         print("🎲 Enhanced Custom Task Plan:")
         print("-" * 60)
@@ -0,0 +1,929 @@
+#!/usr/bin/env python3
+"""
+⚡ Async LLM Router
+Native asyncio completions against the Groq and Gemini HTTP endpoints with per-provider
+concurrency limits, timeouts, cancellation and provider failover
+"""
+
+import os
+import time
+import asyncio
+import logging
+import json
+import uuid
+import weakref
+from typing import Dict, Any, Optional, List, Union, AsyncIterator, Iterable, Callable
+
+from llm.response_cache import response_cache, make_cache_key
+from llm.semantic_cache import semantic_cache
+from llm.single_flight import async_single_flight
+from llm.hedging import HedgePolicy
+from llm.stream_metrics import stream_metrics
+from llm.cassette import llm_cassette
+from llm.telemetry import llm_telemetry, agent_scope, current_agent
+from llm.output_budget import output_budget, normalize_finish_reason
+from llm.request_scheduler import request_scheduler
+from llm.cost_ledger import cost_ledger, BudgetExceededError
+from llm.local_backend import local_backend
+
+GROQ_CHAT_URL = "https://api.groq.com/openai/v1/chat/completions"
+GEMINI_GENERATE_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
+GEMINI_STREAM_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:streamGenerateContent?alt=sse"
+
+DEFAULT_MODELS = {
+    'groq': "openai/gpt-oss-120b",
+    'gemini': "gemini-1.5-pro",
+}
+
+PROVIDER_ALIASES = {'google': 'gemini'}
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMProviderError(Exception):
+    """Raised when a provider returns an error response"""
+
+    def __init__(self, provider: str, message: str, status: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(f"{provider} error{f' {status}' if status else ''}: {message}")
+        self.provider = provider
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status is None or self.status in RETRYABLE_STATUS
+
+
+class BatchResult:
+    """Outcome of one prompt in a complete_many batch; failures are kept per item"""
+
+    def __init__(self, index: int, prompt: Any, result: Optional[str] = None, error: Optional[BaseException] = None):
+        self.index = index
+        self.prompt = prompt
+        self.result = result
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self):
+        outcome = f"error={self.error!r}" if self.error is not None else f"result={len(self.result or '')} chars"
+        return f"BatchResult(index={self.index}, {outcome})"
+
+
+class _LoopResources:
+    """HTTP client and semaphores bound to a single event loop"""
+
+    def __init__(self, router: "AsyncLLMRouter"):
+        import httpx
+
+        total = sum(router.max_concurrency.values())
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=total, max_keepalive_connections=total),
+            timeout=httpx.Timeout(router.request_timeout, connect=router.connect_timeout),
+        )
+        self.semaphores = {p: asyncio.Semaphore(n) for p, n in router.max_concurrency.items()}
+
+
+class AsyncLLMRouter:
+    """
+    Async-first LLM router; hundreds of completions can be in flight without a thread per call
+    """
+
+    def __init__(self, max_concurrency: Optional[Dict[str, int]] = None,
+                 request_timeout: float = 120.0, connect_timeout: float = 10.0,
+                 max_retries: int = 3, base_delay: float = 1.0):
+        self.max_concurrency = max_concurrency or {
+            'groq': int(os.environ.get("LLM_GROQ_MAX_CONCURRENCY", 64)),
+            'gemini': int(os.environ.get("LLM_GEMINI_MAX_CONCURRENCY", 32)),
+        }
+        self.request_timeout = request_timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+
+        self._resources = weakref.WeakKeyDictionary()
+        self.hedge_policy = HedgePolicy()
+        # A 429 pauses new requests to that provider instead of letting every in-flight caller retry into it
+        self._cooldown_until = {p: 0.0 for p in self.max_concurrency}
+
+        self.stats = {
+            p: {'in_flight': 0, 'completed': 0, 'failed': 0, 'retries': 0, 'timeouts': 0, 'cancelled': 0, 'rate_limited': 0}
+            for p in self.max_concurrency
+        }
+
+        self.setup_logging()
+
+    def setup_logging(self):
+        """Setup logging for async LLM operations"""
+        self.logger = logging.getLogger('AsyncLLMRouter')
+        if not self.logger.handlers:
+            handler = logging.StreamHandler()
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+
+    def _loop_resources(self) -> _LoopResources:
+        """httpx clients and semaphores cannot cross event loops, so keep one set per loop"""
+        loop = asyncio.get_running_loop()
+        resources = self._resources.get(loop)
+        if resources is None:
+            resources = _LoopResources(self)
+            self._resources[loop] = resources
+        return resources
+
+    @staticmethod
+    def _normalize_provider(provider: Optional[str]) -> str:
+        provider = (provider or 'groq').lower()
+        return PROVIDER_ALIASES.get(provider, provider)
+
+    @staticmethod
+    def _to_messages(prompt: Union[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        if isinstance(prompt, list):
+            return [{'role': m.get('role', 'user'), 'content': str(m.get('content', ''))} for m in prompt]
+        return [{'role': 'user', 'content': str(prompt)}]
+
+    @staticmethod
+    def _prompt_text(messages: List[Dict[str, Any]]) -> str:
+        """Flatten messages into the text used to address the response cache"""
+        if len(messages) == 1 and messages[0]['role'] == 'user':
+            return messages[0]['content']
+        return "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+
+    @staticmethod
+    def _api_key(provider: str, kwargs: Dict[str, Any]) -> Optional[str]:
+        """The caller's key for this request: api_keys={provider: key} (kept apart per provider for failover) or api_key"""
+        return (kwargs.get("api_keys") or {}).get(provider) or kwargs.get("api_key")
+
+    def _groq_request(self, messages, model, kwargs):
+        api_key = self._api_key('groq', kwargs) or os.environ.get("GROQ_API_KEY")
+        if not api_key and not llm_cassette.replaying:
+            raise LLMProviderError('groq', "GROQ_API_KEY not set", status=401)
+        max_tokens = kwargs.get("max_completion_tokens", kwargs.get("max_tokens"))
+        # params address the caches and cassette, so they hold the default limit rather than the predicted one
+        params = {
+            "temperature": kwargs.get("temperature", 1),
+            "max_completion_tokens": max_tokens or 8192,
+            "top_p": kwargs.get("top_p", 1),
+            "reasoning_effort": kwargs.get("reasoning_effort", "medium"),
+            "stop": kwargs.get("stop", None),
+        }
+        body = {"model": model, "messages": messages, **{k: v for k, v in params.items() if v is not None}}
+        if not max_tokens:
+            body["max_completion_tokens"] = output_budget.limit('groq', model, 8192)
+        headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+        return GROQ_CHAT_URL, headers, body, params
+
+    def _gemini_request(self, messages, model, kwargs):
+        api_key = self._api_key('gemini', kwargs) or os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
+        if not api_key and not llm_cassette.replaying:
+            raise LLMProviderError('gemini', "GEMINI_API_KEY not set", status=401)
+        params = {
+            "temperature": kwargs.get("temperature"),
+            "max_tokens": kwargs.get("max_tokens", kwargs.get("max_completion_tokens")),
+            "top_p": kwargs.get("top_p"),
+            "stop": kwargs.get("stop"),
+        }
+        generation_config = {
+            "temperature": params["temperature"],
+            # None (no learned budget yet) keeps Gemini's own output limit
+            "maxOutputTokens": params["max_tokens"] or output_budget.limit('gemini', model, None),
+            "topP": params["top_p"],
+            "stopSequences": [params["stop"]] if isinstance(params["stop"], str) else params["stop"],
+        }
+        system = [m['content'] for m in messages if m['role'] == 'system']
+        body = {
+            "contents": [
+                {"role": "model" if m['role'] == 'assistant' else "user", "parts": [{"text": m['content']}]}
+                for m in messages if m['role'] != 'system'
+            ],
+            "generationConfig": {k: v for k, v in generation_config.items() if v is not None},
+        }
+        if system:
+            body["systemInstruction"] = {"parts": [{"text": "\n".join(system)}]}
+        headers = {"x-goog-api-key": api_key, "Content-Type": "application/json"}
+        return GEMINI_GENERATE_URL.format(model=model), headers, body, params
+
+    @staticmethod
+    def _parse_response(provider: str, payload: Dict[str, Any]) -> str:
+        if provider == 'groq':
+            return payload["choices"][0]["message"]["content"] or ""
+        return "".join(part.get("text", "") for part in payload["candidates"][0]["content"]["parts"])
+
+    @staticmethod
+    def _finish_reason(provider: str, payload: Dict[str, Any]) -> Optional[str]:
+        if provider == 'groq':
+            return normalize_finish_reason(payload["choices"][0].get("finish_reason"))
+        return normalize_finish_reason(payload["candidates"][0].get("finishReason"))
+
+    @staticmethod
+    def _usage(provider: str, payload: Dict[str, Any]) -> Optional[Dict[str, int]]:
+        """Provider-reported token usage as {'prompt_tokens', 'completion_tokens'}, if present"""
+        if provider == 'groq':
+            usage = payload.get("usage")
+            if not usage:
+                return None
+            return {'prompt_tokens': usage.get("prompt_tokens"), 'completion_tokens': usage.get("completion_tokens")}
+        usage = payload.get("usageMetadata")
+        if not usage or "candidatesTokenCount" not in usage:
+            return None
+        return {'prompt_tokens': usage.get("promptTokenCount"), 'completion_tokens': usage.get("candidatesTokenCount")}
+
+    async def _wait_for_cooldown(self, provider: str):
+        delay = self._cooldown_until.get(provider, 0.0) - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _note_rate_limit(self, provider: str, error: LLMProviderError):
+        """Hold back every caller of a provider that answered 429 until its retry-after passes"""
+        if error.status != 429:
+            return
+        self.stats[provider]['rate_limited'] += 1
+        until = time.monotonic() + (error.retry_after or self.base_delay)
+        if until > self._cooldown_until.get(provider, 0.0):
+            self._cooldown_until[provider] = until
+            self.logger.warning(f"🚦 {provider.title()} rate limited, pausing new requests for {until - time.monotonic():.1f}s")
+
+    async def _post(self, provider: str, url: str, headers: Dict[str, str], body: Dict[str, Any]) -> Dict[str, Any]:
+        import httpx
+
+        resources = self._loop_resources()
+        # Priority admission first; the per-loop semaphore then bounds this loop's share
+        async with request_scheduler.aslot(provider):
+            queued_at = time.monotonic()
+            await self._wait_for_cooldown(provider)
+            async with resources.semaphores[provider]:
+                llm_telemetry.note(queue_wait=time.monotonic() - queued_at)
+                self.stats[provider]['in_flight'] += 1
+                try:
+                    response = await resources.client.post(url, headers=headers, json=body)
+                except httpx.TimeoutException as e:
+                    self.stats[provider]['timeouts'] += 1
+                    raise LLMProviderError(provider, f"timeout: {e}") from e
+                except httpx.TransportError as e:
+                    raise LLMProviderError(provider, f"transport error: {e}") from e
+                finally:
+                    self.stats[provider]['in_flight'] -= 1
+
+        if response.status_code != 200:
+            error = self._error_from_response(provider, response, response.text)
+            self._note_rate_limit(provider, error)
+            raise error
+        return response.json()
+
+    @staticmethod
+    def _error_from_response(provider: str, response, text: str) -> LLMProviderError:
+        retry_after = response.headers.get("retry-after")
+        return LLMProviderError(
+            provider, text[:500], status=response.status_code,
+            retry_after=float(retry_after) if retry_after and retry_after.replace('.', '', 1).isdigit() else None
+        )
+
+    def _build_request(self, provider: str, messages: List[Dict[str, Any]], model: str, kwargs: Dict[str, Any]):
+        if provider == 'groq':
+            return self._groq_request(messages, model, kwargs)
+        if provider == 'gemini':
+            return self._gemini_request(messages, model, kwargs)
+        raise ValueError(f"Unknown provider: {provider}")
+
+    async def _stream_provider(self, provider: str, messages: List[Dict[str, Any]], model: Optional[str],
+                               kwargs: Dict[str, Any], meta: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """Yield tokens from one provider's server-sent-event stream; meta gets finish_reason and usage"""
+        import httpx
+
+        model = model or DEFAULT_MODELS[provider]
+        url, headers, body, params = self._build_request(provider, messages, model, kwargs)
+        use_cache = kwargs.get("use_cache", True)
+        prompt_text = self._prompt_text(messages)
+        if use_cache:
+            cached = response_cache.get(provider, model, prompt_text, params)
+            if cached is None:
+                cached = semantic_cache.get(provider, model, prompt_text, params)
+            if cached is not None:
+                llm_telemetry.note(cache_hit=True)
+                yield cached
+                return
+
+        if provider == 'groq':
+            body = {**body, "stream": True}
+        else:
+            url = GEMINI_STREAM_URL.format(model=model)
+
+        resources = self._loop_resources()
+        recorder = stream_metrics.start(provider, model)
+        parts = []
+        await self._wait_for_cooldown(provider)
+        async with request_scheduler.aslot(provider, bind=False), resources.semaphores[provider]:
+            self.stats[provider]['in_flight'] += 1
+            try:
+                async with resources.client.stream("POST", url, headers=headers, json=body) as response:
+                    if response.status_code != 200:
+                        error = self._error_from_response(provider, response, (await response.aread()).decode(errors="replace"))
+                        self._note_rate_limit(provider, error)
+                        raise error
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[5:].strip()
+                        if data == "[DONE]":
+                            break
+                        event = json.loads(data)
+                        if provider == 'groq':
+                            choices = event.get("choices") or [{}]
+                            token = (choices[0].get("delta") or {}).get("content") or ""
+                            finish_reason = choices[0].get("finish_reason")
+                        else:
+                            candidates = event.get("candidates") or [{}]
+                            token = "".join(p.get("text", "") for p in (candidates[0].get("content") or {}).get("parts", []))
+                            finish_reason = candidates[0].get("finishReason")
+                        if meta is not None:
+                            if finish_reason:
+                                meta['finish_reason'] = normalize_finish_reason(finish_reason)
+                            # Groq reports usage in the last chunk (under x_groq); Gemini on every chunk
+                            usage = self._usage(provider, event.get("x_groq") or event)
+                            if usage:
+                                meta['usage'] = usage
+                        if token:
+                            recorder.on_token(token)
+                            parts.append(token)
+                            yield token
+            except httpx.TimeoutException as e:
+                self.stats[provider]['timeouts'] += 1
+                recorder.finish(e)
+                raise LLMProviderError(provider, f"timeout: {e}") from e
+            except httpx.TransportError as e:
+                recorder.finish(e)
+                raise LLMProviderError(provider, f"transport error: {e}") from e
+            except (GeneratorExit, asyncio.CancelledError):
+                recorder.finish()
+                raise
+            except Exception as e:
+                recorder.finish(e)
+                raise
+            finally:
+                self.stats[provider]['in_flight'] -= 1
+
+        recorder.finish()
+        self.stats[provider]['completed'] += 1
+        if use_cache:
+            response_cache.put(provider, model, prompt_text, "".join(parts), params)
+            semantic_cache.put(provider, model, prompt_text, "".join(parts), params)
+
+    async def stream(self, prompt: Union[str, List[Dict[str, Any]]], provider: Optional[str] = "groq",
+                     model: Optional[str] = None, fallback: bool = True,
+                     meta: Optional[Dict[str, Any]] = None, **kwargs) -> AsyncIterator[str]:
+        """
+        Async iterator over completion tokens as they arrive
+
+        Failover only happens before the first token; a stream that breaks part-way
+        raises so consumers never see output from two providers spliced together.
+        `meta`, if given, receives the provider and model that answered, the finish reason and
+        the provider-reported token usage (absent for cached answers; replays restore the recorded one).
+        """
+        provider = self._normalize_provider(provider)
+        messages = self._to_messages(prompt)
+        order = [provider] + ([p for p in self.max_concurrency if p != provider] if fallback else [])
+        call = llm_telemetry.call(provider, model, self._prompt_text(messages))
+        meta = {} if meta is None else meta
+        parts = []
+        # Recordings are addressed by the generation parameters, never by the caller's keys
+        recorded_params = {k: v for k, v in kwargs.items() if k not in ('api_key', 'api_keys')}
+        # The active call for the whole stream, so caches, scheduler and cost ledger annotate it
+        with call:
+            last_error = None
+            for index, current in enumerate(order):
+                started = False
+                try:
+                    current_model = cost_ledger.model_for(current, (model if index == 0 else None) or DEFAULT_MODELS[current])
+                    call.note(provider=current, model=current_model)
+                    meta.update(provider=current, model=current_model)
+                    tokens = llm_cassette.astream(current, current_model, self._prompt_text(messages), recorded_params,
+                                                  lambda: self._stream_provider(current, messages, current_model, kwargs, meta),
+                                                  meta)
+                    async for token in tokens:
+                        started = True
+                        call.on_token(token)
+                        parts.append(token)
+                        yield token
+                    call.note(**meta.get('usage', {}))
+                    call.finish(result="".join(parts))
+                    return
+                except BudgetExceededError as e:
+                    # Every paid provider is refused alike; only the local model is left
+                    last_error = e
+                    break
+                except (LLMProviderError, ValueError, KeyError, IndexError) as e:
+                    self.stats[current]['failed'] += 1
+                    if started:
+                        call.finish(e, "".join(parts))
+                        raise
+                    last_error = e
+                    if index + 1 < len(order):
+                        self.logger.warning(f"🔄 {current.title()} stream failed, falling back to {order[index + 1].title()}: {e}")
+                finally:
+                    if started and not call.finished:
+                        # The consumer stopped early
+                        call.finish(result="".join(parts))
+            if isinstance(last_error, BudgetExceededError) and local_backend.available:
+                # Answered in one piece, like a cached response
+                self.logger.warning(f"🛑 {last_error}; answering with the local model")
+                meta.update(provider='local', model=local_backend.model_name)
+                text = await self._complete_local(messages, kwargs)
+                call.set_result(text)
+                call.finish()
+                yield text
+                return
+            call.finish(last_error)
+            raise last_error
+
+    async def _complete_provider(self, provider: str, messages: List[Dict[str, Any]],
+                                 model: Optional[str], kwargs: Dict[str, Any]) -> str:
+        """One provider with exponential-backoff retries on retryable failures"""
+        # Over the engagement's soft budget the cheaper sibling model answers
+        model = cost_ledger.model_for(provider, model or DEFAULT_MODELS[provider])
+        params = self._build_request(provider, messages, model, kwargs)[3]
+
+        use_cache = kwargs.get("use_cache", True)
+        prompt_text = self._prompt_text(messages)
+        llm_telemetry.note(provider=provider, model=model)
+        if use_cache:
+            cached = response_cache.get(provider, model, prompt_text, params)
+            if cached is None:
+                cached = semantic_cache.get(provider, model, prompt_text, params)
+            if cached is not None:
+                llm_telemetry.note(cache_hit=True)
+                return cached
+
+        async def request(request_messages):
+            # Continuations are re-built from the same arguments as the first request
+            request_url, request_headers, request_body, _ = self._build_request(provider, request_messages, model, kwargs)
+            meta = {}
+
+            async def fetch():
+                payload = await self._post(provider, request_url, request_headers, request_body)
+                meta['finish_reason'] = self._finish_reason(provider, payload)
+                return self._parse_response(provider, payload)
+
+            result = await self._with_retries(provider, lambda: llm_cassette.acomplete(
+                provider, model, self._prompt_text(request_messages), params, fetch, meta))
+            return result, meta.get('finish_reason')
+
+        async def call():
+            # Answers cut off at the output limit are continued and joined
+            result = await output_budget.acomplete(messages, request)
+            if use_cache:
+                response_cache.put(provider, model, prompt_text, result, params)
+                semantic_cache.put(provider, model, prompt_text, result, params)
+            return result
+
+        # Identical concurrent requests attach to the one outstanding call
+        return await async_single_flight.do(make_cache_key(provider, model, prompt_text, params), call)
+
+    async def _with_retries(self, provider: str, attempt: Callable[[], Any]) -> Any:
+        """Await attempt() with exponential-backoff retries on retryable provider failures"""
+        loop = asyncio.get_running_loop()
+        for attempt_number in range(self.max_retries + 1):
+            try:
+                start_time = loop.time()
+                result = await attempt()
+                self.hedge_policy.record_latency(provider, loop.time() - start_time)
+                self.stats[provider]['completed'] += 1
+                return result
+            except asyncio.CancelledError:
+                self.stats[provider]['cancelled'] += 1
+                raise
+            except (LLMProviderError, KeyError, IndexError, ValueError) as e:
+                retryable = isinstance(e, LLMProviderError) and e.retryable
+                if attempt_number == self.max_retries or not retryable:
+                    self.stats[provider]['failed'] += 1
+                    raise
+                delay = e.retry_after or self.base_delay * (2 ** attempt_number)
+                self.stats[provider]['retries'] += 1
+                llm_telemetry.note_retry()
+                self.logger.warning(f"⚠️ {provider.title()} attempt {attempt_number + 1} failed, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+
+        raise LLMProviderError(provider, "All retry attempts exhausted")
+
+    async def complete(self, prompt: Union[str, List[Dict[str, Any]]], provider: Optional[str] = "groq",
+                       model: Optional[str] = None, timeout: Optional[float] = None,
+                       fallback: bool = True, **kwargs) -> str:
+        """
+        Complete a prompt (string or chat messages) asynchronously
+
+        Args:
+            prompt: Prompt text or a list of {'role', 'content'} messages
+            provider: Preferred provider ('groq' or 'gemini'/'google')
+            model: Model for the preferred provider; fallbacks use their default model
+            timeout: Overall deadline in seconds across retries and failover
+            fallback: Try the other provider when the preferred one fails
+            **kwargs: Generation parameters (temperature, max_tokens, top_p, stop, ...)
+
+        Returns:
+            Generated text; raises the last provider error when every provider fails
+        """
+        provider = self._normalize_provider(provider)
+        messages = self._to_messages(prompt)
+        order = [provider] + ([p for p in self.max_concurrency if p != provider] if fallback else [])
+
+        async def run():
+            if self.hedge_policy.enabled and len(order) > 1:
+                self.hedge_policy.start_request()
+                return await self._hedged(order[0], order[1], messages, model, kwargs)
+            last_error = None
+            for index, current in enumerate(order):
+                try:
+                    return await self._complete_provider(current, messages, model if index == 0 else None, kwargs)
+                except (LLMProviderError, KeyError, IndexError, ValueError) as e:
+                    last_error = e
+                    if index + 1 < len(order):
+                        self.logger.warning(f"🔄 {current.title()} failed, falling back to {order[index + 1].title()}: {e}")
+            raise last_error
+
+        async def run_within_budget():
+            try:
+                return await run()
+            except BudgetExceededError as e:
+                if not local_backend.available:
+                    raise
+                self.logger.warning(f"🛑 {e}; answering with the local model")
+                return await self._complete_local(messages, kwargs)
+
+        with llm_telemetry.call(provider, model, self._prompt_text(messages)) as call:
+            attempt = run_within_budget()
+            result = await attempt if timeout is None else await asyncio.wait_for(attempt, timeout)
+            call.set_result(result)
+            return result
+
+    async def _complete_local(self, messages: List[Dict[str, Any]], kwargs: Dict[str, Any]) -> str:
+        """
+        The local CPU model, on a worker thread: what answers once the engagement's hard budget
+        refuses the paid providers. Shares response cache entries with llm_router's "local" provider.
+        """
+        model = local_backend.model_name
+        prompt_text = self._prompt_text(messages)
+        max_tokens = kwargs.get("max_tokens", kwargs.get("max_completion_tokens"))
+        params = {"temperature": kwargs.get("temperature", 0.2), "max_tokens": max_tokens or 1024, "stop": kwargs.get("stop")}
+        use_cache = kwargs.get("use_cache", True)
+        llm_telemetry.note(provider='local', model=model)
+        if use_cache:
+            cached = response_cache.get('local', model, prompt_text, params)
+            if cached is not None:
+                llm_telemetry.note(cache_hit=True)
+                return cached
+        limit = max_tokens or output_budget.limit('local', model, 1024)
+
+        def fetch(text):
+            meta = {}
+            return local_backend.complete(text, limit, params["temperature"], params["stop"], meta), meta.get('finish_reason')
+
+        async with request_scheduler.aslot('local'):
+            result = await asyncio.to_thread(output_budget.complete, prompt_text, fetch)
+        if use_cache:
+            response_cache.put('local', model, prompt_text, result, params)
+        return result
+
+    # -- chat turns: tool calls, JSON output and provider token usage -----------------
+
+    @staticmethod
+    def _gemini_schema(schema: Any) -> Any:
+        """Gemini accepts an OpenAPI subset of JSON schema; drop the keywords it rejects"""
+        if isinstance(schema, dict):
+            cleaned = {k: AsyncLLMRouter._gemini_schema(v) for k, v in schema.items()
+                       if k not in ('additionalProperties', '$schema', 'title', 'default', 'strict', 'properties')}
+            if 'properties' in schema:
+                # Property names are the tool's own and are kept as they are
+                cleaned['properties'] = {name: AsyncLLMRouter._gemini_schema(v) for name, v in schema['properties'].items()}
+            return cleaned
+        if isinstance(schema, list):
+            return [AsyncLLMRouter._gemini_schema(v) for v in schema]
+        return schema
+
+    @staticmethod
+    def _gemini_contents(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Chat messages (with tool calls and tool results) as Gemini contents"""
+        contents = []
+        for m in messages:
+            if m['role'] == 'system':
+                continue
+            if m['role'] == 'tool':
+                part = {"functionResponse": {"name": m.get('name', ''), "response": {"content": m.get('content') or ''}}}
+                # Results of one turn's parallel calls go back together in a single user turn
+                if contents and contents[-1]['role'] == 'user' and all('functionResponse' in p for p in contents[-1]['parts']):
+                    contents[-1]['parts'].append(part)
+                else:
+                    contents.append({"role": "user", "parts": [part]})
+                continue
+            parts = [{"text": m['content']}] if m.get('content') else []
+            for tool_call in m.get('tool_calls') or []:
+                function = tool_call['function']
+                parts.append({"functionCall": {"name": function['name'], "args": json.loads(function.get('arguments') or '{}')}})
+            contents.append({"role": "model" if m['role'] == 'assistant' else "user", "parts": parts or [{"text": ""}]})
+        return contents
+
+    def _chat_request(self, provider: str, messages: List[Dict[str, Any]], model: str, kwargs: Dict[str, Any],
+                      tools: Optional[List[Dict[str, Any]]], tool_choice: Union[str, Dict[str, str]],
+                      response_format: Optional[Dict[str, Any]]):
+        if provider == 'groq':
+            # Tool results carry the function name for Gemini; the OpenAI format only takes the call id
+            wire = [{k: v for k, v in m.items() if not (m['role'] == 'tool' and k == 'name')} for m in messages]
+            url, headers, body, params = self._groq_request(wire, model, kwargs)
+            if tools:
+                body["tools"] = [{"type": "function", "function": tool} for tool in tools]
+                body["tool_choice"] = tool_choice if isinstance(tool_choice, str) else {"type": "function", "function": tool_choice}
+            if response_format:
+                body["response_format"] = response_format
+            return url, headers, body, params
+        url, headers, body, params = self._gemini_request([m for m in messages if m['role'] == 'system'], model, kwargs)
+        body["contents"] = self._gemini_contents(messages)
+        if tools:
+            body["tools"] = [{"functionDeclarations": [
+                {k: self._gemini_schema(v) for k, v in tool.items() if k in ('name', 'description', 'parameters')}
+                for tool in tools
+            ]}]
+            config = {"mode": {'auto': "AUTO", 'required': "ANY", 'none': "NONE"}.get(tool_choice, "ANY")}
+            if isinstance(tool_choice, dict):
+                config["allowedFunctionNames"] = [tool_choice['name']]
+            body["toolConfig"] = {"functionCallingConfig": config}
+        if response_format:
+            body["generationConfig"]["responseMimeType"] = "application/json"
+        return url, headers, body, params
+
+    def _parse_chat(self, provider: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        if provider == 'groq':
+            choice = payload["choices"][0]
+            message = choice["message"]
+            content = message.get("content") or ""
+            reasoning = message.get("reasoning")
+            tool_calls = [
+                {'id': c['id'], 'name': c['function']['name'], 'arguments': c['function'].get('arguments') or '{}'}
+                for c in message.get("tool_calls") or []
+            ]
+            finish_reason = choice.get("finish_reason")
+        else:
+            candidate = payload["candidates"][0]
+            parts = (candidate.get("content") or {}).get("parts", [])
+            content = "".join(p.get("text", "") for p in parts if not p.get("thought"))
+            reasoning = "".join(p.get("text", "") for p in parts if p.get("thought")) or None
+            # Gemini does not assign call ids; tool results are matched by function name instead
+            tool_calls = [
+                {'id': f"call_{uuid.uuid4().hex[:12]}", 'name': p['functionCall']['name'],
+                 'arguments': json.dumps(p['functionCall'].get('args') or {})}
+                for p in parts if 'functionCall' in p
+            ]
+            finish_reason = candidate.get("finishReason")
+        return {
+            'content': content,
+            'tool_calls': tool_calls,
+            'reasoning': reasoning,
+            'finish_reason': 'tool_calls' if tool_calls else normalize_finish_reason(finish_reason),
+            'usage': self._usage(provider, payload),
+        }
+
+    async def _chat_provider(self, provider: str, messages: List[Dict[str, Any]], model: Optional[str],
+                             kwargs: Dict[str, Any], tools, tool_choice, response_format) -> Dict[str, Any]:
+        model = cost_ledger.model_for(provider, model or DEFAULT_MODELS[provider])
+        url, headers, body, params = self._chat_request(provider, messages, model, kwargs, tools, tool_choice, response_format)
+        llm_telemetry.note(provider=provider, model=model)
+
+        # Plain text turns share response cache entries with complete(); tool turns are never cached
+        plain = not tools and not response_format and all(
+            m['role'] in ('system', 'user', 'assistant') and isinstance(m.get('content'), str) and not m.get('tool_calls')
+            for m in messages
+        )
+        use_cache = plain and kwargs.get("use_cache", True)
+        prompt_text = self._prompt_text(messages) if plain else None
+        if use_cache:
+            cached = response_cache.get(provider, model, prompt_text, params)
+            if cached is not None:
+                llm_telemetry.note(cache_hit=True)
+                return {'content': cached, 'tool_calls': [], 'reasoning': None, 'finish_reason': 'stop',
+                        'usage': None, 'provider': provider, 'model': model, 'cached': True}
+
+        async def fetch():
+            return self._parse_chat(provider, await self._post(provider, url, headers, body))
+
+        request_params = {**params, 'tools': tools, 'tool_choice': tool_choice, 'response_format': response_format}
+        result = await self._with_retries(provider, lambda: llm_cassette.acomplete(
+            provider, model, json.dumps(messages, sort_keys=True), request_params, fetch))
+        if use_cache and result['finish_reason'] != 'length':
+            response_cache.put(provider, model, prompt_text, result['content'], params)
+        return {**result, 'provider': provider, 'model': model, 'cached': False}
+
+    async def chat(self, messages: List[Dict[str, Any]], provider: Optional[str] = "groq", model: Optional[str] = None,
+                   tools: Optional[List[Dict[str, Any]]] = None, tool_choice: Union[str, Dict[str, str]] = "auto",
+                   response_format: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None,
+                   fallback: bool = True, **kwargs) -> Dict[str, Any]:
+        """
+        One full chat turn: tool definitions, tool-call history, JSON mode and token usage
+
+        Args:
+            messages: Chat messages; assistant turns may carry OpenAI-style 'tool_calls' and tool
+                results are {'role': 'tool', 'tool_call_id', 'name', 'content'}
+            tools: Function schemas ({'name', 'description', 'parameters'})
+            tool_choice: 'auto', 'required', 'none', or {'name': ...} to force one function
+            response_format: OpenAI-style response_format ({'type': 'json_object'} or a json_schema)
+            provider, model, timeout, fallback, **kwargs: As for complete()
+
+        Returns:
+            {'content', 'tool_calls': [{'id', 'name', 'arguments'}], 'reasoning', 'finish_reason',
+             'usage': {'prompt_tokens', 'completion_tokens'} (None when cached), 'provider', 'model', 'cached'}
+        """
+        provider = self._normalize_provider(provider)
+        order = [provider] + ([p for p in self.max_concurrency if p != provider] if fallback else [])
+
+        async def run():
+            last_error = None
+            for index, current in enumerate(order):
+                try:
+                    return await self._chat_provider(current, messages, model if index == 0 else None, kwargs,
+                                                     tools, tool_choice, response_format)
+                except (LLMProviderError, KeyError, IndexError, ValueError) as e:
+                    last_error = e
+                    if index + 1 < len(order):
+                        self.logger.warning(f"🔄 {current.title()} failed, falling back to {order[index + 1].title()}: {e}")
+            raise last_error
+
+        async def run_within_budget():
+            try:
+                return await run()
+            except BudgetExceededError as e:
+                # The local model has no tool calling or JSON mode: a plain text turn is the best left
+                if not local_backend.available:
+                    raise
+                self.logger.warning(f"🛑 {e}; answering with the local model")
+                content = await self._complete_local(messages, kwargs)
+                return {'content': content, 'tool_calls': [], 'reasoning': None, 'finish_reason': 'stop',
+                        'usage': None, 'provider': 'local', 'model': local_backend.model_name, 'cached': False}
+
+        with llm_telemetry.call(provider, model, json.dumps(messages)) as call:
+            attempt = run_within_budget()
+            result = await attempt if timeout is None else await asyncio.wait_for(attempt, timeout)
+            call.note(finish_reason=result['finish_reason'], **(result['usage'] or {}))
+            call.set_result(result['content'] or json.dumps(result['tool_calls']))
+            return result
+
+    async def _hedged(self, primary: str, secondary: str, messages: List[Dict[str, Any]],
+                      model: Optional[str], kwargs: Dict[str, Any]) -> str:
+        """
+        Race the secondary against a primary that is slower than its tracked latency
+        threshold; the loser is cancelled. A primary failure falls over to the secondary.
+        """
+        primary_task = asyncio.ensure_future(self._complete_provider(primary, messages, model, kwargs))
+        tasks = [primary_task]
+        try:
+            delay = self.hedge_policy.hedge_delay(primary)
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done and primary_task.exception() is None:
+                return primary_task.result()
+            if done:
+                self.logger.warning(f"🔄 {primary.title()} failed, falling back to {secondary.title()}: {primary_task.exception()}")
+                return await self._complete_provider(secondary, messages, None, kwargs)
+            if not self.hedge_policy.try_acquire_hedge():
+                return await primary_task
+
+            self.logger.info(f"🎯 {primary.title()} slower than {delay:.2f}s, hedging to {secondary.title()}")
+            hedge_task = asyncio.ensure_future(self._complete_provider(secondary, messages, None, kwargs))
+            tasks.append(hedge_task)
+            pending = set(tasks)
+            last_error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge_task:
+                            self.hedge_policy.record_hedge_win()
+                        return task.result()
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def iter_complete_many(self, prompts: Iterable[Union[str, List[Dict[str, Any]]]],
+                                 provider: Optional[str] = "groq", model: Optional[str] = None,
+                                 max_concurrency: Optional[int] = None, timeout: Optional[float] = None,
+                                 fallback: bool = True, **kwargs) -> AsyncIterator[BatchResult]:
+        """
+        Complete many prompts, yielding a BatchResult for each as soon as it finishes
+
+        A fixed pool of workers pulls prompts one at a time, so a batch of thousands never
+        holds more than max_concurrency requests (and the per-provider limits) in flight.
+        """
+        prompts = list(prompts)
+        if not prompts:
+            return
+        primary = self._normalize_provider(provider)
+        limit = max(1, min(max_concurrency or self.max_concurrency.get(primary, 8), len(prompts)))
+        pending = iter(enumerate(prompts))
+        finished = asyncio.Queue()
+        # Worker tasks have no caller frames of their own; attribute their calls to this batch's caller
+        agent = current_agent()
+
+        async def worker():
+            with agent_scope(agent):
+                await drain()
+
+        async def drain():
+            for index, prompt in pending:
+                try:
+                    result = await self.complete(prompt, provider, model, timeout=timeout, fallback=fallback, **kwargs)
+                    finished.put_nowait(BatchResult(index, prompt, result=result))
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    finished.put_nowait(BatchResult(index, prompt, error=e))
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(limit)]
+        try:
+            for _ in range(len(prompts)):
+                yield await finished.get()
+        finally:
+            for task in workers:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def complete_many(self, prompts: Iterable[Union[str, List[Dict[str, Any]]]],
+                            provider: Optional[str] = "groq", model: Optional[str] = None,
+                            max_concurrency: Optional[int] = None, timeout: Optional[float] = None,
+                            fallback: bool = True, on_result: Optional[Callable[[BatchResult], Any]] = None,
+                            **kwargs) -> List[BatchResult]:
+        """
+        Complete many prompts with bounded concurrency
+
+        Args:
+            prompts: Prompt texts or chat message lists
+            max_concurrency: Most prompts in flight at once (defaults to the provider limit)
+            timeout: Per-prompt deadline in seconds
+            on_result: Called with each BatchResult as it finishes, in completion order
+            provider, model, fallback, **kwargs: As for complete()
+
+        Returns:
+            One BatchResult per prompt, in input order; a failed prompt carries its error
+        """
+        prompts = list(prompts)
+        results = [None] * len(prompts)
+        async for item in self.iter_complete_many(prompts, provider, model, max_concurrency, timeout, fallback, **kwargs):
+            results[item.index] = item
+            if on_result is not None:
+                on_result(item)
+        failed = sum(1 for r in results if not r.ok)
+        if failed:
+            self.logger.warning(f"⚠️ Batch finished with {failed}/{len(results)} failed prompts")
+        return results
+
+    def configure_hedging(self, enabled: Optional[bool] = None, percentile: Optional[float] = None,
+                          budget_percent: Optional[float] = None):
+        """Enable/disable hedged requests and tune the latency threshold and traffic budget"""
+        self.hedge_policy.configure(enabled, percentile, budget_percent)
+
+    async def aclose(self):
+        """Close the HTTP client bound to the running loop"""
+        loop = asyncio.get_running_loop()
+        resources = self._resources.pop(loop, None)
+        if resources is not None:
+            await resources.client.aclose()
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get per-provider concurrency limits and counters"""
+        now = time.monotonic()
+        return {
+            'max_concurrency': self.max_concurrency.copy(),
+            'cooldown_seconds': {p: max(0.0, until - now) for p, until in self._cooldown_until.items()},
+            'providers': {p: s.copy() for p, s in self.stats.items()},
+            'single_flight': async_single_flight.get_status(),
+            'hedging': self.hedge_policy.get_status(),
+            'streaming': stream_metrics.get_status(),
+            'telemetry': llm_telemetry.get_status(),
+            'scheduler': request_scheduler.get_status(),
+            'cost_ledger': cost_ledger.get_status(),
+        }
+
+
+# Global instance for easy access
+async_llm_router = AsyncLLMRouter()
+
+
+async def llm_complete_async(prompt, provider="groq", model=None, **kwargs) -> str:
+    """Async counterpart of llm.llm_router.llm_complete"""
+    return await async_llm_router.complete(prompt, provider, model, **kwargs)
+
+
+def llm_stream_async(prompt, provider="groq", model=None, **kwargs) -> AsyncIterator[str]:
+    """Async counterpart of llm.llm_router.llm_stream"""
+    return async_llm_router.stream(prompt, provider, model, **kwargs)
+
+
+def llm_complete_many(prompts, provider="groq", model=None, max_concurrency=None, **kwargs) -> List[BatchResult]:
+    """Blocking batch completion for synchronous callers (not usable inside a running event loop)"""
+    async def run():
+        try:
+            return await async_llm_router.complete_many(prompts, provider, model, max_concurrency, **kwargs)
+        finally:
+            await async_llm_router.aclose()
+    with agent_scope(current_agent()):
+        return asyncio.run(run())
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+🧩 AutoGen Model Client
+A native async ChatCompletionClient on top of the async LLM router, so AssistantAgent gets
+streaming, tool calls, JSON output, cancellation and RequestUsage accounting together with the
+router's failover, scheduling, caching and telemetry
+"""
+
+import os
+import json
+import asyncio
+import logging
+from typing import Dict, Any, Optional, List, Sequence, Mapping, Union, Literal, AsyncGenerator
+
+from autogen_core import CancellationToken, FunctionCall
+from autogen_core.models import (
+    ChatCompletionClient, CreateResult, LLMMessage, ModelFamily, ModelInfo, RequestUsage,
+    SystemMessage, UserMessage, AssistantMessage, FunctionExecutionResultMessage,
+)
+from autogen_core.tools import Tool, ToolSchema
+from pydantic import BaseModel
+
+from llm.async_llm_router import async_llm_router, DEFAULT_MODELS, PROVIDER_ALIASES
+from llm.prompt_compaction import count_tokens
+
+# Context window per model, for remaining_tokens()
+MODEL_CONTEXT_WINDOWS = {
+    'openai/gpt-oss-120b': 131072,
+    'openai/gpt-oss-20b': 131072,
+    'llama-3.3-70b-versatile': 131072,
+    'llama3-70b-8192': 8192,
+    'llama3-8b-8192': 8192,
+    'gemini-1.5-pro': 2097152,
+    'gemini-1.5-flash': 1048576,
+}
+
+# AutoGen only knows these finish reasons
+FINISH_REASONS = {'stop': "stop", 'length': "length", 'tool_calls': "function_calls", 'content_filter': "content_filter"}
+
+
+def _model_family(model: str) -> str:
+    if model.startswith('gemini-1.5-pro'):
+        return ModelFamily.GEMINI_1_5_PRO
+    if model.startswith('gemini-1.5-flash'):
+        return ModelFamily.GEMINI_1_5_FLASH
+    if 'llama-3.3-70b' in model:
+        return ModelFamily.LLAMA_3_3_70B
+    return ModelFamily.UNKNOWN
+
+
+class RouterChatCompletionClient(ChatCompletionClient):
+    """
+    One client can serve every agent: requests go through the process-wide async router (one
+    connection pool per event loop), so there is no per-agent SDK client and no executor thread
+    per call. extra_create_args pass generation parameters (temperature, max_tokens,
+    reasoning_effort, ...) straight to the router.
+    """
+
+    def __init__(self, provider: str = "groq", model: Optional[str] = None, fallback: bool = True,
+                 model_info: Optional[ModelInfo] = None, **create_args):
+        self.provider = PROVIDER_ALIASES.get(provider, provider)
+        self.model = model or DEFAULT_MODELS[self.provider]
+        self.fallback = fallback
+        self.create_args = create_args
+        self._model_info = model_info or {
+            "vision": False,
+            "function_calling": True,
+            "json_output": True,
+            "structured_output": True,
+            "family": _model_family(self.model),
+            "multiple_system_messages": True,
+        }
+        self._actual_usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+        self._total_usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+        self.setup_logging()
+
+    def setup_logging(self):
+        """Setup logging for the AutoGen client"""
+        self.logger = logging.getLogger('RouterChatCompletionClient')
+        if not self.logger.handlers:
+            handler = logging.StreamHandler()
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+
+    @staticmethod
+    def keys_from(apis: Dict[str, Any]) -> Dict[str, str]:
+        """{provider: key} from an agent's apis config, for providers without a key in the environment"""
+        env = {'groq': ("GROQ_API_KEY",), 'google': ("GEMINI_API_KEY", "GOOGLE_API_KEY")}
+        keys = {}
+        for name, variables in env.items():
+            key = (apis.get(name) or {}).get('api_key')
+            if key and not any(os.environ.get(variable) for variable in variables):
+                keys[PROVIDER_ALIASES.get(name, name)] = key
+        return keys
+
+    def configure_keys(self, apis: Dict[str, Any]):
+        """Send API keys from an agent's apis config with this client's requests; the environment is left alone"""
+        keys = self.keys_from(apis)
+        if keys:
+            self.create_args['api_keys'] = {**self.create_args.get('api_keys', {}), **keys}
+
+    # -- conversion -------------------------------------------------------------
+
+    @staticmethod
+    def _text(content: Any) -> str:
+        if isinstance(content, str):
+            return content
+        # Multimodal user content: images are not supported, keep the text parts
+        return "\n".join(part for part in content if isinstance(part, str))
+
+    @classmethod
+    def _to_router_messages(cls, messages: Sequence[LLMMessage]) -> List[Dict[str, Any]]:
+        converted = []
+        for message in messages:
+            if isinstance(message, SystemMessage):
+                converted.append({'role': 'system', 'content': message.content})
+            elif isinstance(message, UserMessage):
+                converted.append({'role': 'user', 'content': cls._text(message.content)})
+            elif isinstance(message, AssistantMessage):
+                if isinstance(message.content, str):
+                    converted.append({'role': 'assistant', 'content': message.content})
+                else:
+                    converted.append({'role': 'assistant', 'content': message.thought or None, 'tool_calls': [
+                        {'id': call.id, 'type': 'function', 'function': {'name': call.name, 'arguments': call.arguments}}
+                        for call in message.content
+                    ]})
+            elif isinstance(message, FunctionExecutionResultMessage):
+                converted.extend(
+                    {'role': 'tool', 'tool_call_id': result.call_id, 'name': result.name, 'content': result.content}
+                    for result in message.content
+                )
+            else:
+                raise ValueError(f"Unsupported message type: {type(message).__name__}")
+        return converted
+
+    @staticmethod
+    def _tool_schemas(tools: Sequence[Union[Tool, ToolSchema]]) -> List[Dict[str, Any]]:
+        schemas = []
+        for tool in tools:
+            schema = dict(tool.schema if isinstance(tool, Tool) else tool)
+            schema.setdefault('parameters', {'type': 'object', 'properties': {}})
+            schemas.append(schema)
+        return schemas
+
+    @staticmethod
+    def _response_format(json_output: Optional[Union[bool, type]]) -> Optional[Dict[str, Any]]:
+        if json_output is None or json_output is False:
+            return None
+        if json_output is True:
+            return {'type': 'json_object'}
+        if isinstance(json_output, type) and issubclass(json_output, BaseModel):
+            return {'type': 'json_schema', 'json_schema': {'name': json_output.__name__, 'schema': json_output.model_json_schema()}}
+        raise ValueError(f"json_output must be a bool or a pydantic model class, got {json_output!r}")
+
+    def _request(self, messages, tools, tool_choice, json_output, extra_create_args) -> Dict[str, Any]:
+        if tool_choice not in ("auto", "required", "none"):
+            tool_choice = {'name': tool_choice.schema['name']}
+        return {
+            'messages': self._to_router_messages(messages),
+            'tools': self._tool_schemas(tools) or None,
+            'tool_choice': tool_choice,
+            'response_format': self._response_format(json_output),
+            'kwargs': {**self.create_args, **dict(extra_create_args)},
+        }
+
+    def _count_usage(self, usage: RequestUsage, cached: bool):
+        # Like AutoGen's own clients: cached answers count towards total but not actual usage
+        if not cached:
+            self._actual_usage = RequestUsage(prompt_tokens=self._actual_usage.prompt_tokens + usage.prompt_tokens,
+                                              completion_tokens=self._actual_usage.completion_tokens + usage.completion_tokens)
+        self._total_usage = RequestUsage(prompt_tokens=self._total_usage.prompt_tokens + usage.prompt_tokens,
+                                         completion_tokens=self._total_usage.completion_tokens + usage.completion_tokens)
+
+    def _result(self, content: str, tool_calls: List[Dict[str, Any]], finish_reason: Optional[str],
+                usage: Optional[Dict[str, int]], cached: bool, reasoning: Optional[str], messages) -> CreateResult:
+        if usage:
+            request_usage = RequestUsage(prompt_tokens=usage.get('prompt_tokens') or 0,
+                                         completion_tokens=usage.get('completion_tokens') or 0)
+        else:
+            # Cached, replayed or provider-silent answers: estimate with the project's tokenizer
+            request_usage = RequestUsage(prompt_tokens=self.count_tokens(messages), completion_tokens=count_tokens(content))
+        self._count_usage(request_usage, cached)
+        if tool_calls:
+            return CreateResult(
+                finish_reason="function_calls",
+                content=[FunctionCall(id=c['id'], name=c['name'], arguments=c['arguments']) for c in tool_calls],
+                usage=request_usage, cached=cached, thought=content or reasoning,
+            )
+        return CreateResult(finish_reason=FINISH_REASONS.get(finish_reason, "stop" if finish_reason is None else "unknown"),
+                            content=content, usage=request_usage, cached=cached, thought=reasoning)
+
+    # -- ChatCompletionClient ---------------------------------------------------
+
+    async def create(self, messages: Sequence[LLMMessage], *, tools: Sequence[Union[Tool, ToolSchema]] = [],
+                     tool_choice: Union[Tool, Literal["auto", "required", "none"]] = "auto",
+                     json_output: Optional[Union[bool, type]] = None, extra_create_args: Mapping[str, Any] = {},
+                     cancellation_token: Optional[CancellationToken] = None) -> CreateResult:
+        request = self._request(messages, tools, tool_choice, json_output, extra_create_args)
+        task = asyncio.ensure_future(async_llm_router.chat(
+            request['messages'], self.provider, self.model, tools=request['tools'], tool_choice=request['tool_choice'],
+            response_format=request['response_format'], fallback=self.fallback, **request['kwargs']))
+        if cancellation_token is not None:
+            cancellation_token.link_future(task)
+        response = await task
+        return self._result(response['content'], response['tool_calls'], response['finish_reason'],
+                            response['usage'], response['cached'], response['reasoning'], messages)
+
+    async def create_stream(self, messages: Sequence[LLMMessage], *, tools: Sequence[Union[Tool, ToolSchema]] = [],
+                            tool_choice: Union[Tool, Literal["auto", "required", "none"]] = "auto",
+                            json_output: Optional[Union[bool, type]] = None, extra_create_args: Mapping[str, Any] = {},
+                            cancellation_token: Optional[CancellationToken] = None
+                            ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        """
+        Text turns stream token by token. Turns offering tools or asking for JSON are answered
+        in one request and yield only the final CreateResult, which AutoGen's streaming
+        protocol allows, so tool calls never arrive split across chunks.
+        """
+        if tools or json_output:
+            yield await self.create(messages, tools=tools, tool_choice=tool_choice, json_output=json_output,
+                                    extra_create_args=extra_create_args, cancellation_token=cancellation_token)
+            return
+        request = self._request(messages, tools, tool_choice, json_output, extra_create_args)
+        task = asyncio.current_task()
+        streaming = {'active': True}
+        if cancellation_token is not None:
+            # Cancel the consuming task (and with it the provider stream) while the stream is open
+            cancellation_token.add_callback(lambda: streaming['active'] and task.cancel())
+        meta = {}
+        parts = []
+        tokens = async_llm_router.stream(request['messages'], self.provider, self.model, fallback=self.fallback,
+                                         meta=meta, **request['kwargs'])
+        try:
+            async for token in tokens:
+                parts.append(token)
+                yield token
+        finally:
+            streaming['active'] = False
+            await tokens.aclose()
+        yield self._result("".join(parts), [], meta.get('finish_reason'), meta.get('usage'),
+                           False, None, messages)
+
+    async def close(self) -> None:
+        """Release the router's HTTP client for the running event loop (recreated on next use)"""
+        await async_llm_router.aclose()
+
+    def actual_usage(self) -> RequestUsage:
+        return self._actual_usage
+
+    def total_usage(self) -> RequestUsage:
+        return self._total_usage
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Union[Tool, ToolSchema]] = []) -> int:
+        text = json.dumps(self._to_router_messages(messages))
+        if tools:
+            text += json.dumps(self._tool_schemas(tools))
+        return count_tokens(text)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Union[Tool, ToolSchema]] = []) -> int:
+        window = MODEL_CONTEXT_WINDOWS.get(self.model, 8192)
+        return window - self.count_tokens(messages, tools=tools)
+
+    @property
+    def capabilities(self) -> ModelInfo:
+        return self._model_info
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return self._model_info
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get the client's provider, model and token usage"""
+        return {
+            'provider': self.provider,
+            'model': self.model,
+            'fallback': self.fallback,
+            'prompt_tokens': self._total_usage.prompt_tokens,
+            'completion_tokens': self._total_usage.completion_tokens,
+        }
+
+
+def model_client_for(apis: Optional[Dict[str, Any]] = None) -> RouterChatCompletionClient:
+    """
+    The client for an agent: the shared one, or, when the agent's config brings API keys the
+    environment lacks, a client of its own that sends them with each request
+    """
+    keys = RouterChatCompletionClient.keys_from(apis) if apis else {}
+    if not keys:
+        return router_model_client
+    return RouterChatCompletionClient(api_keys=keys)
+
+
+# Global instance for easy access
+router_model_client = RouterChatCompletionClient()
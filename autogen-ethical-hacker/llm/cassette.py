@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+📼 LLM Record/Replay Cassettes
+Records provider request/response pairs (with streamed chunk timing) to a JSONL cassette and
+replays them offline, deterministically, with optional simulated latency
+"""
+
+import os
+import json
+import time
+import asyncio
+import threading
+import logging
+from pathlib import Path
+from typing import Dict, Any, Optional, Callable, Iterator, AsyncIterator, List
+
+from llm.response_cache import PROJECT_ROOT, make_cache_key
+
+DEFAULT_CASSETTE_PATH = PROJECT_ROOT / "cassettes" / "llm_cassette.jsonl"
+MODES = ('off', 'record', 'replay')
+
+
+class CassetteMiss(LookupError):
+    """Raised in replay mode when the cassette has no recording for a request"""
+
+
+class LLMCassette:
+    """
+    Mode comes from LLM_CASSETTE_MODE (off/record/replay) and the file from LLM_CASSETTE_PATH.
+    LLM_CASSETTE_LATENCY scales recorded timing on replay: 0 replays instantly, 1 in real time.
+    """
+
+    def __init__(self, mode: Optional[str] = None, path: Optional[str] = None, latency_scale: Optional[float] = None):
+        self._lock = threading.Lock()
+        self._entries = None
+        self._served = {}
+        self.stats = {'recorded': 0, 'replayed': 0, 'misses': 0}
+        self.mode = 'off'
+        self.path = Path(DEFAULT_CASSETTE_PATH)
+        self.latency_scale = 0.0
+        self.setup_logging()
+        self.configure(
+            mode if mode is not None else os.environ.get("LLM_CASSETTE_MODE", "off"),
+            path or os.environ.get("LLM_CASSETTE_PATH", str(DEFAULT_CASSETTE_PATH)),
+            latency_scale if latency_scale is not None else float(os.environ.get("LLM_CASSETTE_LATENCY", 0))
+        )
+
+    def setup_logging(self):
+        """Setup logging for cassette operations"""
+        self.logger = logging.getLogger('LLMCassette')
+        if not self.logger.handlers:
+            handler = logging.StreamHandler()
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+
+    def configure(self, mode: Optional[str] = None, path: Optional[str] = None, latency_scale: Optional[float] = None):
+        """Switch mode, cassette file or replay latency at runtime"""
+        with self._lock:
+            if mode is not None:
+                mode = mode.lower()
+                if mode not in MODES:
+                    raise ValueError(f"Unknown cassette mode: {mode} (expected one of {', '.join(MODES)})")
+                self.mode = mode
+            if path is not None and Path(path) != self.path:
+                self.path = Path(path)
+                self._entries = None
+                self._served = {}
+            if latency_scale is not None:
+                self.latency_scale = float(latency_scale)
+        if self.mode != 'off':
+            self.logger.info(f"📼 Cassette {self.mode} mode: {self.path}")
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == 'record'
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == 'replay'
+
+    # -- storage ------------------------------------------------------------
+
+    def _load(self) -> Dict[str, List[Dict[str, Any]]]:
+        if self._entries is None:
+            self._entries = {}
+            if self.path.exists():
+                with open(self.path, 'r') as f:
+                    for line in f:
+                        if line.strip():
+                            entry = json.loads(line)
+                            self._entries.setdefault(entry['key'], []).append(entry)
+        return self._entries
+
+    def _lookup(self, key: str, provider: str, model: Optional[str]) -> Dict[str, Any]:
+        """Recordings of the same request are served in recorded order; the last one repeats"""
+        with self._lock:
+            entries = self._load().get(key)
+            if not entries:
+                self.stats['misses'] += 1
+                raise CassetteMiss(f"No cassette recording for {provider}/{model} request {key[:12]} in {self.path}")
+            index = self._served.get(key, 0)
+            self._served[key] = index + 1
+            self.stats['replayed'] += 1
+            return entries[min(index, len(entries) - 1)]
+
+    def _save(self, key: str, provider: str, model: Optional[str], prompt: str,
+              response: str, chunks: Optional[List[List[Any]]], duration: float,
+              meta: Optional[Dict[str, Any]] = None):
+        entry = {
+            'key': key, 'provider': provider, 'model': model, 'prompt': prompt,
+            'response': response, 'chunks': chunks, 'duration': round(duration, 4),
+            'finish_reason': (meta or {}).get('finish_reason'),
+            'usage': (meta or {}).get('usage'),
+            'recorded_at': time.time(),
+        }
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry) + "\n")
+            self._load().setdefault(key, []).append(entry)
+            self.stats['recorded'] += 1
+
+    def has_recording(self, provider: str, model: Optional[str], prompt: str, params: Optional[Dict[str, Any]] = None) -> bool:
+        """Whether the cassette holds a recording for this request"""
+        with self._lock:
+            return make_cache_key(provider, model, prompt, params) in self._load()
+
+    # -- sync ---------------------------------------------------------------
+
+    @staticmethod
+    def _restore_meta(entry: Dict[str, Any], meta: Optional[Dict[str, Any]]):
+        if meta is not None:
+            meta['finish_reason'] = entry.get('finish_reason')
+            if entry.get('usage'):
+                meta['usage'] = entry['usage']
+
+    def complete(self, provider: str, model: Optional[str], prompt: str, params: Optional[Dict[str, Any]],
+                 call: Callable[[], str], meta: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Run `call` for a completion, or serve/record it depending on the mode. `meta` is the
+        dict `call` fills with response metadata (finish_reason); it is recorded and replayed too.
+        """
+        if self.mode == 'off':
+            return call()
+        key = make_cache_key(provider, model, prompt, params)
+        if self.replaying:
+            entry = self._lookup(key, provider, model)
+            self._restore_meta(entry, meta)
+            if self.latency_scale:
+                time.sleep(entry['duration'] * self.latency_scale)
+            return entry['response']
+        start_time = time.monotonic()
+        result = call()
+        self._save(key, provider, model, prompt, result, None, time.monotonic() - start_time, meta)
+        return result
+
+    def stream(self, provider: str, model: Optional[str], prompt: str, params: Optional[Dict[str, Any]],
+               open_stream: Callable[[], Iterator[str]], meta: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+        """Wrap a token stream; chunk offsets are recorded so replay keeps TTFT and pacing"""
+        if self.mode == 'off':
+            yield from open_stream()
+            return
+        key = make_cache_key(provider, model, prompt, params)
+        if self.replaying:
+            entry = self._lookup(key, provider, model)
+            self._restore_meta(entry, meta)
+            elapsed = 0.0
+            for offset, text in entry['chunks'] or [[entry['duration'], entry['response']]]:
+                if self.latency_scale:
+                    time.sleep(max(0.0, offset - elapsed) * self.latency_scale)
+                elapsed = offset
+                yield text
+            return
+        start_time = time.monotonic()
+        chunks = []
+        tokens = open_stream()
+        failed = False
+        try:
+            for text in tokens:
+                chunks.append([round(time.monotonic() - start_time, 4), text])
+                yield text
+        except Exception:
+            failed = True
+            raise
+        finally:
+            tokens.close()
+            # Streams closed early (a parser had enough) are recorded as consumed, which is what replay needs
+            if not failed:
+                self._save(key, provider, model, prompt, "".join(t for _, t in chunks), chunks,
+                           time.monotonic() - start_time, meta)
+
+    # -- async --------------------------------------------------------------
+
+    async def acomplete(self, provider: str, model: Optional[str], prompt: str, params: Optional[Dict[str, Any]],
+                        call: Callable[[], Any], meta: Optional[Dict[str, Any]] = None) -> Any:
+        """Async counterpart of complete(); `call` returns an awaitable"""
+        if self.mode == 'off':
+            return await call()
+        key = make_cache_key(provider, model, prompt, params)
+        if self.replaying:
+            entry = self._lookup(key, provider, model)
+            self._restore_meta(entry, meta)
+            if self.latency_scale:
+                await asyncio.sleep(entry['duration'] * self.latency_scale)
+            return entry['response']
+        start_time = time.monotonic()
+        result = await call()
+        self._save(key, provider, model, prompt, result, None, time.monotonic() - start_time, meta)
+        return result
+
+    async def astream(self, provider: str, model: Optional[str], prompt: str, params: Optional[Dict[str, Any]],
+                      open_stream: Callable[[], AsyncIterator[str]],
+                      meta: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """Async counterpart of stream(); `meta` (finish_reason, usage) is recorded and replayed too"""
+        if self.mode == 'off':
+            async for text in open_stream():
+                yield text
+            return
+        key = make_cache_key(provider, model, prompt, params)
+        if self.replaying:
+            entry = self._lookup(key, provider, model)
+            self._restore_meta(entry, meta)
+            elapsed = 0.0
+            for offset, text in entry['chunks'] or [[entry['duration'], entry['response']]]:
+                if self.latency_scale:
+                    await asyncio.sleep(max(0.0, offset - elapsed) * self.latency_scale)
+                elapsed = offset
+                yield text
+            return
+        start_time = time.monotonic()
+        chunks = []
+        tokens = open_stream()
+        failed = False
+        try:
+            async for text in tokens:
+                chunks.append([round(time.monotonic() - start_time, 4), text])
+                yield text
+        except Exception:
+            failed = True
+            raise
+        finally:
+            await tokens.aclose()
+            if not failed:
+                self._save(key, provider, model, prompt, "".join(t for _, t in chunks), chunks,
+                           time.monotonic() - start_time, meta)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get cassette mode, file and counters"""
+        with self._lock:
+            return {'mode': self.mode, 'path': str(self.path), 'latency_scale': self.latency_scale, **self.stats}
+
+
+# Global instance for easy access
+llm_cassette = LLMCassette()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+🔌 Pooled LLM Client Registry
+Keeps one keep-alive client per provider and API key so TLS handshakes and client construction leave the request path
+"""
+
+import hashlib
+import threading
+import logging
+from typing import Dict, Any, Optional
+
+
+def key_fingerprint(api_key: Optional[str]) -> str:
+    """Short, non-reversible label for an API key (safe to log and report)"""
+    if not api_key:
+        return "none"
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+
+class LLMClientRegistry:
+    """
+    Process-wide registry of pooled Groq clients, Gemini models and HTTP sessions
+    """
+
+    def __init__(self, max_connections: int = 100, max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 60.0, timeout: float = 120.0):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+
+        self._lock = threading.RLock()
+        self._groq_clients = {}
+        self._genai_clients = {}
+        self._genai_models = {}
+        self._sessions = {}
+
+        # Per (provider, key fingerprint) counters
+        self.stats = {}
+
+        self.setup_logging()
+
+    def setup_logging(self):
+        """Setup logging for client pool operations"""
+        self.logger = logging.getLogger('LLMClientRegistry')
+        if not self.logger.handlers:
+            handler = logging.StreamHandler()
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+
+    def _stat(self, provider: str, api_key: Optional[str]) -> Dict[str, int]:
+        label = f"{provider}:{key_fingerprint(api_key)}"
+        if label not in self.stats:
+            self.stats[label] = {'clients_created': 0, 'checkouts': 0, 'http_requests': 0}
+        return self.stats[label]
+
+    def get_groq_client(self, api_key: Optional[str]):
+        """Return the shared Groq client for this key, creating it on first use"""
+        with self._lock:
+            stat = self._stat('groq', api_key)
+            stat['checkouts'] += 1
+            client = self._groq_clients.get(api_key)
+            if client is not None:
+                return client
+
+            import groq
+            import httpx
+
+            def count_request(request):
+                stat['http_requests'] += 1
+
+            http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                timeout=self.timeout,
+                event_hooks={'request': [count_request]},
+            )
+            client = groq.Groq(api_key=api_key, http_client=http_client)
+            self._groq_clients[api_key] = client
+            stat['clients_created'] += 1
+            self.logger.info(f"🔌 Created pooled Groq client for key {key_fingerprint(api_key)}")
+            return client
+
+    def get_genai_model(self, api_key: Optional[str], model_name: str):
+        """
+        Return a shared Gemini model bound to this key. Each key gets its own service client instead
+        of genai.configure(), whose process-global key would race between threads using different keys.
+        """
+        with self._lock:
+            import google.generativeai as genai
+            import google.ai.generativelanguage as glm
+
+            stat = self._stat('google', api_key)
+            stat['checkouts'] += 1
+            model = self._genai_models.get((api_key, model_name))
+            if model is None:
+                client = self._genai_clients.get(api_key)
+                if client is None:
+                    client = glm.GenerativeServiceClient(client_options={'api_key': api_key})
+                    self._genai_clients[api_key] = client
+                model = genai.GenerativeModel(model_name)
+                # Bound explicitly, so the model never falls back to the global default client
+                model._client = client
+                self._genai_models[(api_key, model_name)] = model
+                stat['clients_created'] += 1
+                self.logger.info(f"🔌 Created Gemini model {model_name} for key {key_fingerprint(api_key)}")
+            return model
+
+    def get_http_session(self, provider: str):
+        """Return a keep-alive requests.Session dedicated to one provider's endpoints"""
+        with self._lock:
+            session = self._sessions.get(provider)
+            if session is not None:
+                return session
+
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_keepalive_connections)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self._sessions[provider] = session
+            self.logger.info(f"🔌 Created keep-alive HTTP session for {provider}")
+            return session
+
+    def _session_pool_stats(self, session) -> Dict[str, Any]:
+        """Connections opened vs. requests sent per host; requests > connections means reuse"""
+        pools = {}
+        adapter = session.get_adapter("https://")
+        manager = getattr(adapter, "poolmanager", None)
+        if manager is None:
+            return pools
+        for pool_key in list(manager.pools.keys()):
+            pool = manager.pools.get(pool_key)
+            if pool is None:
+                continue
+            pools[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                'connections_opened': pool.num_connections,
+                'requests': pool.num_requests,
+            }
+        return pools
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get pool statistics so connection reuse can be confirmed"""
+        with self._lock:
+            return {
+                'groq_clients': len(self._groq_clients),
+                'genai_clients': len(self._genai_clients),
+                'genai_models': len(self._genai_models),
+                'http_sessions': {
+                    provider: self._session_pool_stats(session)
+                    for provider, session in self._sessions.items()
+                },
+                'clients': {label: stat.copy() for label, stat in self.stats.items()},
+            }
+
+    def close(self):
+        """Close all pooled connections"""
+        with self._lock:
+            for client in self._groq_clients.values():
+                try:
+                    client.close()
+                except Exception:
+                    pass
+            for session in self._sessions.values():
+                session.close()
+            self._groq_clients.clear()
+            self._genai_clients.clear()
+            self._genai_models.clear()
+            self._sessions.clear()
+
+
+# Global instance for easy access
+client_registry = LLMClientRegistry()
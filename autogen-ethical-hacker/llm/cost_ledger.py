@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+💰 Per-Engagement LLM Cost Ledger
+Persistent token and cost totals per engagement, agent and model (fed by telemetry), with
+soft and hard budgets: past the soft budget requests move to cheaper models, tighter prompts
+and (if it is enabled) a more lenient semantic cache; past the hard budget paid providers are
+refused, so answers come from the caches or the local model instead of the run failing mid-way
+"""
+
+import os
+import json
+import time
+import threading
+import logging
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from llm.response_cache import PROJECT_ROOT
+from llm.shared_state import shared_state
+from llm.telemetry import llm_telemetry
+from llm.prompt_compaction import prompt_compactor
+from llm.semantic_cache import semantic_cache
+from llm.request_scheduler import request_scheduler
+
+DEFAULT_CONFIG_PATH = PROJECT_ROOT / "config" / "lab_scope.json"
+
+NAMESPACE = 'cost_ledger'
+
+# Budget levels, in order of severity
+LEVELS = ('ok', 'soft', 'hard')
+
+# The cheaper model requests move to once an engagement is past its soft budget
+DOWNGRADE_MODELS = {
+    'openai/gpt-oss-120b': 'openai/gpt-oss-20b',
+    'gemini-1.5-pro': 'gemini-1.5-flash',
+    'llama3-70b-8192': 'llama3-8b-8192',
+    'llama-3.3-70b-versatile': 'llama-3.1-8b-instant',
+}
+
+# Share of the normal prompt token budget left to the compactor at each level
+DEFAULT_PROMPT_SCALE = {'soft': 0.5, 'hard': 0.25}
+
+# Semantic cache threshold while over budget: a close-enough earlier answer beats a paid call
+DEFAULT_CACHE_THRESHOLD = 0.85
+
+# Totals written by other processes are picked up at least this often
+REFRESH_INTERVAL = 5.0
+
+
+def format_usd(value: float) -> str:
+    """Dollars with enough decimals for small budgets: $25.00, $0.0042"""
+    return f"${value:.2f}" if value == 0 or abs(value) >= 1 else f"${value:.4f}"
+
+
+class BudgetExceededError(RuntimeError):
+    """A paid LLM call was refused because the engagement is past its hard budget"""
+
+
+def _empty_totals() -> Dict[str, Any]:
+    return {'prompt_tokens': 0, 'completion_tokens': 0, 'cost_usd': 0.0, 'calls': 0, 'cached_calls': 0,
+            'by_agent': {}, 'by_model': {}, 'started_at': time.time()}
+
+
+def _add(bucket: Dict[str, Any], prompt_tokens: int, completion_tokens: int, cost: float, cached: bool):
+    bucket['prompt_tokens'] = bucket.get('prompt_tokens', 0) + prompt_tokens
+    bucket['completion_tokens'] = bucket.get('completion_tokens', 0) + completion_tokens
+    bucket['cost_usd'] = round(bucket.get('cost_usd', 0.0) + cost, 8)
+    bucket['calls'] = bucket.get('calls', 0) + 1
+    if cached:
+        bucket['cached_calls'] = bucket.get('cached_calls', 0) + 1
+
+
+class CostLedger:
+    """
+    Budgets come from the "llm_budget" section of the engagement config (config/lab_scope.json,
+    or the file named by LLM_BUDGET_CONFIG), e.g.
+        {"soft_usd": 20.0, "hard_usd": 25.0, "hard_tokens": 5000000,
+         "engagements": {"acme-internal": {"hard_usd": 50.0}}}
+    LLM_ENGAGEMENT names the engagement being billed; LLM_BUDGET_SOFT_USD and
+    LLM_BUDGET_HARD_USD override the configured limits.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, config_path: Optional[str] = None,
+                 shared=None):
+        self.shared = shared or shared_state
+        self._lock = threading.Lock()
+        self.config = {}
+        self.source = None
+        self.engagement = 'default'
+        self.budget = {}
+        self.level_name = 'ok'
+        self.stats = {'recorded': 0, 'refused': 0, 'downgraded': 0, 'transitions': 0}
+
+        self._totals = _empty_totals()
+        self._local = {}
+        self._refreshed_at = 0.0
+        # Settings changed while over budget, restored when the engagement is back under it
+        self._saved = None
+
+        self.setup_logging()
+        if config is None:
+            config = self._read(config_path or os.environ.get("LLM_BUDGET_CONFIG", str(DEFAULT_CONFIG_PATH)))
+        self.configure(config)
+
+    def setup_logging(self):
+        """Setup logging for the cost ledger"""
+        self.logger = logging.getLogger('CostLedger')
+        if not self.logger.handlers:
+            handler = logging.StreamHandler()
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+
+    def _read(self, path: str) -> Dict[str, Any]:
+        """The "llm_budget" section of an engagement config; a missing file means no budget"""
+        path = Path(path)
+        if not path.exists():
+            return {}
+        try:
+            with open(path, 'r') as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"⚠️ Could not read LLM budget from {path}: {e}")
+            return {}
+        section = config.get('llm_budget', {})
+        if section:
+            self.source = str(path)
+        return section
+
+    def configure(self, config: Dict[str, Any]):
+        """Replace the budget configuration and re-resolve the current engagement's limits"""
+        with self._lock:
+            self.config = dict(config)
+        self.start_engagement(os.environ.get("LLM_ENGAGEMENT") or config.get('engagement') or 'default')
+
+    def start_engagement(self, name: str, soft_usd: Optional[float] = None, hard_usd: Optional[float] = None):
+        """Bill subsequent calls to engagement `name`; explicit limits override the configured ones"""
+        budget = {k: self.config.get(k) for k in ('soft_usd', 'hard_usd', 'soft_tokens', 'hard_tokens')}
+        budget.update({k: v for k, v in self.config.get('engagements', {}).get(name, {}).items() if k in budget})
+        for key, env in (('soft_usd', 'LLM_BUDGET_SOFT_USD'), ('hard_usd', 'LLM_BUDGET_HARD_USD')):
+            if os.environ.get(env):
+                budget[key] = float(os.environ[env])
+        if soft_usd is not None:
+            budget['soft_usd'] = soft_usd
+        if hard_usd is not None:
+            budget['hard_usd'] = hard_usd
+        with self._lock:
+            self.engagement = name
+            self.budget = {k: v for k, v in budget.items() if v is not None}
+            self._totals = self._load(name)
+            self._refreshed_at = time.monotonic()
+        self._update_level()
+
+    # -- accounting -------------------------------------------------------------
+
+    def _load(self, name: str) -> Dict[str, Any]:
+        if self.shared.enabled:
+            return self.shared.get(NAMESPACE, name) or _empty_totals()
+        return self._local.setdefault(name, _empty_totals())
+
+    def record_call(self, record: Dict[str, Any]):
+        """Telemetry listener: add one finished call to the current engagement's totals"""
+        if record.get('error') and not record.get('responded'):
+            # Failed before any response (connection error, missing key, refused by the budget)
+            return
+        prompt_tokens = record.get('prompt_tokens') or 0
+        completion_tokens = record.get('completion_tokens') or 0
+        cost = record.get('cost_usd') or 0.0
+        cached = bool(record.get('cache_hit'))
+        if not (prompt_tokens or completion_tokens or cost or cached):
+            # Nothing was sent or served
+            return
+        agent = record.get('agent') or 'unknown'
+        model = record.get('model') or 'unknown'
+
+        def apply(totals):
+            totals = totals or _empty_totals()
+            _add(totals, prompt_tokens, completion_tokens, cost, cached)
+            _add(totals['by_agent'].setdefault(agent, {}), prompt_tokens, completion_tokens, cost, cached)
+            _add(totals['by_model'].setdefault(model, {}), prompt_tokens, completion_tokens, cost, cached)
+            totals['updated_at'] = time.time()
+            return totals
+
+        with self._lock:
+            name = self.engagement
+            if self.shared.enabled:
+                totals = self.shared.update(NAMESPACE, name, apply)
+            else:
+                totals = self._local[name] = apply(self._local.get(name))
+            self._totals = totals
+            self._refreshed_at = time.monotonic()
+            self.stats['recorded'] += 1
+        self._update_level()
+
+    def totals(self) -> Dict[str, Any]:
+        """The current engagement's totals, re-read from shared state when they may be stale"""
+        with self._lock:
+            if self.shared.enabled and time.monotonic() - self._refreshed_at > REFRESH_INTERVAL:
+                self._totals = self.shared.get(NAMESPACE, self.engagement) or self._totals
+                self._refreshed_at = time.monotonic()
+            return self._totals
+
+    # -- budget levels ----------------------------------------------------------
+
+    def _level_for(self, totals: Dict[str, Any]) -> str:
+        spent = totals.get('cost_usd', 0.0)
+        tokens = totals.get('prompt_tokens', 0) + totals.get('completion_tokens', 0)
+        for level in ('hard', 'soft'):
+            usd = self.budget.get(f'{level}_usd')
+            token_limit = self.budget.get(f'{level}_tokens')
+            if (usd is not None and spent >= usd) or (token_limit is not None and tokens >= token_limit):
+                return level
+        return 'ok'
+
+    def _update_level(self):
+        level = self._level_for(self.totals())
+        with self._lock:
+            previous, self.level_name = self.level_name, level
+        if level != previous:
+            self.stats['transitions'] += 1
+            self._apply(level, previous)
+
+    def level(self) -> str:
+        """'ok', 'soft' or 'hard' for the current engagement"""
+        self._update_level()
+        return self.level_name
+
+    def _apply(self, level: str, previous: str):
+        """Tighten prompts and relax an enabled semantic cache while over budget; undo both once back under"""
+        if level == 'ok':
+            if self._saved is not None:
+                prompt_compactor.token_budget = self._saved['token_budget']
+                semantic_cache.configure(threshold=self._saved['cache_threshold'])
+                self._saved = None
+            self.logger.info(f"💰 Engagement {self.engagement} is back under its LLM budget")
+            return
+        if self._saved is None:
+            self._saved = {'token_budget': prompt_compactor.token_budget, 'cache_threshold': semantic_cache.threshold}
+        scale = {**DEFAULT_PROMPT_SCALE, **self.config.get('prompt_scale', {})}[level]
+        prompt_compactor.token_budget = max(256, int(self._saved['token_budget'] * scale))
+        if semantic_cache.enabled:
+            # The cache stays opt-in: it is only made more lenient where the user turned it on
+            threshold = min(self._saved['cache_threshold'], float(self.config.get('cache_threshold', DEFAULT_CACHE_THRESHOLD)))
+            semantic_cache.configure(threshold=threshold)
+        spent = self._totals.get('cost_usd', 0.0)
+        if level == 'hard':
+            self.logger.warning(f"🛑 Engagement {self.engagement} reached its hard LLM budget ({format_usd(spent)}): "
+                                f"paid providers are refused, answers come from caches or the local model")
+        else:
+            self.logger.warning(f"⚠️ Engagement {self.engagement} passed its soft LLM budget ({format_usd(spent)}): "
+                                f"switching to cheaper models and compacted prompts")
+
+    def tier_steps(self) -> int:
+        """How many model tiers below the usual one tasks start at"""
+        return LEVELS.index(self.level())
+
+    def model_for(self, provider: str, model: Optional[str]) -> Optional[str]:
+        """The model to request: the cheaper sibling of `model` while the engagement is over its soft budget"""
+        if model is None or self.level() == 'ok':
+            return model
+        downgrades = {**DOWNGRADE_MODELS, **self.config.get('downgrade', {})}
+        cheaper = downgrades.get(model)
+        if cheaper is None:
+            return model
+        self.stats['downgraded'] += 1
+        return cheaper
+
+    def admit(self, provider: str):
+        """Scheduler admission check: refuse paid providers once the hard budget is reached"""
+        if provider == 'local' or self.level() != 'hard':
+            return
+        self.stats['refused'] += 1
+        raise BudgetExceededError(
+            f"Engagement {self.engagement} reached its hard LLM budget "
+            f"({format_usd(self._totals.get('cost_usd', 0.0))} of {format_usd(self.budget.get('hard_usd') or 0.0)})"
+        )
+
+    # -- reporting --------------------------------------------------------------
+
+    def report(self, engagement: Optional[str] = None) -> Dict[str, Any]:
+        """Totals for an engagement (the current one by default), broken down by agent and model"""
+        if engagement is None or engagement == self.engagement:
+            totals = self.totals()
+        elif self.shared.enabled:
+            totals = self.shared.get(NAMESPACE, engagement) or _empty_totals()
+        else:
+            totals = self._local.get(engagement, _empty_totals())
+        return {'engagement': engagement or self.engagement, **totals}
+
+    def engagements(self) -> Dict[str, Dict[str, Any]]:
+        """Totals of every engagement recorded"""
+        if self.shared.enabled:
+            return self.shared.items(NAMESPACE)
+        return dict(self._local)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Spend against budget for the current engagement"""
+        totals = self.totals()
+        hard = self.budget.get('hard_usd')
+        return {
+            'engagement': self.engagement,
+            'level': self.level(),
+            'budget': dict(self.budget),
+            'source': self.source,
+            'spent_usd': round(totals.get('cost_usd', 0.0), 4),
+            'remaining_usd': round(max(0.0, hard - totals.get('cost_usd', 0.0)), 4) if hard is not None else None,
+            'tokens': totals.get('prompt_tokens', 0) + totals.get('completion_tokens', 0),
+            'calls': totals.get('calls', 0),
+            'cached_calls': totals.get('cached_calls', 0),
+            'prompt_token_budget': prompt_compactor.token_budget,
+            **self.stats,
+        }
+
+
+# Global instance for easy access
+cost_ledger = CostLedger()
+llm_telemetry.add_listener(cost_ledger.record_call)
+request_scheduler.add_admission_check(cost_ledger.admit)
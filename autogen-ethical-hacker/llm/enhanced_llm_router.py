@@ -8,9 +8,28 @@ import os
 import time
 import json
 import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from typing import Dict, Any, Optional, List
 from datetime import datetime, timedelta
 
+from llm.response_cache import response_cache, make_cache_key
+from llm.semantic_cache import semantic_cache
+from llm.client_pool import client_registry
+from llm.single_flight import single_flight
+from llm.hedging import HedgePolicy
+from llm.stream_metrics import stream_metrics
+from llm.prompt_compaction import prompt_compactor
+from llm.provider_scoreboard import ProviderScoreboard, CircuitOpenError
+from llm.cassette import llm_cassette
+from llm.shared_state import shared_state
+from llm.telemetry import llm_telemetry
+from llm.model_tiering import model_tiering
+from llm.output_budget import output_budget, normalize_finish_reason
+from llm.local_backend import local_backend
+from llm.request_scheduler import request_scheduler, current_priority, priority_scope
+from llm.cost_ledger import cost_ledger, BudgetExceededError
+
 class EnhancedLLMRouter:
     """
     Self-healing LLM router with automatic failover and recovery
@@ -29,14 +48,28 @@ class EnhancedLLMRouter:
         # Circuit breaker settings
         self.circuit_breaker = {
             'failure_threshold': 3,  # Failures before marking unhealthy
-            'recovery_timeout': 300,  # Seconds before attempting recovery
+            'recovery_timeout': 60,  # Seconds open before a half-open probe (doubles after a failed probe)
+            'max_recovery_timeout': 600,
             'max_retries': 3
         }
         
+        # Latency/error-rate scores and per-provider circuits used for routing; circuits live in
+        # the host-wide shared state so every worker (and the next start) sees a tripped provider
+        self.scoreboard = ProviderScoreboard(
+            failure_threshold=self.circuit_breaker['failure_threshold'],
+            recovery_timeout=self.circuit_breaker['recovery_timeout'],
+            max_recovery_timeout=self.circuit_breaker['max_recovery_timeout'],
+            shared=shared_state
+        )
+        
         # Health check settings
         self.health_check_interval = 600  # 10 minutes
         self.last_health_check = None
         
+        # Hedged requests (opt-in via LLM_HEDGING=1 or configure_hedging)
+        self.hedge_policy = HedgePolicy()
+        self._hedge_pool = None
+        
         self.setup_logging()
     
     def setup_logging(self):
@@ -49,143 +82,305 @@ class EnhancedLLMRouter:
             self.logger.addHandler(handler)
             self.logger.setLevel(logging.INFO)
     
-    def _call_groq_api(self, prompt: str, **kwargs) -> str:
-        """Call Groq API with error handling"""
+    def _call_groq_api(self, prompt: str, meta: Optional[Dict[str, Any]] = None, **kwargs) -> str:
+        """Call Groq API with error handling; the finish reason goes into meta when given"""
         try:
-            import groq
-            
-            if not self.groq_api_key:
+            if not self.groq_api_key and not llm_cassette.replaying:
                 raise Exception("GROQ_API_KEY not found in environment")
             
-            client = groq.Groq(api_key=self.groq_api_key)
-            
             # Use the specified model or default
-            model = kwargs.get("model", "openai/gpt-oss-120b")
-            max_tokens = kwargs.get("max_tokens", 1024)
-            temperature = kwargs.get("temperature", 0.7)
+            model, params, max_tokens = self._request_params('groq', kwargs)
+            start_time = time.time()
             
-            completion = client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=max_tokens,
-                temperature=temperature
-            )
+            def call():
+                client = client_registry.get_groq_client(self.groq_api_key)
+                completion = client.chat.completions.create(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=max_tokens,
+                    temperature=params["temperature"]
+                )
+                meta['finish_reason'] = normalize_finish_reason(completion.choices[0].finish_reason)
+                if completion.usage is not None:
+                    meta['usage'] = {'prompt_tokens': completion.usage.prompt_tokens,
+                                     'completion_tokens': completion.usage.completion_tokens}
+                return completion.choices[0].message.content
             
-            result = completion.choices[0].message.content
-            self._record_success('groq')
+            meta = {} if meta is None else meta
+            result = llm_cassette.complete('groq', model, prompt, params, call, meta)
+            llm_telemetry.note_usage(**meta.get('usage', {}))
+            self._record_success('groq', kwargs.get("model", "openai/gpt-oss-120b"), time.time() - start_time)
             return result
             
         except Exception as e:
-            self._record_failure('groq', str(e))
+            self._record_failure('groq', str(e), kwargs.get("model", "openai/gpt-oss-120b"), self._is_rate_limit(e))
             raise e
     
-    def _call_google_api(self, prompt: str, **kwargs) -> str:
-        """Call Google Gemini API with error handling"""
+    def _call_google_api(self, prompt: str, meta: Optional[Dict[str, Any]] = None, **kwargs) -> str:
+        """Call Google Gemini API with error handling; the finish reason goes into meta when given"""
         try:
-            import google.generativeai as genai
-            
-            if not self.google_api_key:
+            if not self.google_api_key and not llm_cassette.replaying:
                 raise Exception("GOOGLE_API_KEY not found in environment")
             
-            genai.configure(api_key=self.google_api_key)
-            
             # Use the specified model or default
-            model_name = kwargs.get("model", "gemini-1.5-pro")
-            model = genai.GenerativeModel(model_name)
+            model_name, params, max_tokens = self._request_params('google', kwargs)
             
             # Configure generation parameters
             generation_config = {
-                "temperature": kwargs.get("temperature", 0.7),
-                "max_output_tokens": kwargs.get("max_tokens", 1024),
+                "temperature": params["temperature"],
+                "max_output_tokens": max_tokens,
             }
             
-            response = model.generate_content(
-                prompt,
-                generation_config=generation_config
-            )
+            start_time = time.time()
+            
+            def call():
+                model = client_registry.get_genai_model(self.google_api_key, model_name)
+                response = model.generate_content(prompt, generation_config=generation_config)
+                if response.candidates:
+                    meta['finish_reason'] = normalize_finish_reason(response.candidates[0].finish_reason)
+                usage = getattr(response, 'usage_metadata', None)
+                if usage is not None:
+                    meta['usage'] = {'prompt_tokens': usage.prompt_token_count,
+                                     'completion_tokens': usage.candidates_token_count}
+                return response.text
             
-            result = response.text
-            self._record_success('google')
+            meta = {} if meta is None else meta
+            result = llm_cassette.complete('google', model_name, prompt, params, call, meta)
+            llm_telemetry.note_usage(**meta.get('usage', {}))
+            self._record_success('google', kwargs.get("model", "gemini-1.5-pro"), time.time() - start_time)
             return result
             
         except Exception as e:
-            self._record_failure('google', str(e))
+            self._record_failure('google', str(e), kwargs.get("model", "gemini-1.5-pro"), self._is_rate_limit(e))
             raise e
     
-    def _record_success(self, provider: str):
+    def _stream_groq_api(self, prompt: str, meta: Optional[Dict[str, Any]] = None, **kwargs):
+        """Stream Groq deltas as they arrive; the finish reason goes into meta when given"""
+        if not self.groq_api_key and not llm_cassette.replaying:
+            raise Exception("GROQ_API_KEY not found in environment")
+        
+        model, params, max_tokens = self._request_params('groq', kwargs)
+        
+        def open_stream():
+            client = client_registry.get_groq_client(self.groq_api_key)
+            stream = client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens,
+                temperature=params["temperature"],
+                stream=True,
+                # Token usage arrives in the final chunk
+                extra_body={"stream_options": {"include_usage": True}}
+            )
+            for chunk in stream:
+                usage = chunk.usage or getattr(chunk.x_groq, 'usage', None)
+                if usage is not None:
+                    meta['usage'] = {'prompt_tokens': usage.prompt_tokens, 'completion_tokens': usage.completion_tokens}
+                if not chunk.choices:
+                    continue
+                if chunk.choices[0].finish_reason:
+                    meta['finish_reason'] = normalize_finish_reason(chunk.choices[0].finish_reason)
+                yield chunk.choices[0].delta.content or ""
+        
+        meta = {} if meta is None else meta
+        yield from llm_cassette.stream('groq', model, prompt, params, open_stream, meta)
+        llm_telemetry.note_usage(**meta.get('usage', {}))
+    
+    def _stream_google_api(self, prompt: str, meta: Optional[Dict[str, Any]] = None, **kwargs):
+        """Stream Gemini chunks as they arrive; the finish reason goes into meta when given"""
+        if not self.google_api_key and not llm_cassette.replaying:
+            raise Exception("GOOGLE_API_KEY not found in environment")
+        
+        model_name, params, max_tokens = self._request_params('google', kwargs)
+        generation_config = {
+            "temperature": params["temperature"],
+            "max_output_tokens": max_tokens,
+        }
+        
+        def open_stream():
+            model = client_registry.get_genai_model(self.google_api_key, model_name)
+            for chunk in model.generate_content(prompt, generation_config=generation_config, stream=True):
+                if meta is not None and chunk.candidates and chunk.candidates[0].finish_reason:
+                    meta['finish_reason'] = normalize_finish_reason(chunk.candidates[0].finish_reason)
+                yield chunk.text or ""
+        
+        yield from llm_cassette.stream('google', model_name, prompt, params, open_stream, meta)
+    
+    def _request_params(self, provider: str, kwargs: Dict[str, Any]):
+        """
+        Model and generation parameters that address a request in the response cache, and the
+        max tokens to send: the caller's, else sized from this call site's answer lengths
+        (truncated answers are continued). The cache key keeps the default, not the prediction.
+        """
+        default_model = "openai/gpt-oss-120b" if provider == 'groq' else "gemini-1.5-pro"
+        # Over the engagement's soft budget the cheaper sibling model answers
+        model = cost_ledger.model_for(provider, kwargs.get("model", default_model))
+        params = {
+            "temperature": kwargs.get("temperature", 0.7),
+            "max_tokens": kwargs.get("max_tokens", 1024),
+        }
+        max_tokens = kwargs["max_tokens"] if "max_tokens" in kwargs else output_budget.limit(provider, model, 1024)
+        return model, params, max_tokens
+    
+    def _call_provider(self, provider: str, prompt: str, **kwargs) -> str:
+        """Dispatch to a provider, serving repeated requests from the response cache"""
+        use_cache = kwargs.pop("use_cache", True)
+        model, params, _ = self._request_params(provider, kwargs)
+        llm_telemetry.note(provider=provider, model=model)
+        
+        if use_cache:
+            cached = response_cache.get(provider, model, prompt, params)
+            if cached is None:
+                cached = semantic_cache.get(provider, model, prompt, params)
+            if cached is not None:
+                llm_telemetry.note(cache_hit=True)
+                return cached
+        
+        def call():
+            # Refused before the circuit is touched, so a refusal never takes the half-open probe
+            cost_ledger.admit(provider)
+            # Raises CircuitOpenError unless the circuit is closed or this call is the half-open probe
+            self.scoreboard.acquire(provider)
+            start_time = time.time()
+            if provider == 'groq':
+                api_call = self._call_groq_api
+            elif provider == 'google':
+                api_call = self._call_google_api
+            else:
+                raise Exception(f"Unknown provider: {provider}")
+            
+            def fetch(text):
+                meta = {}
+                return api_call(text, meta=meta, **kwargs), meta.get('finish_reason')
+            
+            with request_scheduler.slot(provider):
+                result = output_budget.complete(prompt, fetch)
+            self.hedge_policy.record_latency(provider, time.time() - start_time)
+            
+            if use_cache:
+                response_cache.put(provider, model, prompt, result, params)
+                semantic_cache.put(provider, model, prompt, result, params)
+            return result
+        
+        # Identical concurrent requests attach to the one outstanding call
+        return single_flight.do(make_cache_key(provider, model, prompt, params), call)
+    
+    def configure_hedging(self, enabled: Optional[bool] = None, percentile: Optional[float] = None,
+                          budget_percent: Optional[float] = None):
+        """Enable/disable hedged requests and tune the latency threshold and traffic budget"""
+        self.hedge_policy.configure(enabled, percentile, budget_percent)
+    
+    def _call_with_priority(self, priority: str, provider: str, prompt: str, **kwargs) -> str:
+        """_call_provider on a pool thread, scheduled under the submitting caller's priority class"""
+        with priority_scope(priority):
+            return self._call_provider(provider, prompt, **kwargs)
+    
+    def _hedged_call(self, primary: str, prompt: str, **kwargs) -> str:
+        """Call the primary; if it exceeds its tracked latency threshold, race the secondary against it"""
+        if self._hedge_pool is None:
+            self._hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix='llm-hedge')
+        
+        priority = current_priority()
+        # Each attempt runs in a copy of the caller's context, so its telemetry notes reach the caller's call
+        primary_future = self._hedge_pool.submit(contextvars.copy_context().run, self._call_with_priority,
+                                                 priority, primary, prompt, **kwargs)
+        secondary = next((p for p in self.provider_status if p != primary and self._is_provider_available(p)), None)
+        if secondary is None:
+            return primary_future.result()
+        
+        delay = self.hedge_policy.hedge_delay(primary)
+        done, _ = wait([primary_future], timeout=delay)
+        if done or not self.hedge_policy.try_acquire_hedge():
+            return primary_future.result()
+        
+        self.logger.info(f"🎯 {primary.title()} slower than {delay:.2f}s, hedging to {secondary.title()}")
+        # The secondary uses its own default model
+        hedge_kwargs = {k: v for k, v in kwargs.items() if k != 'model'}
+        hedge_future = self._hedge_pool.submit(contextvars.copy_context().run, self._call_with_priority,
+                                               priority, secondary, prompt, **hedge_kwargs)
+        
+        pending = {primary_future, hedge_future}
+        last_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # Blocking SDK calls cannot be interrupted mid-request; the loser is cancelled
+                    # if still queued, otherwise its result is discarded
+                    for loser in pending:
+                        loser.cancel()
+                    if future is hedge_future:
+                        self.hedge_policy.record_hedge_win()
+                        self.logger.info(f"🎯 Hedge to {secondary.title()} won")
+                    return future.result()
+                last_error = future.exception()
+        raise last_error
+    
+    @staticmethod
+    def _is_rate_limit(error: Exception) -> bool:
+        """Whether a provider error is a 429 / quota rejection"""
+        status = getattr(error, 'status_code', None) or getattr(error, 'code', None)
+        text = str(error).lower()
+        return status == 429 or '429' in text or 'rate limit' in text or 'resource exhausted' in text
+    
+    def _record_success(self, provider: str, model: Optional[str] = None, latency: float = 0.0):
         """Record successful API call"""
         self.provider_status[provider]['healthy'] = True
         self.provider_status[provider]['last_success'] = datetime.now()
         self.provider_status[provider]['consecutive_failures'] = 0
         self.provider_status[provider]['total_requests'] += 1
+        self.scoreboard.record_success(provider, model, latency)
         
         self.logger.info(f"✅ {provider.title()} API call successful")
     
-    def _record_failure(self, provider: str, error: str):
+    def _record_failure(self, provider: str, error: str, model: Optional[str] = None, rate_limited: bool = False):
         """Record failed API call and update circuit breaker"""
         self.provider_status[provider]['consecutive_failures'] += 1
         self.provider_status[provider]['total_requests'] += 1
         
-        # Check if we should open circuit breaker
-        if self.provider_status[provider]['consecutive_failures'] >= self.circuit_breaker['failure_threshold']:
+        # Repeated failures, a high error rate or a failed half-open probe open the circuit
+        if self.scoreboard.record_failure(provider, model, rate_limited):
             self.provider_status[provider]['healthy'] = False
-            self.logger.warning(f"🔴 {provider.title()} API marked unhealthy after {self.provider_status[provider]['consecutive_failures']} failures")
+            self.logger.warning(f"🔴 {provider.title()} API circuit opened for {self.scoreboard.reopens_in(provider):.0f}s "
+                                f"after {self.provider_status[provider]['consecutive_failures']} failures")
         
         self.logger.error(f"❌ {provider.title()} API call failed: {error}")
     
     def _is_provider_available(self, provider: str) -> bool:
-        """Check if provider is available (circuit breaker logic)"""
-        status = self.provider_status[provider]
-        
-        if status['healthy']:
-            return True
-        
-        # Check if enough time has passed for recovery attempt
-        if status['last_success']:
-            time_since_last_success = datetime.now() - status['last_success']
-            if time_since_last_success.total_seconds() > self.circuit_breaker['recovery_timeout']:
-                self.logger.info(f"🔄 Attempting recovery for {provider.title()} API")
-                return True
-        
-        return False
+        """Check if provider is available (circuit closed, or open long enough for a half-open probe)"""
+        return self.scoreboard.is_available(provider)
     
-    def _get_best_provider(self, preferred_provider: Optional[str] = None) -> str:
-        """Determine the best provider to use based on health status"""
+    def _get_best_provider(self, preferred_provider: Optional[str] = None, model: Optional[str] = None) -> str:
+        """Pick the available provider with the lowest expected completion time"""
         # If preferred provider is specified and available, use it
         if preferred_provider and self._is_provider_available(preferred_provider):
             return preferred_provider
         
-        # Find the healthiest provider
         available_providers = [p for p in self.provider_status.keys() if self._is_provider_available(p)]
         
         if not available_providers:
-            # All providers are down, try the one with the oldest failure
-            providers_by_last_success = sorted(
-                self.provider_status.items(),
-                key=lambda x: x[1]['last_success'] or datetime.min,
-                reverse=True
-            )
-            return providers_by_last_success[0][0]
+            # All circuits are open: go with the one that reopens first
+            return min(self.provider_status, key=self.scoreboard.reopens_in)
         
-        # Sort by consecutive failures (ascending) and last success (descending)
-        best_provider = min(available_providers, key=lambda p: (
-            self.provider_status[p]['consecutive_failures'],
-            -(self.provider_status[p]['last_success'] or datetime.min).timestamp()
-        ))
-        
-        return best_provider
+        # EWMA latency inflated by the rolling error rate, plus a penalty per recent 429
+        models = {preferred_provider: model} if preferred_provider else {}
+        return self.scoreboard.rank(available_providers, models)[0]
     
     def _exponential_backoff_retry(self, func, max_retries: int = 3, base_delay: float = 1.0) -> str:
         """Execute function with exponential backoff retry"""
         for attempt in range(max_retries + 1):
             try:
                 return func()
+            except (CircuitOpenError, BudgetExceededError):
+                # Retrying cannot help until the circuit admits a probe (or the budget is raised)
+                raise
             except Exception as e:
                 if attempt == max_retries:
                     raise e
                 
                 delay = base_delay * (2 ** attempt)
                 self.logger.warning(f"⚠️ Attempt {attempt + 1} failed, retrying in {delay}s: {str(e)}")
+                llm_telemetry.note_retry()
                 time.sleep(delay)
         
         # This should never be reached, but just in case
@@ -203,19 +398,57 @@ class EnhancedLLMRouter:
         Returns:
             Generated text response
         """
+        with llm_telemetry.call(provider or 'auto', kwargs.get("model"), prompt) as call:
+            result = self._complete(prompt, provider, **kwargs)
+            call.set_result(result)
+            return result
+    
+    def _call_local(self, prompt: str, **kwargs) -> str:
+        """Complete on the local CPU model (no circuit breaker: there is no remote side to protect)"""
+        use_cache = kwargs.pop("use_cache", True)
+        model = local_backend.model_name
+        params = {
+            "temperature": kwargs.get("temperature", 0.2),
+            "max_tokens": kwargs.get("max_tokens", 1024),
+        }
+        max_tokens = kwargs["max_tokens"] if "max_tokens" in kwargs else output_budget.limit('local', model, 1024)
+        llm_telemetry.note(provider='local', model=model)
+        if use_cache:
+            cached = response_cache.get('local', model, prompt, params)
+            if cached is not None:
+                llm_telemetry.note(cache_hit=True)
+                return cached
+        
+        def fetch(text):
+            meta = {}
+            return local_backend.complete(text, max_tokens, params["temperature"], meta=meta), meta.get('finish_reason')
+        
+        with request_scheduler.slot('local'):
+            result = output_budget.complete(prompt, fetch)
+        if use_cache:
+            response_cache.put('local', model, prompt, result, params)
+        return result
+    
+    def _complete(self, prompt: str, provider: Optional[str] = None, **kwargs) -> str:
+        """Provider selection, hedging, retries and failover behind llm_complete"""
+        if provider == 'local':
+            return self._call_local(prompt, **kwargs)
+        
         # Determine which provider to use
-        selected_provider = self._get_best_provider(provider)
+        selected_provider = self._get_best_provider(provider, kwargs.get("model"))
         
         self.logger.info(f"🤖 Using {selected_provider.title()} API for completion")
         
+        if self.hedge_policy.enabled:
+            self.hedge_policy.start_request()
+            try:
+                return self._hedged_call(selected_provider, prompt, **kwargs)
+            except Exception as e:
+                self.logger.warning(f"⚠️ Hedged attempt failed, continuing with retries: {str(e)}")
+        
         # Define the API call function
         def make_api_call():
-            if selected_provider == 'groq':
-                return self._call_groq_api(prompt, **kwargs)
-            elif selected_provider == 'google':
-                return self._call_google_api(prompt, **kwargs)
-            else:
-                raise Exception(f"Unknown provider: {selected_provider}")
+            return self._call_provider(selected_provider, prompt, **kwargs)
         
         # Try the selected provider with retries
         try:
@@ -232,10 +465,7 @@ class EnhancedLLMRouter:
                     self.logger.warning(f"🔄 Falling back to {fallback_provider.title()} API")
                     
                     def fallback_api_call():
-                        if fallback_provider == 'groq':
-                            return self._call_groq_api(prompt, **kwargs)
-                        elif fallback_provider == 'google':
-                            return self._call_google_api(prompt, **kwargs)
+                        return self._call_provider(fallback_provider, prompt, **kwargs)
                     
                     try:
                         return self._exponential_backoff_retry(
@@ -246,11 +476,127 @@ class EnhancedLLMRouter:
                         self.logger.error(f"❌ Fallback to {fallback_provider.title()} also failed: {str(fallback_error)}")
                         continue
             
+            # Last resort: the local CPU model, if one is configured
+            if local_backend.available:
+                self.logger.warning("🔄 Falling back to the local model")
+                try:
+                    return self._call_local(prompt, **{k: v for k, v in kwargs.items() if k != 'model'})
+                except Exception as local_error:
+                    self.logger.error(f"❌ Fallback to the local model also failed: {str(local_error)}")
+            
             # All providers failed
             error_msg = f"❌ All LLM providers failed. Last error: {str(e)}"
             self.logger.error(error_msg)
+            llm_telemetry.note(error=error_msg)
             return f"Error: {error_msg}"
     
+    def llm_stream(self, prompt: str, provider: Optional[str] = None, **kwargs):
+        """
+        Yield completion tokens as they arrive, with the same provider selection as llm_complete
+        
+        Failover to the next provider only happens before the first token; a stream that
+        breaks part-way raises so consumers never see two providers' output spliced together.
+        """
+        use_cache = kwargs.pop("use_cache", True)
+        call = llm_telemetry.call(provider or 'auto', kwargs.get("model"), prompt)
+        parts = []
+        # The active call for the whole stream, so caches, scheduler and cost ledger annotate it
+        with call:
+            try:
+                yield from self._stream(call, parts, prompt, provider, use_cache, kwargs)
+            except Exception as e:
+                call.finish(e)
+                raise
+            finally:
+                call.finish(result="".join(parts))
+    
+    def _stream(self, call, parts: List[str], prompt: str, provider: Optional[str], use_cache: bool, kwargs: Dict[str, Any]):
+        """Provider selection and pre-first-token failover behind llm_stream"""
+        selected_provider = self._get_best_provider(provider, kwargs.get("model"))
+        order = [selected_provider] + self.scoreboard.rank(
+            [p for p in ['groq', 'google'] if p != selected_provider and self._is_provider_available(p)]
+        )
+        
+        last_error = None
+        for current in order:
+            call_kwargs = kwargs if current == selected_provider else {k: v for k, v in kwargs.items() if k != 'model'}
+            model, params, _ = self._request_params(current, call_kwargs)
+            call.note(provider=current, model=model)
+            if use_cache:
+                cached = response_cache.get(current, model, prompt, params)
+                if cached is None:
+                    cached = semantic_cache.get(current, model, prompt, params)
+                if cached is not None:
+                    call.note(cache_hit=True)
+                    parts.append(cached)
+                    yield cached
+                    return
+            
+            try:
+                cost_ledger.admit(current)
+                self.scoreboard.acquire(current)
+            except (CircuitOpenError, BudgetExceededError) as e:
+                last_error = e
+                continue
+            
+            self.logger.info(f"🤖 Streaming from {current.title()} API")
+            recorder = stream_metrics.start(current, model)
+            stream_api = self._stream_groq_api if current == 'groq' else self._stream_google_api
+            # Answers cut off at the output limit continue in the same stream
+            source = output_budget.stream(prompt, lambda text, meta: stream_api(text, meta=meta, **call_kwargs))
+            # The scheduler slot is held until the stream ends, so queued work waits its turn
+            with request_scheduler.slot(current, bind=False):
+                try:
+                    for token in source:
+                        if not token:
+                            continue
+                        recorder.on_token(token)
+                        call.on_token(token)
+                        parts.append(token)
+                        yield token
+                except GeneratorExit:
+                    recorder.finish()
+                    self.scoreboard.release(current)
+                    raise
+                except Exception as e:
+                    recorder.finish(e)
+                    self._record_failure(current, str(e), model, self._is_rate_limit(e))
+                    if parts:
+                        raise
+                    last_error = e
+                    continue
+            
+            recorder.finish()
+            self._record_success(current, model, time.monotonic() - recorder.started)
+            if use_cache:
+                response_cache.put(current, model, prompt, "".join(parts), params)
+                semantic_cache.put(current, model, prompt, "".join(parts), params)
+            return
+        
+        if local_backend.available:
+            # Last resort before any token has been sent: the local CPU model
+            self.logger.warning("🔄 Streaming from the local model")
+            model = local_backend.model_name
+            max_tokens = kwargs["max_tokens"] if "max_tokens" in kwargs else output_budget.limit('local', model, 1024)
+            call.note(provider='local', model=model)
+            with request_scheduler.slot('local', bind=False):
+                try:
+                    for token in output_budget.stream(prompt, lambda text, meta: local_backend.stream(
+                            text, max_tokens, kwargs.get("temperature", 0.2), meta=meta)):
+                        call.on_token(token)
+                        parts.append(token)
+                        yield token
+                    return
+                except Exception as e:
+                    if parts:
+                        raise
+                    last_error = e
+        
+        error_msg = f"❌ All LLM providers failed. Last error: {str(last_error)}"
+        self.logger.error(error_msg)
+        call.note(error=error_msg)
+        yield f"Error: {error_msg}"
+    
     def health_check(self) -> Dict[str, Any]:
         """Perform health check on all providers"""
         self.logger.info("🩺 Performing LLM providers health check")
@@ -264,13 +610,24 @@ class EnhancedLLMRouter:
         test_prompt = "Say 'test'"
         
         for provider in ['groq', 'google']:
+            if not self._is_provider_available(provider):
+                # Tripped here or by another worker (or a previous run): no need to re-probe it
+                health_status['providers'][provider] = {
+                    'healthy': False,
+                    'error': f"circuit open, next probe in {self.scoreboard.reopens_in(provider):.0f}s",
+                    'status': self.provider_status[provider].copy()
+                }
+                health_status['overall_health'] = 'degraded'
+                continue
             try:
                 start_time = time.time()
                 
+                # A liveness probe runs on the small tier
+                probe_params = model_tiering.params('health_check', provider)
                 if provider == 'groq':
-                    result = self._call_groq_api(test_prompt, max_tokens=10)
+                    result = self._call_groq_api(test_prompt, **probe_params)
                 else:
-                    result = self._call_google_api(test_prompt, max_tokens=10)
+                    result = self._call_google_api(test_prompt, **probe_params)
                 
                 response_time = time.time() - start_time
                 
@@ -303,14 +660,31 @@ class EnhancedLLMRouter:
         for provider in self.provider_status:
             self.provider_status[provider]['healthy'] = True
             self.provider_status[provider]['consecutive_failures'] = 0
+        self.scoreboard.reset()
     
     def get_status(self) -> Dict[str, Any]:
         """Get current router status"""
         return {
-            'provider_status': self.provider_status.copy(),
+            'provider_status': {p: {**status, 'healthy': self._is_provider_available(p)} for p, status in self.provider_status.items()},
             'circuit_breaker_config': self.circuit_breaker.copy(),
             'last_health_check': self.last_health_check.isoformat() if self.last_health_check else None,
-            'available_providers': [p for p in self.provider_status.keys() if self._is_provider_available(p)]
+            'available_providers': [p for p in self.provider_status.keys() if self._is_provider_available(p)],
+            'provider_scores': self.scoreboard.get_status(),
+            'response_cache': response_cache.get_status(),
+            'semantic_cache': semantic_cache.get_status(),
+            'cassette': llm_cassette.get_status(),
+            'shared_state': shared_state.get_status(),
+            'client_pool': client_registry.get_status(),
+            'single_flight': single_flight.get_status(),
+            'hedging': self.hedge_policy.get_status(),
+            'streaming': stream_metrics.get_status(),
+            'telemetry': llm_telemetry.get_status(),
+            'output_budget': output_budget.get_status(),
+            'local_backend': local_backend.get_status(),
+            'scheduler': request_scheduler.get_status(),
+            'cost_ledger': cost_ledger.get_status(),
+            'model_tiering': model_tiering.get_status(),
+            'prompt_compaction': prompt_compactor.get_status()
         }
 
 # Global instance for easy access
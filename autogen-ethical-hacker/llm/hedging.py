@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+🎯 Hedged Request Policy
+Tracks per-provider latency percentiles and decides when a backup request to the
+secondary provider is worth firing, within a configurable share of traffic
+"""
+
+import os
+import threading
+from collections import deque
+from typing import Dict, Any, Optional
+
+
+class HedgePolicy:
+    """
+    Opt-in hedging: if the primary has not answered within its tracked p95 latency,
+    send the same request to the secondary and take whichever finishes first
+    """
+
+    def __init__(self, enabled: Optional[bool] = None, percentile: Optional[float] = None,
+                 budget_percent: Optional[float] = None, min_delay: float = 0.5,
+                 default_delay: float = 8.0, window: int = 200, min_samples: int = 20):
+        if enabled is None:
+            enabled = os.environ.get("LLM_HEDGING", "").lower() in ("1", "true", "yes")
+        self.enabled = enabled
+        self.percentile = float(percentile if percentile is not None else os.environ.get("LLM_HEDGE_PERCENTILE", 95))
+        self.budget_percent = float(budget_percent if budget_percent is not None else os.environ.get("LLM_HEDGE_BUDGET_PERCENT", 10))
+        self.min_delay = min_delay
+        self.default_delay = default_delay
+        self.window = window
+        self.min_samples = min_samples
+
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self.stats = {'requests': 0, 'hedges_fired': 0, 'hedge_wins': 0, 'budget_denied': 0}
+
+    def configure(self, enabled: Optional[bool] = None, percentile: Optional[float] = None,
+                  budget_percent: Optional[float] = None):
+        """Adjust hedging at runtime"""
+        with self._lock:
+            if enabled is not None:
+                self.enabled = enabled
+            if percentile is not None:
+                self.percentile = float(percentile)
+            if budget_percent is not None:
+                self.budget_percent = float(budget_percent)
+
+    def record_latency(self, provider: str, seconds: float):
+        """Record the latency of a successful provider call"""
+        with self._lock:
+            samples = self._latencies.get(provider)
+            if samples is None:
+                samples = self._latencies[provider] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def latency_percentile(self, provider: str, percentile: Optional[float] = None) -> Optional[float]:
+        """Nearest-rank percentile of recent latencies, or None without enough samples"""
+        with self._lock:
+            samples = sorted(self._latencies.get(provider, ()))
+        if len(samples) < self.min_samples:
+            return None
+        rank = (percentile if percentile is not None else self.percentile) / 100.0
+        index = min(len(samples) - 1, max(0, int(round(rank * len(samples))) - 1))
+        return samples[index]
+
+    def hedge_delay(self, provider: str) -> float:
+        """How long to wait on the primary before hedging"""
+        threshold = self.latency_percentile(provider)
+        if threshold is None:
+            return self.default_delay
+        return max(self.min_delay, threshold)
+
+    def start_request(self):
+        with self._lock:
+            self.stats['requests'] += 1
+
+    def try_acquire_hedge(self) -> bool:
+        """Admit a hedge only while hedges stay within the traffic budget"""
+        with self._lock:
+            allowed = (self.stats['hedges_fired'] + 1) * 100.0 <= self.budget_percent * max(1, self.stats['requests'])
+            if allowed:
+                self.stats['hedges_fired'] += 1
+            else:
+                self.stats['budget_denied'] += 1
+            return allowed
+
+    def record_hedge_win(self):
+        with self._lock:
+            self.stats['hedge_wins'] += 1
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get hedging configuration, counters and current thresholds"""
+        with self._lock:
+            providers = list(self._latencies)
+            status = {
+                'enabled': self.enabled,
+                'percentile': self.percentile,
+                'budget_percent': self.budget_percent,
+                **self.stats,
+            }
+        status['hedge_delays'] = {p: self.hedge_delay(p) for p in providers}
+        return status
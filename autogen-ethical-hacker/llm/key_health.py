@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+🩺 Passive Key-Health Registry
+Tracks API key health from the outcomes of real traffic; only keys sitting in cooldown
+are probed, from a background thread, so healthy traffic costs exactly one call.
+With a shared state store, key health is shared by every process on the host.
+"""
+
+import time
+import logging
+import threading
+from typing import Dict, Any, Optional, Callable, Iterable, Set
+
+from llm.client_pool import key_fingerprint
+from llm.shared_state import shared_state
+
+HEALTHY = 'healthy'
+COOLDOWN = 'cooldown'
+INVALID = 'invalid'
+
+AUTH_MARKERS = ('invalid api key', 'api key not valid', 'invalid_api_key', 'unauthorized',
+                'unauthenticated', 'permission denied', 'permission_denied')
+RATE_LIMIT_MARKERS = ('429', 'rate limit', 'rate_limit', 'resource exhausted', 'resource_exhausted', 'quota')
+
+# Rejected keys stay marked across restarts for a week; a rotated key has a new fingerprint anyway
+INVALID_TTL = 7 * 24 * 3600
+
+
+def classify_error(error: Exception) -> str:
+    """'auth' for a rejected key, 'rate_limit' for throttling, 'transient' for everything else"""
+    status = getattr(error, 'status_code', None)
+    if not isinstance(status, int):
+        code = getattr(error, 'code', None)
+        status = code if isinstance(code, int) else None
+    message = str(error).lower()
+    if status in (401, 403) or any(marker in message for marker in AUTH_MARKERS):
+        return 'auth'
+    if status == 429 or any(marker in message for marker in RATE_LIMIT_MARKERS):
+        return 'rate_limit'
+    return 'transient'
+
+
+class KeyHealthRegistry:
+    """
+    Key states: healthy, cooldown (transient failures; exponential backoff, re-admitted by a
+    background probe) and invalid (rejected credentials; only cleared by reset)
+    """
+
+    def __init__(self, failure_threshold: int = 2, base_cooldown: float = 30.0, max_cooldown: float = 600.0,
+                 shared=None):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        # Optional SharedStateStore; records are keyed by key fingerprint, never by the key itself
+        self.shared = shared
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._keys = {}
+        self._prober = None
+        self._probe_thread = None
+        self.stats = {'successes': 0, 'failures': 0, 'probes': 0, 'probe_successes': 0}
+
+        self.setup_logging()
+
+    def setup_logging(self):
+        """Setup logging for key health tracking"""
+        self.logger = logging.getLogger('KeyHealthRegistry')
+        if not self.logger.handlers:
+            handler = logging.StreamHandler()
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+
+    def _entry(self, provider: str, api_key: str) -> Dict[str, Any]:
+        entry = self._keys.get((provider, api_key))
+        if entry is None:
+            entry = self._keys[(provider, api_key)] = {
+                'state': HEALTHY, 'consecutive_failures': 0, 'cooldown': self.base_cooldown,
+                'retry_at': 0.0, 'last_error': None,
+            }
+        return entry
+
+    @staticmethod
+    def _shared_key(provider: str, api_key: str) -> str:
+        return f"{provider}:{key_fingerprint(api_key)}"
+
+    def _sync(self, provider: str, api_key: str, records: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """Local entry, refreshed from the shared store (a missing shared record means healthy)"""
+        entry = self._entry(provider, api_key)
+        if self.shared is not None:
+            key = self._shared_key(provider, api_key)
+            record = records.get(key) if records is not None else self.shared.get('key_health', key)
+            if record is not None:
+                entry.update(record)
+            elif entry['state'] != HEALTHY or entry['consecutive_failures']:
+                # Recovered (or reset) by another process
+                entry.update(state=HEALTHY, consecutive_failures=0, cooldown=self.base_cooldown, retry_at=0.0)
+        return entry
+
+    def _mutate(self, provider: str, api_key: str, fn: Callable[[Dict[str, Any]], Any]) -> Any:
+        """Apply fn to the key's entry, atomically across processes when the state is shared"""
+        results = []
+
+        def apply(record):
+            entry = self._entry(provider, api_key)
+            if record is not None:
+                entry.update(record)
+            results.append(fn(entry))
+            if entry['state'] == HEALTHY and not entry['consecutive_failures']:
+                return None
+            return dict(entry)
+
+        if self.shared is not None:
+            self.shared.update('key_health', self._shared_key(provider, api_key), apply,
+                               ttl=lambda record: INVALID_TTL if record['state'] == INVALID else self.max_cooldown * 2)
+        else:
+            apply(None)
+        return results[-1]
+
+    def set_prober(self, prober: Callable[[str, str], Any]):
+        """prober(provider, api_key) makes a minimal call and raises if the key is still broken"""
+        self._prober = prober
+
+    # -- outcomes of real traffic -----------------------------------------
+
+    def record_success(self, provider: str, api_key: str):
+        def recover(entry):
+            entry.update(state=HEALTHY, consecutive_failures=0, cooldown=self.base_cooldown, retry_at=0.0)
+
+        with self._lock:
+            entry = self._sync(provider, api_key)
+            # Healthy traffic only reads the shared state; it is written when something changes
+            if entry['state'] != HEALTHY or entry['consecutive_failures']:
+                self._mutate(provider, api_key, recover)
+            self.stats['successes'] += 1
+
+    def record_failure(self, provider: str, api_key: str, error: Exception) -> str:
+        """Record a failed call on a key; returns the error class. Rate limits are left to the rate limiter."""
+        kind = classify_error(error)
+        if kind == 'rate_limit':
+            return kind
+
+        def fail(entry):
+            entry['consecutive_failures'] += 1
+            entry['last_error'] = str(error)[:200]
+            if kind == 'auth':
+                entry['state'] = INVALID
+                self.logger.warning(f"🔴 {provider.title()} key {key_fingerprint(api_key)} rejected, marked invalid")
+            elif entry['state'] == COOLDOWN or entry['consecutive_failures'] >= self.failure_threshold:
+                self._start_cooldown(provider, api_key, entry)
+
+        with self._lock:
+            self._mutate(provider, api_key, fail)
+            self.stats['failures'] += 1
+        if kind != 'auth':
+            self._ensure_prober()
+        return kind
+
+    def _start_cooldown(self, provider: str, api_key: str, entry: Dict[str, Any]):
+        if entry['state'] == COOLDOWN:
+            entry['cooldown'] = min(self.max_cooldown, entry['cooldown'] * 2)
+        entry['state'] = COOLDOWN
+        entry['retry_at'] = time.time() + entry['cooldown']
+        self.logger.warning(f"🟡 {provider.title()} key {key_fingerprint(api_key)} cooling down for {entry['cooldown']:.0f}s")
+        self._wakeup.set()
+
+    # -- selection ---------------------------------------------------------
+
+    def is_usable(self, provider: str, api_key: str) -> bool:
+        with self._lock:
+            if self.shared is not None:
+                return self._sync(provider, api_key)['state'] == HEALTHY
+            entry = self._keys.get((provider, api_key))
+            return entry is None or entry['state'] == HEALTHY
+
+    def unusable(self, provider: str, api_keys: Iterable[str]) -> Set[str]:
+        """Keys that must not receive traffic right now"""
+        api_keys = list(api_keys)
+        if self.shared is None:
+            return {k for k in api_keys if not self.is_usable(provider, k)}
+        # One read of the shared store for the whole key list
+        records = self.shared.items('key_health')
+        with self._lock:
+            entries = {k: self._sync(provider, k, records) for k in api_keys}
+        cooling = any(entry['state'] == COOLDOWN for entry in entries.values())
+        if cooling:
+            # Cooldowns started by another process are probed from here too
+            self._ensure_prober()
+        return {k for k, entry in entries.items() if entry['state'] != HEALTHY}
+
+    def reset(self, provider: Optional[str] = None, api_key: Optional[str] = None):
+        """Forget the health of one key, one provider's keys, or everything"""
+        with self._lock:
+            for key in list(self._keys):
+                if (provider is None or key[0] == provider) and (api_key is None or key[1] == api_key):
+                    del self._keys[key]
+                    if self.shared is not None:
+                        self.shared.delete('key_health', self._shared_key(*key))
+            if self.shared is not None and provider is None and api_key is None:
+                self.shared.delete('key_health')
+
+    # -- background probing -------------------------------------------------
+
+    def _ensure_prober(self):
+        if self._prober is None:
+            return
+        with self._lock:
+            if self._probe_thread is not None and self._probe_thread.is_alive():
+                self._wakeup.set()
+                return
+            self._probe_thread = threading.Thread(target=self._probe_loop, name='key-health-probe', daemon=True)
+            self._probe_thread.start()
+
+    def _probe_loop(self):
+        while True:
+            with self._lock:
+                for provider, api_key in list(self._keys):
+                    self._sync(provider, api_key)
+                cooling = [(key, entry['retry_at']) for key, entry in self._keys.items() if entry['state'] == COOLDOWN]
+                if not cooling:
+                    self._probe_thread = None
+                    return
+                now = time.time()
+                due = [key for key, retry_at in cooling if retry_at <= now]
+                next_at = min(retry_at for _, retry_at in cooling)
+            if not due:
+                self._wakeup.wait(max(0.0, next_at - time.time()))
+                self._wakeup.clear()
+                continue
+            for provider, api_key in due:
+                if self._claim_probe(provider, api_key):
+                    self._probe(provider, api_key)
+
+    def _claim_probe(self, provider: str, api_key: str) -> bool:
+        """Take the key's probe slot; with shared state only one process probes a key at a time"""
+        def claim(entry):
+            if entry['state'] != COOLDOWN or entry['retry_at'] > time.time():
+                return False
+            # Pushed forward as a lease; the probe outcome then sets the real state
+            entry['retry_at'] = time.time() + entry['cooldown']
+            return True
+
+        with self._lock:
+            return self._mutate(provider, api_key, claim)
+
+    def _probe(self, provider: str, api_key: str):
+        self.stats['probes'] += 1
+        try:
+            self._prober(provider, api_key)
+        except Exception as e:
+            def still_broken(entry):
+                entry['last_error'] = str(e)[:200]
+                if classify_error(e) == 'auth':
+                    entry['state'] = INVALID
+                else:
+                    self._start_cooldown(provider, api_key, entry)
+
+            with self._lock:
+                self._mutate(provider, api_key, still_broken)
+            return
+        self.stats['probe_successes'] += 1
+        self.record_success(provider, api_key)
+        self.logger.info(f"✅ {provider.title()} key {key_fingerprint(api_key)} recovered")
+
+    def get_status(self) -> Dict[str, Any]:
+        """Per-key state (keys are shown by fingerprint only)"""
+        with self._lock:
+            now = time.time()
+            keys = {
+                f"{provider}:{key_fingerprint(api_key)}": {
+                    'state': entry['state'],
+                    'consecutive_failures': entry['consecutive_failures'],
+                    'retry_in': max(0.0, entry['retry_at'] - now) if entry['state'] == COOLDOWN else 0.0,
+                    'last_error': entry['last_error'],
+                }
+                for (provider, api_key), entry in self._keys.items()
+            }
+            return {'keys': keys, **self.stats}
+
+
+# Global instance for easy access
+key_health = KeyHealthRegistry(shared=shared_state)
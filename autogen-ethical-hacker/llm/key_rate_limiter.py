@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+🪣 Per-Key Rate Limiter
+Token buckets for requests-per-minute and tokens-per-minute on every API key, kept in
+sync with the providers' rate-limit headers, and key selection by remaining headroom.
+With a shared state store, a key blocked by a 429 is blocked for every process on the host.
+"""
+
+import os
+import re
+import time
+import threading
+from typing import Dict, Any, Optional, Iterable, Mapping
+
+from llm.client_pool import key_fingerprint
+from llm.shared_state import shared_state
+
+# Conservative free-tier defaults; override with "requests_per_minute" / "tokens_per_minute"
+# in a provider's section of config/apis.json. Response headers correct them at runtime.
+DEFAULT_LIMITS = {
+    'groq': {'requests_per_minute': 30, 'tokens_per_minute': 6000},
+    'google': {'requests_per_minute': 15, 'tokens_per_minute': 32000},
+}
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """Parse reset durations such as '7.66s', '2m59.56s', '120ms' or plain seconds"""
+    if not value:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    scale = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+    return sum(float(amount) * scale[unit] for amount, unit in parts)
+
+
+def retry_after_from_error(error: Exception) -> Optional[float]:
+    """Retry-After of a provider SDK exception, when the SDK exposes the response"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if headers is None:
+        return None
+    return parse_reset(headers.get('retry-after'))
+
+
+class TokenBucket:
+    """Continuously refilling bucket; capacity is the per-minute allowance"""
+
+    def __init__(self, capacity: float, period: float = 60.0):
+        self.capacity = float(capacity)
+        self.period = period
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def headroom(self, now: float) -> float:
+        """Fraction of the bucket currently available"""
+        self._refill(now)
+        if now < self.blocked_until:
+            return 0.0
+        return self.tokens / self.capacity if self.capacity else 0.0
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < amount:
+            wait = max(wait, (amount - self.tokens) / self.rate if self.rate else float('inf'))
+        return wait
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        # A negative amount returns an over-estimated reservation
+        self.tokens = min(self.capacity, self.tokens - min(amount, self.capacity))
+
+    def sync(self, remaining: Optional[float], reset: Optional[float], now: float, limit: Optional[float] = None):
+        """Adopt the provider's view of this bucket"""
+        if limit:
+            self.capacity = float(limit)
+        self._refill(now)
+        if remaining is not None:
+            self.tokens = min(self.capacity, float(remaining))
+            if remaining <= 0 and reset:
+                self.blocked_until = max(self.blocked_until, now + reset)
+
+
+class KeyRateLimiter:
+    """
+    Spreads requests over all usable keys of a provider, waiting briefly for headroom
+    instead of sending requests that would be rejected with 429
+    """
+
+    def __init__(self, max_wait: Optional[float] = None, shared=None):
+        self.max_wait = float(max_wait if max_wait is not None else os.environ.get("LLM_KEY_MAX_WAIT", 10))
+        # Optional SharedStateStore for rate-limit blocks (buckets themselves stay per process)
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._limits = {}
+        self.stats = {'acquired': 0, 'waited': 0, 'wait_seconds': 0.0, 'no_capacity': 0, 'rate_limited': 0, 'header_syncs': 0}
+
+    def configure(self, provider: str, requests_per_minute: Optional[float] = None,
+                  tokens_per_minute: Optional[float] = None):
+        """Set the per-key allowances for a provider (applies to keys seen from now on)"""
+        limits = dict(DEFAULT_LIMITS.get(provider, DEFAULT_LIMITS['groq']))
+        if requests_per_minute:
+            limits['requests_per_minute'] = requests_per_minute
+        if tokens_per_minute:
+            limits['tokens_per_minute'] = tokens_per_minute
+        with self._lock:
+            self._limits[provider] = limits
+
+    def _buckets(self, provider: str, api_key: str) -> Dict[str, TokenBucket]:
+        buckets = self._keys.get((provider, api_key))
+        if buckets is None:
+            limits = self._limits.get(provider) or DEFAULT_LIMITS.get(provider, DEFAULT_LIMITS['groq'])
+            buckets = self._keys[(provider, api_key)] = {
+                'requests': TokenBucket(limits['requests_per_minute']),
+                'tokens': TokenBucket(limits['tokens_per_minute']),
+            }
+        return buckets
+
+    def acquire(self, provider: str, api_keys: Iterable[str], estimated_tokens: int = 0,
+                exclude: Iterable[str] = (), max_wait: Optional[float] = None) -> Optional[str]:
+        """
+        Reserve one request and `estimated_tokens` on the key with the most headroom
+
+        Returns the chosen key, or None when no key can take the request within max_wait.
+        """
+        excluded = set(exclude)
+        candidates = [k for k in dict.fromkeys(api_keys) if k and k not in excluded]
+        if not candidates:
+            return None
+        deadline = time.monotonic() + (self.max_wait if max_wait is None else max_wait)
+        waited = 0.0
+
+        while True:
+            blocks = self.shared.items('rate_limit') if self.shared is not None else {}
+            with self._lock:
+                now = time.monotonic()
+                self._apply_shared_blocks(provider, candidates, blocks, now)
+                best_key, best_headroom, shortest_wait = None, -1.0, float('inf')
+                for api_key in candidates:
+                    buckets = self._buckets(provider, api_key)
+                    wait = max(buckets['requests'].wait_time(1, now),
+                               buckets['tokens'].wait_time(estimated_tokens, now))
+                    if wait > 0:
+                        shortest_wait = min(shortest_wait, wait)
+                        continue
+                    headroom = min(buckets['requests'].headroom(now), buckets['tokens'].headroom(now))
+                    if headroom > best_headroom:
+                        best_key, best_headroom = api_key, headroom
+                if best_key is not None:
+                    buckets = self._buckets(provider, best_key)
+                    buckets['requests'].take(1, now)
+                    buckets['tokens'].take(estimated_tokens, now)
+                    self.stats['acquired'] += 1
+                    if waited:
+                        self.stats['waited'] += 1
+                        self.stats['wait_seconds'] += waited
+                    return best_key
+                if now + shortest_wait > deadline:
+                    self.stats['no_capacity'] += 1
+                    return None
+            time.sleep(shortest_wait)
+            waited += shortest_wait
+
+    def _apply_shared_blocks(self, provider: str, api_keys: Iterable[str], blocks: Mapping[str, Dict[str, Any]], now: float):
+        """Adopt blocks other processes recorded; stored as wall-clock times"""
+        for api_key in api_keys:
+            record = blocks.get(f"{provider}:{key_fingerprint(api_key)}")
+            if record:
+                blocked_until = now + (record['blocked_until'] - time.time())
+                for bucket in self._buckets(provider, api_key).values():
+                    bucket.blocked_until = max(bucket.blocked_until, blocked_until)
+
+    def _publish_block(self, provider: str, api_key: str, pause: float):
+        if self.shared is None or pause <= 0:
+            return
+        blocked_until = time.time() + pause
+        self.shared.update(
+            'rate_limit', f"{provider}:{key_fingerprint(api_key)}",
+            lambda record: {'blocked_until': max(blocked_until, (record or {}).get('blocked_until', 0.0))},
+            ttl=lambda record: record['blocked_until'] - time.time()
+        )
+
+    def record_usage(self, provider: str, api_key: str, estimated_tokens: int, actual_tokens: Optional[int]):
+        """Settle a reservation once the response reports the tokens actually used"""
+        if actual_tokens is None:
+            return
+        with self._lock:
+            bucket = self._buckets(provider, api_key)['tokens']
+            bucket.take(actual_tokens - estimated_tokens, time.monotonic())
+
+    def update_from_headers(self, provider: str, api_key: str, headers: Mapping[str, str]):
+        """
+        Sync buckets from x-ratelimit-* headers. The token limit is per minute and also
+        resizes the bucket; the request limit may be per day, so only its remaining count is used.
+        """
+        if not headers:
+            return
+        headers = {str(k).lower(): v for k, v in headers.items()}
+
+        def number(name):
+            try:
+                return float(headers[name])
+            except (KeyError, TypeError, ValueError):
+                return None
+
+        if not any(name.startswith('x-ratelimit-') for name in headers):
+            return
+        with self._lock:
+            now = time.monotonic()
+            buckets = self._buckets(provider, api_key)
+            buckets['requests'].sync(number('x-ratelimit-remaining-requests'),
+                                     parse_reset(headers.get('x-ratelimit-reset-requests')), now)
+            buckets['tokens'].sync(number('x-ratelimit-remaining-tokens'),
+                                   parse_reset(headers.get('x-ratelimit-reset-tokens')), now,
+                                   limit=number('x-ratelimit-limit-tokens'))
+            self.stats['header_syncs'] += 1
+            exhausted_for = max(bucket.blocked_until for bucket in buckets.values()) - now
+        # An exhausted allowance is exhausted for every process using the key
+        self._publish_block(provider, api_key, exhausted_for)
+
+    def record_rate_limited(self, provider: str, api_key: str, retry_after: Optional[float] = None):
+        """A 429 empties the key's buckets until retry-after (or a full refill of the request bucket)"""
+        with self._lock:
+            now = time.monotonic()
+            buckets = self._buckets(provider, api_key)
+            pause = retry_after or (1.0 / buckets['requests'].rate if buckets['requests'].rate else 60.0)
+            for bucket in buckets.values():
+                bucket.sync(0, pause, now)
+            self.stats['rate_limited'] += 1
+        self._publish_block(provider, api_key, pause)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Headroom per key (keys are shown by fingerprint only)"""
+        with self._lock:
+            now = time.monotonic()
+            keys = {}
+            for (provider, api_key), buckets in self._keys.items():
+                keys[f"{provider}:{key_fingerprint(api_key)}"] = {
+                    name: {
+                        'capacity': bucket.capacity,
+                        'available': round(max(0.0, bucket.headroom(now) * bucket.capacity), 2),
+                        'blocked_for': round(max(0.0, bucket.blocked_until - now), 2),
+                    }
+                    for name, bucket in buckets.items()
+                }
+            return {'max_wait': self.max_wait, 'keys': keys, **self.stats}
+
+
+# Global instance for easy access
+key_rate_limiter = KeyRateLimiter(shared=shared_state)
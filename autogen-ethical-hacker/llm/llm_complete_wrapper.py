@@ -1,15 +1,8 @@
 import asyncio
-class LLMCompleteWrapper:
-    """Wraps llm_complete function to provide model_info property and async callable interface, with Gemini 1.5 Pro fallback."""
-    def __init__(self, provider="groq", model=None):
-        self.provider = provider
-        self.model = model or ("openai/gpt-oss-120b" if provider == "groq" else "gemini-1.5-pro")
-        self._model_info = {
-            "provider": self.provider,
-            "model": self.model,
-            "function_calling": True,
-            "vision": False
-        }
+from llm.async_llm_router import async_llm_router
+from llm.autogen_client import RouterChatCompletionClient
+class LLMCompleteWrapper(RouterChatCompletionClient):
+    """Router-backed AutoGen model client that can also be called directly with a prompt, with Gemini 1.5 Pro fallback."""
     def _ensure_str_prompt(self, prompt):
         # If prompt is a list of dicts (messages), join their content
         if isinstance(prompt, list):
@@ -20,37 +13,11 @@ class LLMCompleteWrapper:
             return str(prompt['content'])
         return str(prompt)
     async def __call__(self, prompt, **kwargs):
-        # Remove unsupported args
-        unsupported = [
-            'cancellation_token', 'json_output', 'extra_create_args', 'tools', 'tool_choice'
-        ]
-        for key in unsupported:
-            kwargs.pop(key, None)
+        # Plain text in, text out; create() is the full ChatCompletionClient interface
         prompt = self._ensure_str_prompt(prompt)
-        from llm.llm_router import llm_complete
-        loop = asyncio.get_event_loop()
         try:
-            result = await loop.run_in_executor(None, llm_complete, prompt, self.provider, self.model, **kwargs)
-            if result:
-                return result
-        except Exception:
-            pass
-        # Fallback to Gemini 1.5 Pro if Groq fails
-        try:
-            result = await loop.run_in_executor(None, llm_complete, prompt, "gemini", "gemini-1.5-pro", **kwargs)
-            return result
+            return await async_llm_router.complete(prompt, self.provider, self.model, **kwargs)
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             return f"[LLM Error] Both Groq and Gemini 1.5 Pro failed: {e}"
-    async def create(self, *args, **kwargs):
-        # Remove unsupported args
-        unsupported = [
-            'cancellation_token', 'json_output', 'extra_create_args', 'tools', 'tool_choice'
-        ]
-        for key in unsupported:
-            kwargs.pop(key, None)
-        if args:
-            args = (self._ensure_str_prompt(args[0]),) + args[1:]
-        return await self.__call__(*args, **kwargs)
-    @property
-    def model_info(self):
-        return self._model_info
@@ -1,43 +1,299 @@
 """
-LLM Router: Unified interface for Groq and Gemini LLMs.
+LLM Router: Unified interface for Groq and Gemini LLMs, plus the local CPU model ("local").
 Chooses provider based on argument or fallback order.
 """
 import os
-from groq import Groq
-import google.generativeai as genai
+from llm.response_cache import response_cache, make_cache_key
+from llm.semantic_cache import semantic_cache
+from llm.client_pool import client_registry
+from llm.single_flight import single_flight
+from llm.stream_metrics import stream_metrics
+from llm.cassette import llm_cassette
+from llm.telemetry import llm_telemetry
+from llm.output_budget import output_budget, normalize_finish_reason
+from llm.local_backend import local_backend
+from llm.request_scheduler import request_scheduler
+from llm.cost_ledger import cost_ledger, BudgetExceededError
 
-def llm_complete(prompt, provider="groq", model=None, **kwargs):
-    """Unified LLM completion for Groq (streaming, openai/gpt-oss-120b) and Gemini."""
-    if provider == "groq":
-        api_key = os.environ.get("GROQ_API_KEY")
-        if not api_key:
-            raise RuntimeError("GROQ_API_KEY not set")
-        client = Groq(api_key=api_key)
-        model = model or "openai/gpt-oss-120b"
+def _groq_request(model, kwargs):
+    """
+    Resolve the Groq API key, model and generation parameters for a call: the parameters that
+    address the caches and cassette, and the ones sent (which carry the predicted output limit).
+    """
+    api_key = kwargs.get("api_key") or os.environ.get("GROQ_API_KEY")
+    if not api_key and not llm_cassette.replaying:
+        raise RuntimeError("GROQ_API_KEY not set")
+    # Over the engagement's soft budget the cheaper sibling model answers
+    model = cost_ledger.model_for("groq", model or "openai/gpt-oss-120b")
+    params = {
+        "temperature": kwargs.get("temperature", 1),
+        "max_completion_tokens": kwargs.get("max_completion_tokens", 8192),
+        "top_p": kwargs.get("top_p", 1),
+        "reasoning_effort": kwargs.get("reasoning_effort", "medium"),
+        "stop": kwargs.get("stop", None),
+    }
+    if kwargs.get("system"):
+        params["system"] = kwargs["system"]
+    if kwargs.get("response_format"):
+        # e.g. {"type": "json_object"} for Groq's JSON mode
+        params["response_format"] = kwargs["response_format"]
+    request_params = params
+    if "max_completion_tokens" not in kwargs:
+        # Sized from this call site's history of answer lengths; truncated answers are continued
+        request_params = {**params, "max_completion_tokens": output_budget.limit("groq", model, 8192)}
+    return api_key, model, params, request_params
+
+def _gemini_request(model, kwargs=None):
+    kwargs = kwargs or {}
+    api_key = kwargs.get("api_key") or os.environ.get("GEMINI_API_KEY")
+    if not api_key and not llm_cassette.replaying:
+        raise RuntimeError("GEMINI_API_KEY not set")
+    # Gemini's JSON mode is a response MIME type rather than a request parameter
+    params = {"response_format": "application/json"} if kwargs.get("json_schema") else None
+    return api_key, cost_ledger.model_for("gemini", model or "gemini-1.5-pro"), params, params
+
+def _local_request(model, kwargs):
+    """Generation parameters for the local GGUF model (no key, no network): cache-key and sent."""
+    model = model or local_backend.model_name
+    max_tokens = kwargs.get("max_completion_tokens", kwargs.get("max_tokens"))
+    params = {"temperature": kwargs.get("temperature", 0.2), "max_tokens": max_tokens or 1024, "stop": kwargs.get("stop")}
+    if max_tokens:
+        return model, params, params
+    return model, params, {**params, "max_tokens": output_budget.limit("local", model, 1024)}
+
+def _stream_local(api_key, model, prompt, params, meta=None):
+    """Yield local model tokens, recording time-to-first-token."""
+    recorder = stream_metrics.start("local", model)
+    try:
+        for token in local_backend.stream(prompt, params["max_tokens"], params["temperature"], params["stop"], meta):
+            recorder.on_token(token)
+            yield token
+    except GeneratorExit:
+        recorder.finish()
+        raise
+    except Exception as e:
+        recorder.finish(e)
+        raise
+    recorder.finish()
+
+def _stream_groq(api_key, model, prompt, params, meta=None):
+    """Yield Groq deltas as they arrive, recording time-to-first-token (and the finish reason in meta)."""
+    params = dict(params)
+    messages = [{"role": "user", "content": prompt}]
+    if params.get("system"):
+        messages.insert(0, {"role": "system", "content": params.pop("system")})
+    recorder = stream_metrics.start("groq", model)
+    try:
+        client = client_registry.get_groq_client(api_key)
         completion = client.chat.completions.create(
             model=model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=kwargs.get("temperature", 1),
-            max_completion_tokens=kwargs.get("max_completion_tokens", 8192),
-            top_p=kwargs.get("top_p", 1),
-            reasoning_effort=kwargs.get("reasoning_effort", "medium"),
+            messages=messages,
             stream=True,
-            stop=kwargs.get("stop", None)
+            # Token usage arrives in the final chunk
+            extra_body={"stream_options": {"include_usage": True}},
+            **params
         )
-        result = ""
         for chunk in completion:
-            result += chunk.choices[0].delta.content or ""
+            usage = chunk.usage or getattr(chunk.x_groq, "usage", None)
+            if usage is not None and meta is not None:
+                meta["usage"] = {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens}
+            if not chunk.choices:
+                continue
+            token = chunk.choices[0].delta.content or ""
+            if chunk.choices[0].finish_reason and meta is not None:
+                meta["finish_reason"] = normalize_finish_reason(chunk.choices[0].finish_reason)
+            if token:
+                recorder.on_token(token)
+                yield token
+    except GeneratorExit:
+        # Consumer stopped early (e.g. a parser had enough); not a provider error
+        recorder.finish()
+        raise
+    except Exception as e:
+        recorder.finish(e)
+        raise
+    recorder.finish()
+
+def _stream_gemini(api_key, model, prompt, params=None, meta=None):
+    """Yield Gemini chunks as they arrive, recording time-to-first-token (and the finish reason in meta)."""
+    recorder = stream_metrics.start("gemini", model)
+    generation_config = {"response_mime_type": params["response_format"]} if params else None
+    try:
+        client = client_registry.get_genai_model(api_key, model)
+        for chunk in client.generate_content(prompt, generation_config=generation_config, stream=True):
+            if chunk.candidates and chunk.candidates[0].finish_reason and meta is not None:
+                meta["finish_reason"] = normalize_finish_reason(chunk.candidates[0].finish_reason)
+            usage = getattr(chunk, "usage_metadata", None)
+            if usage is not None and usage.candidates_token_count and meta is not None:
+                meta["usage"] = {"prompt_tokens": usage.prompt_token_count, "completion_tokens": usage.candidates_token_count}
+            token = chunk.text or ""
+            if token:
+                recorder.on_token(token)
+                yield token
+    except GeneratorExit:
+        # Consumer stopped early (e.g. a parser had enough); not a provider error
+        recorder.finish()
+        raise
+    except Exception as e:
+        recorder.finish(e)
+        raise
+    recorder.finish()
+
+def llm_stream(prompt, provider="groq", model=None, **kwargs):
+    """Yield completion tokens as they arrive (cached responses are yielded in one piece)."""
+    use_cache = kwargs.pop("use_cache", True)
+    call = llm_telemetry.call(provider, model, prompt)
+    parts = []
+    # The active call for the whole stream, so caches, scheduler and cost ledger annotate it
+    with call:
+        try:
+            try:
+                yield from _stream(call, parts, prompt, provider, model, use_cache, kwargs)
+            except BudgetExceededError:
+                # Past the engagement's hard budget paid providers are refused before the first token
+                if parts or provider == "local" or not local_backend.available:
+                    raise
+                call.note(provider="local")
+                yield from _stream(call, parts, prompt, "local", None, use_cache, kwargs)
+        except Exception as e:
+            call.finish(e)
+            raise
+        finally:
+            call.finish(result="".join(parts))
+
+def _stream(call, parts, prompt, provider, model, use_cache, kwargs):
+    if provider == "groq":
+        api_key, model, params, request_params = _groq_request(model, kwargs)
+        stream_fn = _stream_groq
+    elif provider == "gemini":
+        api_key, model, params, request_params = _gemini_request(model, kwargs)
+        stream_fn = _stream_gemini
+    elif provider == "local":
+        api_key = None
+        model, params, request_params = _local_request(model, kwargs)
+        stream_fn = _stream_local
+    else:
+        raise ValueError(f"Unknown provider: {provider}")
+    call.note(model=model)
+    if use_cache:
+        cached = response_cache.get(provider, model, prompt, params)
+        if cached is None:
+            cached = semantic_cache.get(provider, model, prompt, params)
+        if cached is not None:
+            call.note(cache_hit=True)
+            parts.append(cached)
+            yield cached
+            return
+    def open_stream(text, meta):
+        yield from llm_cassette.stream(provider, model, text, params,
+                                       lambda: stream_fn(api_key, model, text, request_params, meta), meta)
+        llm_telemetry.note_usage(**meta.get("usage", {}))
+    # Answers cut off at the output limit continue in the same stream
+    tokens = output_budget.stream(prompt, open_stream)
+    # The scheduler slot is held until the stream ends, so queued work waits its turn
+    with request_scheduler.slot(provider, bind=False):
+        try:
+            for token in tokens:
+                call.on_token(token)
+                parts.append(token)
+                yield token
+        finally:
+            # Closing this generator early (e.g. a parser has what it needs) ends the provider stream now
+            tokens.close()
+    if use_cache:
+        response_cache.put(provider, model, prompt, "".join(parts), params)
+        semantic_cache.put(provider, model, prompt, "".join(parts), params)
+
+def llm_complete(prompt, provider="groq", model=None, **kwargs):
+    """Unified LLM completion for Groq (streaming, openai/gpt-oss-120b) and Gemini."""
+    with llm_telemetry.call(provider, model, prompt) as call:
+        try:
+            result = _complete(prompt, provider, model, **kwargs)
+        except BudgetExceededError:
+            # Past the engagement's hard budget paid providers are refused: the local model answers
+            if provider == "local" or not local_backend.available:
+                raise
+            call.note(provider="local")
+            result = _complete(prompt, "local", None, **kwargs)
+        call.set_result(result)
         return result
+
+def _complete(prompt, provider, model, **kwargs):
+    use_cache = kwargs.pop("use_cache", True)
+    if provider == "groq":
+        api_key, model, params, request_params = _groq_request(model, kwargs)
+        llm_telemetry.note(model=model)
+        if use_cache:
+            cached = response_cache.get(provider, model, prompt, params)
+            if cached is None:
+                cached = semantic_cache.get(provider, model, prompt, params)
+            if cached is not None:
+                llm_telemetry.note(cache_hit=True)
+                return cached
+        def fetch(text):
+            meta = {}
+            result = "".join(llm_cassette.stream(provider, model, text, params,
+                                                 lambda: _stream_groq(api_key, model, text, request_params, meta), meta))
+            llm_telemetry.note_usage(**meta.get("usage", {}))
+            return result, meta.get("finish_reason")
+        def call():
+            # Answers cut off at the output limit are continued and joined
+            with request_scheduler.slot(provider):
+                result = output_budget.complete(prompt, fetch)
+            if use_cache:
+                response_cache.put(provider, model, prompt, result, params)
+                semantic_cache.put(provider, model, prompt, result, params)
+            return result
+        # Identical concurrent requests share one API call
+        return single_flight.do(make_cache_key(provider, model, prompt, params), call)
     elif provider == "gemini":
-        api_key = os.environ.get("GEMINI_API_KEY")
-        if not api_key:
-            raise RuntimeError("GEMINI_API_KEY not set")
-        client = genai.Client()
-        model = model or "gemini-1.5-pro"
-        response = client.models.generate_content(
-            model=model,
-            contents=prompt
-        )
-        return response.text
+        api_key, model, _, _ = _gemini_request(model, kwargs)
+        llm_telemetry.note(model=model)
+        if use_cache:
+            cached = response_cache.get(provider, model, prompt)
+            if cached is None:
+                cached = semantic_cache.get(provider, model, prompt)
+            if cached is not None:
+                llm_telemetry.note(cache_hit=True)
+                return cached
+        def fetch(text):
+            meta = {}
+            def generate():
+                response = client_registry.get_genai_model(api_key, model).generate_content(text)
+                if response.candidates:
+                    meta["finish_reason"] = normalize_finish_reason(response.candidates[0].finish_reason)
+                usage = getattr(response, "usage_metadata", None)
+                if usage is not None:
+                    meta["usage"] = {"prompt_tokens": usage.prompt_token_count, "completion_tokens": usage.candidates_token_count}
+                return response.text
+            result = llm_cassette.complete(provider, model, text, None, generate, meta)
+            llm_telemetry.note_usage(**meta.get("usage", {}))
+            return result, meta.get("finish_reason")
+        def call():
+            with request_scheduler.slot(provider):
+                text = output_budget.complete(prompt, fetch)
+            if use_cache:
+                response_cache.put(provider, model, prompt, text)
+                semantic_cache.put(provider, model, prompt, text)
+            return text
+        return single_flight.do(make_cache_key(provider, model, prompt), call)
+    elif provider == "local":
+        model, params, request_params = _local_request(model, kwargs)
+        llm_telemetry.note(model=model)
+        if use_cache:
+            cached = response_cache.get(provider, model, prompt, params)
+            if cached is not None:
+                llm_telemetry.note(cache_hit=True)
+                return cached
+        def fetch(text):
+            meta = {}
+            return "".join(_stream_local(None, model, text, request_params, meta)), meta.get("finish_reason")
+        def call():
+            with request_scheduler.slot(provider):
+                result = output_budget.complete(prompt, fetch)
+            if use_cache:
+                response_cache.put(provider, model, prompt, result, params)
+            return result
+        return single_flight.do(make_cache_key(provider, model, prompt, params), call)
     else:
         raise ValueError(f"Unknown provider: {provider}")
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+🖥️ Local CPU Model Backend
+Runs a small quantized GGUF model on CPU (llama-cpp-python) in a warm worker process:
+last-resort failover when every remote provider is down and the fast path for cheap tasks
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import argparse
+import itertools
+import importlib.util
+import statistics
+import subprocess
+import threading
+import logging
+from pathlib import Path
+from typing import Dict, Any, Optional, Iterator, List
+
+from llm.response_cache import PROJECT_ROOT
+from llm.telemetry import LogHistogram
+
+DEFAULT_MODEL_DIR = PROJECT_ROOT / "models"
+
+
+class LocalBackendError(Exception):
+    """Raised when the local model is unavailable, fails, or its worker dies"""
+
+
+def _worker_main(model_path: str, n_ctx: int, n_threads: int):
+    """
+    Worker process (python -m llm.local_backend --worker): loads the model on the first request
+    and keeps it in memory. JSON lines {"op": "generate"|"cancel"|"shutdown", ...} arrive on
+    stdin; [kind, request_id, value] lines with kind loaded/token/done/error go to stdout.
+    """
+    # Anything the runtime prints must not corrupt the protocol: fd 1 becomes stderr
+    out = os.fdopen(os.dup(1), 'w')
+    os.dup2(2, 1)
+
+    def send(kind, request_id, value):
+        out.write(json.dumps([kind, request_id, value]) + "\n")
+        out.flush()
+
+    inbox = queue.Queue()
+
+    def read():
+        for line in sys.stdin:
+            if line.strip():
+                inbox.put(json.loads(line))
+        inbox.put({'op': 'shutdown'})
+    threading.Thread(target=read, daemon=True).start()
+
+    llm = None
+    # Requests that arrived while another was generating; they run in arrival order
+    backlog = []
+    while True:
+        message = backlog.pop(0) if backlog else inbox.get()
+        if message['op'] == 'shutdown':
+            break
+        if message['op'] != 'generate':
+            # A cancel for a request that already finished
+            continue
+        request_id = message['id']
+        try:
+            if llm is None:
+                from llama_cpp import Llama
+                started = time.monotonic()
+                llm = Llama(model_path=model_path, n_ctx=n_ctx, n_threads=n_threads, n_gpu_layers=0, verbose=False)
+                send('loaded', request_id, time.monotonic() - started)
+            finish_reason = None
+            completion = llm.create_chat_completion(
+                messages=[{'role': 'user', 'content': message['prompt']}], stream=True,
+                max_tokens=message.get('max_tokens'), temperature=message.get('temperature', 0.2),
+                stop=message.get('stop'),
+            )
+            for chunk in completion:
+                choice = chunk['choices'][0]
+                text = (choice.get('delta') or {}).get('content')
+                if text:
+                    send('token', request_id, text)
+                finish_reason = choice.get('finish_reason') or finish_reason
+                cancelled = False
+                while not inbox.empty():
+                    incoming = inbox.get()
+                    if incoming['op'] == 'shutdown':
+                        return
+                    if incoming['op'] == 'generate':
+                        backlog.append(incoming)
+                    elif incoming['id'] == request_id:
+                        cancelled = True
+                    elif any(queued['id'] == incoming['id'] for queued in backlog):
+                        # Cancelled while still queued: it never starts
+                        backlog[:] = [queued for queued in backlog if queued['id'] != incoming['id']]
+                        send('done', incoming['id'], 'cancelled')
+                if cancelled:
+                    finish_reason = 'cancelled'
+                    break
+            send('done', request_id, finish_reason)
+        except Exception as e:
+            send('error', request_id, f"{type(e).__name__}: {e}")
+
+
+class LocalModelBackend:
+    """
+    Enabled when a GGUF file is configured (LLM_LOCAL_MODEL_PATH, or the first *.gguf in models/)
+    and llama-cpp-python is installed. Nothing is loaded until the first request; the worker
+    process then keeps the model warm. One request runs at a time, using LLM_LOCAL_THREADS cores;
+    concurrent requests queue in the worker and each reads its own replies.
+    """
+
+    def __init__(self, model_path: Optional[str] = None, n_ctx: Optional[int] = None,
+                 n_threads: Optional[int] = None, timeout: Optional[float] = None, enabled: Optional[bool] = None):
+        if enabled is None:
+            enabled = os.environ.get("LLM_LOCAL_DISABLED", "").lower() not in ("1", "true", "yes")
+        self.enabled = enabled
+        self.model_path = model_path or os.environ.get("LLM_LOCAL_MODEL_PATH") or self._find_model()
+        self.n_ctx = int(n_ctx or os.environ.get("LLM_LOCAL_CTX", 4096))
+        self.n_threads = int(n_threads or os.environ.get("LLM_LOCAL_THREADS", max(1, (os.cpu_count() or 2) // 2)))
+        self.timeout = float(timeout or os.environ.get("LLM_LOCAL_TIMEOUT", 300))
+
+        self._lock = threading.RLock()
+        self._process = None
+        # Per worker process: a reply queue per request id, and the request the worker is generating for
+        self._routes = {}
+        self._worker_state = {'active': None}
+        self._ids = itertools.count(1)
+        self.load_time = None
+        self.latency_ms = LogHistogram()
+        self.tokens_per_s = LogHistogram()
+        self.stats = {'requests': 0, 'errors': 0, 'tokens': 0, 'worker_starts': 0}
+
+        self.setup_logging()
+
+    def setup_logging(self):
+        """Setup logging for the local backend"""
+        self.logger = logging.getLogger('LocalModelBackend')
+        if not self.logger.handlers:
+            handler = logging.StreamHandler()
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+
+    @staticmethod
+    def _find_model() -> Optional[str]:
+        models = sorted(DEFAULT_MODEL_DIR.glob("*.gguf")) if DEFAULT_MODEL_DIR.is_dir() else []
+        return str(models[0]) if models else None
+
+    @property
+    def model_name(self) -> str:
+        return Path(self.model_path).stem if self.model_path else 'local'
+
+    @property
+    def available(self) -> bool:
+        """Configured and runnable; checked without importing the runtime or loading the model"""
+        return bool(self.enabled and self.model_path and os.path.exists(self.model_path)
+                    and importlib.util.find_spec('llama_cpp') is not None)
+
+    # -- worker -----------------------------------------------------------------
+
+    def _ensure_worker(self):
+        if self._process is not None and self._process.poll() is None:
+            return
+        if not self.available:
+            raise LocalBackendError("Local model unavailable: set LLM_LOCAL_MODEL_PATH to a GGUF file and install llama-cpp-python")
+        # A separate interpreter: no provider clients, threads or sockets are inherited, and
+        # unlike multiprocessing spawn it never re-imports the caller's main script
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(PROJECT_ROOT), env.get('PYTHONPATH')]))
+        self._process = subprocess.Popen(
+            [sys.executable, '-m', 'llm.local_backend', '--worker', self.model_path,
+             '--ctx', str(self.n_ctx), '--threads', str(self.n_threads)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1, cwd=str(PROJECT_ROOT), env=env
+        )
+        self._routes = {}
+        self._worker_state = {'active': None}
+        threading.Thread(target=self._read_worker, args=(self._process, self._routes, self._worker_state),
+                         name='llm-local-reader', daemon=True).start()
+        self.stats['worker_starts'] += 1
+        self.logger.info(f"🖥️ Local model worker started for {self.model_name} ({self.n_threads} threads)")
+
+    @staticmethod
+    def _read_worker(process, routes: Dict[int, "queue.Queue"], state: Dict[str, Any]):
+        for line in process.stdout:
+            try:
+                kind, request_id, value = json.loads(line)
+            except ValueError:
+                continue
+            state['active'] = None if kind in ('done', 'error') else request_id
+            inbox = routes.get(request_id)
+            if inbox is not None:
+                inbox.put((kind, value))
+        for inbox in list(routes.values()):
+            inbox.put(None)
+
+    def _send(self, message: Dict[str, Any]):
+        try:
+            self._process.stdin.write(json.dumps(message) + "\n")
+            self._process.stdin.flush()
+        except (OSError, ValueError) as e:
+            self._stop_worker()
+            raise LocalBackendError(f"Local model worker unreachable: {e}")
+
+    def _receive(self, process, inbox: "queue.Queue", request_id: int, state: Dict[str, Any]):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                item = inbox.get(timeout=max(0.0, deadline - time.monotonic()))
+                break
+            except queue.Empty:
+                if state['active'] not in (None, request_id):
+                    # Queued behind another request: the timeout runs once the worker is on this one
+                    deadline = time.monotonic() + self.timeout
+                    continue
+                self._stop_worker(process)
+                raise LocalBackendError(f"Local model timed out after {self.timeout:.0f}s")
+        if item is None:
+            self._stop_worker(process)
+            raise LocalBackendError("Local model worker exited")
+        return item
+
+    def _stop_worker(self, process=None):
+        """Shut the worker down; given `process`, only if that is still the current worker"""
+        with self._lock:
+            if process is not None and process is not self._process:
+                return
+            process, self._process = self._process, None
+        if process is None:
+            return
+        try:
+            process.stdin.write(json.dumps({'op': 'shutdown'}) + "\n")
+            process.stdin.close()
+        except (OSError, ValueError):
+            pass
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    # -- generation -------------------------------------------------------------
+
+    def stream(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.2,
+               stop: Optional[List[str]] = None, meta: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+        """
+        Yield tokens as the local model produces them; meta gets the finish reason. The lock is
+        only held while the request is sent, so a consumer that pauses, or never closes the
+        generator, does not block other callers: their requests queue in the worker.
+        """
+        with self._lock:
+            self._ensure_worker()
+            process, routes, state = self._process, self._routes, self._worker_state
+            request_id = next(self._ids)
+            inbox = routes[request_id] = queue.Queue()
+            try:
+                self._send({'op': 'generate', 'id': request_id, 'prompt': prompt,
+                            'max_tokens': max_tokens, 'temperature': temperature, 'stop': stop})
+            except LocalBackendError:
+                routes.pop(request_id, None)
+                raise
+            self.stats['requests'] += 1
+        started = time.monotonic()
+        tokens = 0
+        finished = False
+        try:
+            while True:
+                kind, value = self._receive(process, inbox, request_id, state)
+                if kind == 'loaded':
+                    self.load_time = value
+                    self.logger.info(f"🖥️ Local model loaded in {value:.1f}s")
+                    started = time.monotonic()
+                elif kind == 'token':
+                    tokens += 1
+                    yield value
+                elif kind == 'done':
+                    finished = True
+                    if meta is not None:
+                        meta['finish_reason'] = value
+                    break
+                elif kind == 'error':
+                    finished = True
+                    with self._lock:
+                        self.stats['errors'] += 1
+                    raise LocalBackendError(value)
+        finally:
+            if not finished and process.poll() is None:
+                # Consumer stopped early: have the worker stop, and drain what it already sent
+                try:
+                    with self._lock:
+                        if self._process is process:
+                            self._send({'op': 'cancel', 'id': request_id})
+                    while self._receive(process, inbox, request_id, state)[0] not in ('done', 'error'):
+                        pass
+                except LocalBackendError:
+                    pass
+            routes.pop(request_id, None)
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self.stats['tokens'] += tokens
+                self.latency_ms.record(elapsed * 1000)
+                if tokens and elapsed > 0:
+                    self.tokens_per_s.record(tokens / elapsed)
+
+    def complete(self, prompt: str, max_tokens: int = 1024, temperature: float = 0.2,
+                 stop: Optional[List[str]] = None, meta: Optional[Dict[str, Any]] = None) -> str:
+        return "".join(self.stream(prompt, max_tokens, temperature, stop, meta))
+
+    def warm_up(self):
+        """Start the worker and load the model now instead of on the first real request"""
+        self.complete("ok", max_tokens=1)
+
+    def close(self):
+        with self._lock:
+            self._stop_worker()
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get configuration, warm state and throughput"""
+        return {
+            'enabled': self.enabled,
+            'available': self.available,
+            'model_path': self.model_path,
+            'n_threads': self.n_threads,
+            'worker_alive': self._process is not None and self._process.poll() is None,
+            'load_time_s': round(self.load_time, 2) if self.load_time is not None else None,
+            'latency_ms': self.latency_ms.summary(),
+            'tokens_per_s': self.tokens_per_s.summary(),
+            **self.stats,
+        }
+
+
+def benchmark_backends(prompts: List[str], providers=("local", "groq", "gemini"), runs: int = 1,
+                       max_tokens: int = 256) -> Dict[str, Any]:
+    """
+    Stream every prompt through each provider (caches bypassed) and compare TTFT, latency and
+    output throughput. Providers that are not configured are reported with their error.
+    """
+    from llm.llm_router import llm_stream
+
+    results = {}
+    for provider in providers:
+        ttfts, latencies, rates, errors = [], [], [], []
+        for _ in range(runs):
+            for prompt in prompts:
+                started = time.monotonic()
+                first = None
+                chunks = 0
+                try:
+                    for token in llm_stream(prompt, provider=provider, use_cache=False, max_tokens=max_tokens,
+                                            max_completion_tokens=max_tokens):
+                        if first is None:
+                            first = time.monotonic() - started
+                        chunks += 1
+                except Exception as e:
+                    errors.append(str(e)[:200])
+                    continue
+                elapsed = time.monotonic() - started
+                latencies.append(elapsed)
+                ttfts.append(first if first is not None else elapsed)
+                rates.append(chunks / elapsed if elapsed else 0.0)
+        results[provider] = {
+            'requests': len(latencies),
+            'errors': errors[:3],
+            'ttft_s_p50': round(statistics.median(ttfts), 3) if ttfts else None,
+            'latency_s_p50': round(statistics.median(latencies), 3) if latencies else None,
+            'latency_s_max': round(max(latencies), 3) if latencies else None,
+            'chunks_per_s': round(statistics.mean(rates), 1) if rates else None,
+        }
+    return results
+
+
+# Global instance for easy access
+local_backend = LocalModelBackend()
+atexit.register(local_backend.close)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the local GGUF backend against the remote providers")
+    parser.add_argument("--worker", metavar="MODEL_PATH", help=argparse.SUPPRESS)
+    parser.add_argument("--ctx", type=int, default=4096, help=argparse.SUPPRESS)
+    parser.add_argument("--threads", type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument("--providers", default="local,groq,gemini")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--max-tokens", type=int, default=256)
+    parser.add_argument("prompts", nargs="*", default=[
+        "Extract every IP address and port from: 10.0.0.5:22 open ssh, 10.0.0.7:443 open https",
+        "Classify this finding as low, medium, high or critical: anonymous FTP login allowed",
+    ])
+    args = parser.parse_args()
+    if args.worker:
+        _worker_main(args.worker, args.ctx, args.threads)
+        sys.exit(0)
+    for name, row in benchmark_backends(args.prompts, args.providers.split(","), args.runs, args.max_tokens).items():
+        print(f"[local_backend] {name}: {row}")
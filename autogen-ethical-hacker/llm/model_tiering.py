@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+🪜 Task-Aware Model Tiering
+Maps task classes (extraction, classification, explanation, risk analysis, ...) to model tiers
+with matching reasoning effort and output budget, escalates to the next tier when the cheaper
+model's answer fails validation, and reports the latency and cost saved against the large tier
+"""
+
+import os
+import copy
+import json
+import time
+import threading
+import logging
+from pathlib import Path
+from typing import Dict, Any, Optional, Callable, List
+
+from llm.response_cache import PROJECT_ROOT
+from llm.prompt_compaction import count_tokens
+from llm.telemetry import llm_telemetry
+from llm.local_backend import local_backend
+from llm.cost_ledger import cost_ledger
+
+DEFAULT_ENGAGEMENT_PATH = PROJECT_ROOT / "config" / "lab_scope.json"
+
+# Cheapest first; escalation walks this order
+TIER_ORDER = ('local', 'small', 'large')
+
+DEFAULT_TIERS = {
+    # The CPU model in llm.local_backend; skipped while no GGUF model is configured
+    'local': {
+        'provider': 'local',
+        'models': {},
+        'max_completion_tokens': 512,
+    },
+    'small': {
+        'models': {'groq': 'openai/gpt-oss-20b', 'gemini': 'gemini-1.5-flash'},
+        'reasoning_effort': 'low',
+        'max_completion_tokens': 1024,
+    },
+    'large': {
+        'models': {'groq': 'openai/gpt-oss-120b', 'gemini': 'gemini-1.5-pro'},
+        'reasoning_effort': 'medium',
+        'max_completion_tokens': 8192,
+    },
+}
+
+DEFAULT_TASK_TIERS = {
+    'health_check': 'small',
+    'explain': 'small',
+    'extraction': 'local',
+    'classification': 'local',
+    'compliance_mapping': 'small',
+    'summary': 'small',
+    'risk_analysis': 'large',
+    'compliance_report': 'large',
+    'report': 'large',
+    'planning': 'large',
+}
+
+# Per-task settings applied on top of the tier. A liveness probe needs a handful of tokens, so it
+# runs on non-reasoning models: a reasoning model would spend so small a budget before answering
+DEFAULT_TASK_OVERRIDES = {
+    'health_check': {
+        'models': {'groq': 'llama-3.1-8b-instant', 'gemini': 'gemini-1.5-flash'},
+        'reasoning_effort': None,
+        'max_completion_tokens': 32,
+    },
+}
+
+# Provider aliases used by the different routers
+PROVIDER_ALIASES = {'google': 'gemini'}
+
+
+def _is_error_text(text: Any) -> bool:
+    """Routers that swallow failures return 'Error: ...' strings instead of raising"""
+    return not isinstance(text, str) or not text.strip() or text.lstrip().startswith("Error:")
+
+
+class ModelTieringPolicy:
+    """
+    Policy comes from the "model_tiers" section of the engagement config (config/lab_scope.json,
+    or the file named by LLM_MODEL_TIERS), e.g.
+        {"default_tier": "large", "tasks": {"explain": "large"}, "tiers": {"small": {"models": {...}}}}
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, engagement_path: Optional[str] = None):
+        self._lock = threading.Lock()
+        self.tiers = copy.deepcopy(DEFAULT_TIERS)
+        self.task_tiers = dict(DEFAULT_TASK_TIERS)
+        self.task_overrides = copy.deepcopy(DEFAULT_TASK_OVERRIDES)
+        self.default_tier = 'large'
+        self.source = None
+        self.stats = {}
+
+        self.setup_logging()
+        if config is not None:
+            self.configure(config)
+        else:
+            self.load(engagement_path or os.environ.get("LLM_MODEL_TIERS", str(DEFAULT_ENGAGEMENT_PATH)))
+
+    def setup_logging(self):
+        """Setup logging for model tiering"""
+        self.logger = logging.getLogger('ModelTieringPolicy')
+        if not self.logger.handlers:
+            handler = logging.StreamHandler()
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+
+    def load(self, path: str):
+        """Load the "model_tiers" section of an engagement config; a missing file keeps the defaults"""
+        path = Path(path)
+        if not path.exists():
+            return
+        try:
+            with open(path, 'r') as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"⚠️ Could not read model tiers from {path}: {e}")
+            return
+        # A dedicated policy file may hold the section itself
+        section = config.get('model_tiers', config if 'tasks' in config or 'tiers' in config else None)
+        if section:
+            self.configure(section)
+            self.source = str(path)
+
+    def configure(self, config: Dict[str, Any]):
+        """Merge tier definitions, task mappings and per-task overrides into the policy"""
+        with self._lock:
+            for name, tier in config.get('tiers', {}).items():
+                merged = self.tiers.setdefault(name, {'models': {}})
+                merged['models'] = {**merged.get('models', {}), **tier.get('models', {})}
+                merged.update({k: v for k, v in tier.items() if k != 'models'})
+            self.task_tiers.update(config.get('tasks', {}))
+            for task, overrides in config.get('overrides', {}).items():
+                self.task_overrides.setdefault(task, {}).update(overrides)
+            self.default_tier = config.get('default_tier', self.default_tier)
+            unknown = {tier for tier in [*self.task_tiers.values(), self.default_tier] if tier not in self.tiers}
+        if unknown:
+            raise ValueError(f"Unknown model tier(s): {', '.join(sorted(unknown))}")
+
+    def _order(self) -> List[str]:
+        return [t for t in TIER_ORDER if t in self.tiers] + sorted(t for t in self.tiers if t not in TIER_ORDER)
+
+    def tier_for(self, task: str) -> str:
+        return self.task_tiers.get(task, self.default_tier)
+
+    def escalation_path(self, task: str) -> List[str]:
+        """
+        The task's tier followed by every larger tier (tiers that cannot run here are skipped).
+        Over the engagement's soft (hard) LLM budget the path starts one (two) tiers lower.
+        """
+        order = self._order()
+        runnable_order = [t for t in order if self.tiers[t].get('provider') != 'local' or local_backend.available]
+        tier = self.tier_for(task)
+        steps = cost_ledger.tier_steps()
+        if steps and tier in runnable_order:
+            tier = runnable_order[max(0, runnable_order.index(tier) - steps)]
+        path = order[order.index(tier):]
+        runnable = [t for t in path if t in runnable_order]
+        return runnable or path[-1:]
+
+    def provider_for(self, tier: str, provider: str) -> str:
+        """Tiers may pin a provider (the local tier); otherwise the caller's provider is used"""
+        return self.tiers[tier].get('provider', provider)
+
+    def params(self, task: str, provider: str = "groq", tier: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Router keyword arguments for a task: model, reasoning_effort and the output budget under
+        both of its names (max_completion_tokens for Groq, max_tokens for the other routers)
+        """
+        tier = tier or self.tier_for(task)
+        spec = {**self.tiers[tier], **self.task_overrides.get(task, {})}
+        provider = spec.get('provider', provider)
+        params = {'model': spec['models'].get(PROVIDER_ALIASES.get(provider, provider))}
+        if spec.get('reasoning_effort'):
+            params['reasoning_effort'] = spec['reasoning_effort']
+        if spec.get('max_completion_tokens'):
+            params['max_completion_tokens'] = params['max_tokens'] = spec['max_completion_tokens']
+        return {k: v for k, v in params.items() if v is not None}
+
+    # -- calls ------------------------------------------------------------------
+
+    def complete(self, prompt: str, task: str, provider: str = "groq",
+                 validate: Optional[Callable[[str], bool]] = None,
+                 complete_fn: Optional[Callable[..., str]] = None, **kwargs) -> str:
+        """
+        Complete on the task's tier; an exception, an error string or a failed `validate`
+        moves the request up one tier. The last tier's answer is returned whatever it is.
+        """
+        if complete_fn is None:
+            from llm.llm_router import llm_complete as complete_fn
+        attempts = []
+        path = self.escalation_path(task)
+        started = time.monotonic()
+        for tier in path:
+            params = {**self.params(task, provider, tier), **kwargs}
+            attempt_started = time.monotonic()
+            try:
+                result = complete_fn(prompt, provider=self.provider_for(tier, provider), **params)
+            except Exception as e:
+                attempts.append((tier, params.get('model'), None, time.monotonic() - attempt_started))
+                if tier == path[-1]:
+                    self._record(task, provider, prompt, attempts, time.monotonic() - started, ok=False)
+                    raise
+                self.logger.info(f"🪜 {task}: {tier} tier failed ({e}), escalating")
+                continue
+            attempts.append((tier, params.get('model'), result, time.monotonic() - attempt_started))
+            ok = not _is_error_text(result) and (validate is None or validate(result))
+            if ok or tier == path[-1]:
+                self._record(task, provider, prompt, attempts, time.monotonic() - started, ok)
+                return result
+            self.logger.info(f"🪜 {task}: {tier} tier answer failed validation, escalating")
+
+    def complete_many(self, prompts: List[str], task: str, provider: str = "groq",
+                      validate: Optional[Callable[[str], bool]] = None, **kwargs) -> list:
+        """
+        Batch counterpart of complete(): every prompt runs on the task's tier and only the items
+        that failed or did not validate are re-batched on the next tier. Returns BatchResults in order.
+        """
+        from llm.async_llm_router import llm_complete_many
+        prompts = list(prompts)
+        path = self.escalation_path(task)
+        results = [None] * len(prompts)
+        attempts = [[] for _ in prompts]
+        elapsed = [0.0] * len(prompts)
+        pending = list(range(len(prompts)))
+        for tier in path:
+            params = {**self.params(task, provider, tier), **kwargs}
+            batch_started = time.monotonic()
+            if self.provider_for(tier, provider) == 'local':
+                # One CPU worker: run the items one after another
+                batch = self._run_local([prompts[i] for i in pending], params)
+            else:
+                batch = llm_complete_many([prompts[i] for i in pending], provider=provider, **params)
+            batch_elapsed = time.monotonic() - batch_started
+            retry = []
+            for index, item in zip(pending, batch):
+                item.index = index
+                results[index] = item
+                elapsed[index] += batch_elapsed
+                attempts[index].append((tier, params.get('model'), item.result if item.ok else None, batch_elapsed))
+                if not (item.ok and not _is_error_text(item.result) and (validate is None or validate(item.result))):
+                    retry.append(index)
+            if not retry or tier == path[-1]:
+                break
+            self.logger.info(f"🪜 {task}: escalating {len(retry)}/{len(pending)} item(s) past the {tier} tier")
+            pending = retry
+        for index, item in enumerate(results):
+            self._record(task, provider, prompts[index], attempts[index], elapsed[index],
+                         item.ok and (validate is None or validate(item.result)))
+        return results
+
+    @staticmethod
+    def _run_local(prompts: List[str], params: Dict[str, Any]) -> list:
+        from llm.llm_router import llm_complete
+        from llm.async_llm_router import BatchResult
+        params = {k: v for k, v in params.items() if k not in ('max_concurrency', 'on_result')}
+        results = []
+        for index, prompt in enumerate(prompts):
+            try:
+                results.append(BatchResult(index, prompt, llm_complete(prompt, provider='local', **params)))
+            except Exception as e:
+                results.append(BatchResult(index, prompt, error=e))
+        return results
+
+    def structured(self, prompt: str, schema: Dict[str, Any], task: str = "extraction",
+                   provider: str = "groq", **kwargs):
+        """structured_complete() on the task's tier, escalating while the object stays invalid"""
+        from llm.structured_output import structured_complete
+        attempts = []
+        path = self.escalation_path(task)
+        started = time.monotonic()
+        for tier in path:
+            params = {**self.params(task, provider, tier), **kwargs}
+            attempt_started = time.monotonic()
+            try:
+                result = structured_complete(prompt, schema, provider=self.provider_for(tier, provider), **params)
+            except Exception as e:
+                attempts.append((tier, params.get('model'), None, time.monotonic() - attempt_started))
+                if tier == path[-1]:
+                    self._record(task, provider, prompt, attempts, time.monotonic() - started, ok=False)
+                    raise
+                self.logger.info(f"🪜 {task}: {tier} tier failed ({e}), escalating")
+                continue
+            attempts.append((tier, params.get('model'), result.raw, time.monotonic() - attempt_started))
+            if result.valid or tier == path[-1]:
+                self._record(task, provider, prompt, attempts, time.monotonic() - started, result.valid)
+                return result
+            self.logger.info(f"🪜 {task}: {tier} tier object invalid ({len(result.errors)} error(s)), escalating")
+
+    # -- savings ----------------------------------------------------------------
+
+    def _baseline_latency(self, provider: str, model: Optional[str]) -> Optional[float]:
+        """Mean observed latency of the large tier's model, if it has been called at all"""
+        summary = llm_telemetry.get_status()['by_model'].get(f"{provider}/{model}")
+        mean_ms = summary and summary['latency_ms'].get('mean')
+        return mean_ms / 1000 if mean_ms else None
+
+    def _record(self, task: str, provider: str, prompt: str, attempts: List[tuple], elapsed: float, ok: bool):
+        """
+        Compare what the tiered attempts cost with what the same answer would have cost on the
+        large tier (token prices from telemetry; baseline latency from observed large-model calls)
+        """
+        baseline_model = self.params(task, provider, self._order()[-1]).get('model')
+        prompt_tokens = count_tokens(prompt)
+        final = attempts[-1][2] or ""
+        cost = sum(llm_telemetry.cost(model, prompt_tokens, count_tokens(text or "")) for _, model, text, _ in attempts)
+        baseline_cost = llm_telemetry.cost(baseline_model, prompt_tokens, count_tokens(final))
+        escalated_to_large = attempts[-1][1] == baseline_model
+        baseline_latency = attempts[-1][3] if escalated_to_large else self._baseline_latency(provider, baseline_model)
+
+        with self._lock:
+            stats = self.stats.setdefault(task, {
+                'calls': 0, 'escalations': 0, 'failed': 0, 'by_tier': {},
+                'cost_usd': 0.0, 'baseline_cost_usd': 0.0,
+                'latency_s': 0.0, 'baseline_latency_s': 0.0, 'latency_compared_calls': 0,
+            })
+            stats['calls'] += 1
+            stats['escalations'] += len(attempts) - 1
+            stats['failed'] += not ok
+            final_tier = attempts[-1][0]
+            stats['by_tier'][final_tier] = stats['by_tier'].get(final_tier, 0) + 1
+            stats['cost_usd'] += cost
+            stats['baseline_cost_usd'] += baseline_cost
+            # Latency is only compared once the large model has a measured latency to compare with
+            if baseline_latency is not None:
+                stats['latency_s'] += elapsed
+                stats['baseline_latency_s'] += baseline_latency
+                stats['latency_compared_calls'] += 1
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get the active policy and per-task escalation and savings figures"""
+        with self._lock:
+            tasks = {}
+            for task, s in self.stats.items():
+                tasks[task] = {
+                    **s,
+                    'tier': self.tier_for(task),
+                    'escalation_rate': s['escalations'] / s['calls'] if s['calls'] else 0.0,
+                    'cost_usd': round(s['cost_usd'], 6),
+                    'baseline_cost_usd': round(s['baseline_cost_usd'], 6),
+                    'cost_saved_usd': round(s['baseline_cost_usd'] - s['cost_usd'], 6),
+                    'latency_s': round(s['latency_s'], 3),
+                    'baseline_latency_s': round(s['baseline_latency_s'], 3),
+                    'latency_saved_s': round(s['baseline_latency_s'] - s['latency_s'], 3),
+                }
+            return {
+                'source': self.source,
+                'local_available': local_backend.available,
+                'default_tier': self.default_tier,
+                'tiers': copy.deepcopy(self.tiers),
+                'tasks': dict(self.task_tiers),
+                'cost_saved_usd': round(sum(t['cost_saved_usd'] for t in tasks.values()), 6),
+                'latency_saved_s': round(sum(t['latency_saved_s'] for t in tasks.values()), 3),
+                'by_task': tasks,
+            }
+
+
+# Global instance for easy access
+model_tiering = ModelTieringPolicy()
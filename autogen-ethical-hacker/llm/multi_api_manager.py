@@ -2,6 +2,12 @@ import time
 from autogen_agentchat.agents import AssistantAgent
 import json
 import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from llm.prompt_compaction import compact_for_prompt
+from llm.structured_output import structured_complete
+from llm.telemetry import agent_scope, current_agent
 
 
 # Load API keys from the repo-level config directory robustly
@@ -22,56 +28,175 @@ def load_apis():
 
 apis = load_apis()
 
+# Shape every ensemble answer is validated against
+ENSEMBLE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "findings": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "title": {"type": "string"},
+                    "severity": {"type": "string", "enum": ["critical", "high", "medium", "low", "info"]},
+                    "details": {"type": "string"}
+                },
+                "required": ["title", "severity"]
+            }
+        },
+        "confidence": {"type": "number", "minimum": 0, "maximum": 1}
+    },
+    "required": ["findings", "confidence"]
+}
 
-def llm_ensemble_reasoning(exploit_results):
-    responses = []
+
+# Members that must agree before the ensemble answers early (LLM_ENSEMBLE_QUORUM); default is a majority,
+# or 1 for the default two-member ensemble so it never waits for the slower model
+ENSEMBLE_QUORUM = int(os.environ.get("LLM_ENSEMBLE_QUORUM", 0))
+# Confidence a lone answer needs to stand in for the ensemble; less confident ones wait for another member
+ENSEMBLE_SOLO_CONFIDENCE = float(os.environ.get("LLM_ENSEMBLE_SOLO_CONFIDENCE", 0.7))
+ENSEMBLE_TIMEOUT = float(os.environ.get("LLM_ENSEMBLE_TIMEOUT", 120))
+DEFAULT_ENSEMBLE_MODELS = {'groq': "openai/gpt-oss-120b", 'google': "gemini-1.5-pro"}
+
+
+def ensemble_members():
+    """One member per configured provider/model; "ensemble_models" in apis.json adds models, keys rotate across them"""
+    members = []
+    for provider, router_provider in (('groq', 'groq'), ('google', 'gemini')):
+        config = apis.get(provider, {})
+        keys = config.get('api_keys') or []
+        if not keys:
+            continue
+        models = config.get('ensemble_models') or [DEFAULT_ENSEMBLE_MODELS[provider]]
+        for index, model in enumerate(models):
+            members.append({'provider': router_provider, 'model': model, 'api_key': keys[index % len(keys)]})
+    return members
+
+
+def _title_words(finding):
+    return set(re.findall(r'[a-z0-9]+', str(finding.get('title', '')).lower()))
+
+
+def findings_agreement(a, b):
+    """Share of findings two answers have in common (same severity, overlapping titles)"""
+    findings_a, findings_b = a.get('findings') or [], b.get('findings') or []
+    if not findings_a and not findings_b:
+        return 1.0
+    unmatched = list(findings_b)
+    matched = 0
+    for finding in findings_a:
+        words = _title_words(finding)
+        for candidate in unmatched:
+            other = _title_words(candidate)
+            overlap = len(words & other) / len(words | other) if words | other else 0.0
+            if finding.get('severity') == candidate.get('severity') and overlap >= 0.5:
+                unmatched.remove(candidate)
+                matched += 1
+                break
+    return matched / max(len(findings_a), len(findings_b))
+
+
+def llm_ensemble_reasoning(exploit_results, quorum=None, agreement_threshold=0.6, timeout=None,
+                           solo_confidence=None):
+    """
+    Ask every configured provider/model concurrently and answer as soon as `quorum`
+    members agree on the findings; stragglers are cancelled. Without a quorum the most
+    confident valid answer is returned with llm_consensus 0. The default quorum is a majority
+    of three or more members, and 1 for the two default members (one per provider): the first
+    answer is taken if its confidence reaches solo_confidence, otherwise the other member's
+    answer is awaited and checked for agreement.
+    """
     if not apis:
         return {'error': 'no API keys configured'}
+    members = ensemble_members()
+    if not members:
+        return {'error': 'no API keys configured'}
+    quorum = min(len(members), quorum or ENSEMBLE_QUORUM or (len(members) // 2 + 1 if len(members) > 2 else 1))
+    solo_confidence = ENSEMBLE_SOLO_CONFIDENCE if solo_confidence is None else solo_confidence
+    prompt = f"Analyze exploit results: {compact_for_prompt(exploit_results).text}. Report the findings and your confidence score (0-1)."
+    cancel = threading.Event()
+    # Pool threads have no caller frames of their own; attribute members' calls to our caller
+    agent = current_agent()
 
-    config_list = []
-    for k in apis.get('groq', []):
-        config_list.append({
-            "api_type": "groq",
-            "model": "groq/gpt-oss-120b",
-            "api_key": k,
-            "base_url": "https://api.groq.com/openai/v1"
-        })
-    for k in apis.get('gemini', []):
-        config_list.append({
-            "api_type": "google",
-            "model": "gemini-1.5-pro",
-            "api_key": k
-        })
-
-    # Create a Groq client from the first groq api key and run a completion for ensemble reasoning
-    if apis.get('groq'):
-        from groq import Groq
-        groq_client = Groq(api_key=apis.get('groq', {}).get('api_key', ''))
-        try:
-            completion = groq_client.chat.completions.create(
-                model="groq/gpt-oss-120b",
-                messages=[{"role": "user", "content": f"Analyze exploit results: {json.dumps(exploit_results)}. Return a JSON object with findings and confidence score."}],
+    def run_member(member):
+        start_time = time.time()
+        with agent_scope(agent):
+            result = structured_complete(
+                prompt,
+                ENSEMBLE_SCHEMA,
+                provider=member['provider'],
+                model=member['model'],
+                api_key=member['api_key'],
+                cancel_event=cancel,
                 temperature=1,
                 max_completion_tokens=8192,
                 top_p=1,
-                reasoning_effort="medium",
-                stream=False
+                reasoning_effort="medium"
             )
-            responses.append({'api': 'ensemble', 'response': completion.choices[0].message.content})
-        except Exception as e:
-            responses.append({'api': 'ensemble', 'error': str(e)})
-    # Ensemble voting: pick the most confident response (if available)
-    for r in responses:
-        if 'response' in r:
-            resp = r['response']
-            # If response is a string, try to parse as JSON
-            if isinstance(resp, str):
-                try:
-                    parsed = json.loads(resp)
-                    return parsed
-                except Exception:
-                    # Return as string if not JSON
-                    return {'findings': resp, 'confidence': None}
-            return resp
-    # If all failed, return collected errors for debugging
-    return {'errors': responses}
+        return result, time.time() - start_time
+
+    records = []
+    answers = []
+    answered = set()
+    winner = None
+    pool = ThreadPoolExecutor(max_workers=len(members), thread_name_prefix='llm-ensemble')
+    futures = {pool.submit(run_member, m): m for m in members}
+    try:
+        for future in as_completed(futures, timeout=timeout or ENSEMBLE_TIMEOUT):
+            member = futures[future]
+            answered.add(future)
+            record = {'provider': member['provider'], 'model': member['model']}
+            try:
+                result, latency = future.result()
+                record.update(latency=round(latency, 3), status='ok' if result.valid else 'invalid')
+                if result.valid:
+                    answers.append((record, result.data))
+            except Exception as e:
+                record.update(status='error', error=str(e))
+            records.append(record)
+
+            if record['status'] != 'ok':
+                continue
+            # Which answers agree with the newest one
+            newest = answers[-1][1]
+            agreeing = [(r, data) for r, data in answers if data is newest or findings_agreement(newest, data) >= agreement_threshold]
+            if len(agreeing) < quorum:
+                continue
+            if len(agreeing) == 1 and len(members) > 1 and (newest.get('confidence') or 0) < solo_confidence:
+                # A lone answer only stands in for the ensemble when it is confident
+                continue
+            winner = agreeing
+            break
+    except FuturesTimeout:
+        print(f"[multi_api_manager] Ensemble timed out with {len(records)}/{len(members)} members answered")
+    finally:
+        # Stragglers stop at their next streamed token; nothing waits for them
+        cancel.set()
+        pool.shutdown(wait=False)
+
+    for future, member in futures.items():
+        if future not in answered:
+            records.append({'provider': member['provider'], 'model': member['model'], 'status': 'cancelled'})
+
+    if winner is None and not answers:
+        return {'errors': records}
+    if winner is None:
+        best_record, best = max(answers, key=lambda item: item[1].get('confidence', 0))
+        agreement, agreeing_records = 0.0, [best_record]
+    else:
+        best_record, best = max(winner, key=lambda item: item[1].get('confidence', 0))
+        agreeing_records = [r for r, _ in winner]
+        agreement = len(winner) / len(members)
+    for record in records:
+        record['agrees'] = any(record is r for r in agreeing_records) if winner is not None else False
+
+    answer = dict(best)
+    answer['consensus'] = {
+        'quorum': quorum,
+        'members': records,
+        'agreeing': len(agreeing_records) if winner is not None else 0,
+        'selected': {'provider': best_record['provider'], 'model': best_record['model']},
+    }
+    # Fraction of the ensemble that agreed; 0 when no quorum was reached (feeds utils.confidence)
+    answer['llm_consensus'] = agreement
+    return answer
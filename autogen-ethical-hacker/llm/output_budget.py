@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+📏 Adaptive Output Budgets
+Learns per-call-site output length distributions from telemetry, sizes max tokens at a high
+percentile plus headroom, and continues generation when a response is cut off at the limit
+"""
+
+import os
+import threading
+import logging
+from typing import Dict, Any, Optional, Callable, Iterator, List, Tuple, Awaitable
+
+from llm.telemetry import LogHistogram, llm_telemetry, current_agent
+from llm.shared_state import shared_state
+from llm.cassette import llm_cassette
+
+# Predicted limits snap up to these steps so they stay stable (and keep response cache keys stable)
+LIMIT_LADDER = (256, 384, 512, 768, 1024, 1536, 2048, 3072, 4096, 6144, 8192, 12288, 16384)
+
+# Models that spend completion tokens on hidden reasoning: their answer text undercounts what the limit must cover
+REASONING_MODEL_PREFIXES = ('gpt-oss', 'o1', 'o3', 'o4', 'deepseek-r1', 'qwq', 'qwen3')
+
+CONTINUE_INSTRUCTION = ("Your previous response was cut off at the output token limit. Continue it exactly "
+                        "where it stops, without repeating any of it and without a preamble.")
+
+
+def normalize_finish_reason(value: Any) -> Optional[str]:
+    """Map provider finish reasons onto 'length' (cut off at the limit) or 'stop'"""
+    if value is None:
+        return None
+    # Gemini reports an enum (FinishReason.MAX_TOKENS) or its name; Groq/OpenAI report "length"
+    name = str(getattr(value, 'name', value)).upper()
+    if name.endswith(('LENGTH', 'MAX_TOKENS')):
+        return 'length'
+    return 'stop' if name.endswith(('STOP', 'END_TURN')) else name.lower()
+
+
+def is_reasoning_model(model: Optional[str]) -> bool:
+    """True for models whose completion tokens include reasoning, e.g. 'openai/gpt-oss-120b'"""
+    return bool(model) and model.rsplit('/', 1)[-1].lower().startswith(REASONING_MODEL_PREFIXES)
+
+
+def continuation_prompt(prompt: str, partial: str) -> str:
+    """Prompt asking a string-prompt provider to pick up a truncated answer"""
+    return f"{prompt}\n\n--- Partial response so far ---\n{partial}\n--- End of partial response ---\n\n{CONTINUE_INSTRUCTION}"
+
+
+def continuation_messages(messages: List[Dict[str, Any]], partial: str) -> List[Dict[str, Any]]:
+    """Chat-message form: the partial answer as the assistant turn, then the instruction"""
+    return [*messages, {'role': 'assistant', 'content': partial}, {'role': 'user', 'content': CONTINUE_INSTRUCTION}]
+
+
+class OutputBudgetPredictor:
+    """
+    Call sites are the telemetry agent (agent_scope name, else the calling module.function) per
+    provider/model. Until a site has min_samples observations the caller's default applies.
+    Observations are kept in the shared state store so learning survives restarts.
+
+    Routers address their caches, single-flight and cassettes with the caller's default limit,
+    never the predicted one, so learning does not change which entry a request maps to.
+    """
+
+    def __init__(self, enabled: Optional[bool] = None, percentile: Optional[float] = None,
+                 headroom: Optional[float] = None, min_samples: int = 20, floor: int = 256,
+                 ceiling: int = 8192, max_continuations: Optional[int] = None, shared=None):
+        if enabled is None:
+            enabled = os.environ.get("LLM_ADAPTIVE_MAX_TOKENS", "1").lower() not in ("0", "false", "no")
+        self.enabled = enabled
+        self.percentile = float(percentile if percentile is not None else os.environ.get("LLM_MAX_TOKENS_PERCENTILE", 99))
+        self.headroom = float(headroom if headroom is not None else os.environ.get("LLM_MAX_TOKENS_HEADROOM", 1.25))
+        self.min_samples = min_samples
+        self.floor = floor
+        self.ceiling = ceiling
+        self.max_continuations = int(max_continuations if max_continuations is not None
+                                     else os.environ.get("LLM_MAX_CONTINUATIONS", 2))
+        self.shared = shared
+
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self.stats = {'predicted': 0, 'defaulted': 0, 'observed': 0, 'truncated': 0,
+                      'continuations': 0, 'reserved_tokens_saved': 0}
+
+        self.setup_logging()
+
+    def setup_logging(self):
+        """Setup logging for output budgets"""
+        self.logger = logging.getLogger('OutputBudgetPredictor')
+        if not self.logger.handlers:
+            handler = logging.StreamHandler()
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+
+    @staticmethod
+    def site_key(site: str, provider: str, model: Optional[str]) -> str:
+        return f"{site}|{provider}/{model}"
+
+    def _histogram(self, key: str) -> LogHistogram:
+        with self._lock:
+            histogram = self._histograms.get(key)
+        if histogram is None:
+            record = self.shared.get('output_budget', key) if self.shared is not None else None
+            histogram = LogHistogram.from_dict(record) if record else LogHistogram()
+            with self._lock:
+                histogram = self._histograms.setdefault(key, histogram)
+        return histogram
+
+    # -- learning ---------------------------------------------------------------
+
+    def observe(self, site: str, provider: str, model: Optional[str], completion_tokens: int):
+        """Add one complete answer's length (continuations included) to a call site's distribution"""
+        key = self.site_key(site, provider, model)
+        if self.shared is not None:
+            def add(record):
+                histogram = LogHistogram.from_dict(record) if record else LogHistogram()
+                histogram.record(completion_tokens)
+                return histogram.to_dict()
+            merged = self.shared.update('output_budget', key, add)
+            with self._lock:
+                self._histograms[key] = LogHistogram.from_dict(merged)
+        else:
+            histogram = self._histogram(key)
+            with self._lock:
+                histogram.record(completion_tokens)
+        with self._lock:
+            self.stats['observed'] += 1
+
+    def observe_call(self, record: Dict[str, Any]):
+        """
+        Telemetry listener: learn from every successful, uncached call. Counts estimated from the
+        answer text are skipped for reasoning models; only provider-reported usage covers their reasoning.
+        """
+        if not self.enabled or record.get('error') or record.get('cache_hit') or not record.get('completion_tokens'):
+            return
+        if record.get('completion_tokens_estimated') and is_reasoning_model(record.get('model')):
+            return
+        self.observe(record['agent'], record['provider'], record['model'], record['completion_tokens'])
+
+    # -- prediction -------------------------------------------------------------
+
+    def limit(self, provider: str, model: Optional[str], default: Optional[int],
+              site: Optional[str] = None) -> Optional[int]:
+        """
+        Max output tokens for the current call site: the learned percentile times headroom,
+        snapped up the ladder and kept within [floor, max(default, ceiling)]; `default` until
+        the site has enough history (None leaves the provider's own default in place). Replays
+        always get `default`, so requests match what was recorded.
+        """
+        if not self.enabled or llm_cassette.replaying:
+            return default
+        histogram = self._histogram(self.site_key(site or current_agent(), provider, model))
+        with self._lock:
+            if histogram.count < self.min_samples:
+                self.stats['defaulted'] += 1
+                return default
+            target = histogram.percentile(self.percentile) * self.headroom
+        ceiling = max(default or 0, self.ceiling)
+        limit = next((step for step in LIMIT_LADDER if step >= target), LIMIT_LADDER[-1])
+        limit = max(self.floor, min(ceiling, limit))
+        with self._lock:
+            self.stats['predicted'] += 1
+            if default:
+                self.stats['reserved_tokens_saved'] += max(0, default - limit)
+        return limit
+
+    # -- continuation -----------------------------------------------------------
+
+    def _note_truncated(self, rounds: int):
+        with self._lock:
+            self.stats['truncated'] += rounds == 0
+            self.stats['continuations'] += 1
+        self.logger.info(f"📏 Response hit the output limit, continuing (round {rounds + 1}/{self.max_continuations})")
+
+    def complete(self, prompt: str, fetch: Callable[[str], Tuple[str, Optional[str]]]) -> str:
+        """
+        fetch(prompt) -> (text, finish_reason). While the answer stops at the length limit it is
+        continued, up to max_continuations times, and the pieces are joined.
+        """
+        text, finish_reason = fetch(prompt)
+        rounds = 0
+        while normalize_finish_reason(finish_reason) == 'length' and rounds < self.max_continuations:
+            self._note_truncated(rounds)
+            more, finish_reason = fetch(continuation_prompt(prompt, text))
+            if not more:
+                break
+            text += more
+            rounds += 1
+        return text
+
+    async def acomplete(self, messages: List[Dict[str, Any]],
+                        fetch: Callable[[List[Dict[str, Any]]], Awaitable[Tuple[str, Optional[str]]]]) -> str:
+        """Async, chat-message counterpart of complete()"""
+        text, finish_reason = await fetch(messages)
+        rounds = 0
+        while normalize_finish_reason(finish_reason) == 'length' and rounds < self.max_continuations:
+            self._note_truncated(rounds)
+            more, finish_reason = await fetch(continuation_messages(messages, text))
+            if not more:
+                break
+            text += more
+            rounds += 1
+        return text
+
+    def stream(self, prompt: str, open_stream: Callable[[str, Dict[str, Any]], Iterator[str]]) -> Iterator[str]:
+        """
+        Streaming counterpart of complete(): open_stream(prompt, meta) yields tokens and sets
+        meta['finish_reason']; continuation tokens follow the truncated ones in the same stream
+        """
+        parts = []
+        meta = {}
+        rounds = 0
+        current = prompt
+        while True:
+            tokens = open_stream(current, meta)
+            try:
+                for token in tokens:
+                    parts.append(token)
+                    yield token
+            finally:
+                # Closing this generator early ends the provider stream now
+                tokens.close()
+            if normalize_finish_reason(meta.get('finish_reason')) != 'length' or rounds >= self.max_continuations:
+                return
+            self._note_truncated(rounds)
+            meta = {}
+            current = continuation_prompt(prompt, "".join(parts))
+            rounds += 1
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get settings, counters and the learned limit per call site"""
+        with self._lock:
+            sites = {
+                key: {'samples': h.count, f'p{self.percentile:g}': h.percentile(self.percentile), 'max': h.max}
+                for key, h in self._histograms.items() if h.count
+            }
+            return {
+                'enabled': self.enabled,
+                'percentile': self.percentile,
+                'headroom': self.headroom,
+                'min_samples': self.min_samples,
+                'max_continuations': self.max_continuations,
+                'sites': sites,
+                **self.stats,
+            }
+
+
+# Global instance for easy access
+output_budget = OutputBudgetPredictor(shared=shared_state)
+llm_telemetry.add_listener(output_budget.observe_call)
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+🗜️ Token-Aware Prompt Compaction
+Turns bulky tool results into compact, deduplicated host/service tables that fit a per-call token budget
+"""
+
+import os
+import re
+import json
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+HOST_KEYS = ('host', 'ip', 'address', 'addr', 'hostname', 'target')
+PORT_KEYS = ('port', 'portid')
+
+# Keys a service row already shows; any other field of a port record is appended to its row
+SERVICE_KEYS = {*HOST_KEYS, *PORT_KEYS, 'protocol', 'proto', 'state', 'service', 'name', 'product', 'version', 'extrainfo'}
+
+# Fields that cost tokens but rarely change the analysis
+LOW_VALUE_KEYS = {
+    'timestamp', 'time', 'date', 'elapsed', 'duration', 'scan_time', 'starttime', 'endtime',
+    'raw', 'raw_output', 'stdout', 'stderr', 'debug', 'command', 'cmd', 'command_line',
+    'scanstats', 'reason', 'reason_ttl', 'conf', 'method', 'ostype', 'cpe_raw',
+}
+
+NMAP_PORT_LINE = re.compile(r'^(\d+)/(tcp|udp|sctp)\s+(\S+)\s+(\S+)\s*(.*)$')
+IP_LIKE = re.compile(r'^\d{1,3}(\.\d{1,3}){3}(/\d+)?$')
+_TOKEN_PIECES = re.compile(r'[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]')
+
+# Room left for the truncation marker when a line is cut to fit the budget
+MARKER_TOKENS = 24
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens locally; uses tiktoken when installed, otherwise a BPE-like estimate"""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return sum(max(1, (len(piece) + 3) // 4) if piece[0].isalpha() else 1
+               for piece in _TOKEN_PIECES.findall(text))
+
+
+class CompactionResult:
+    """Compacted prompt text plus the token accounting for it"""
+
+    def __init__(self, text: str, original_tokens: int, compacted_tokens: int, truncated: bool = False):
+        self.text = text
+        self.original_tokens = original_tokens
+        self.compacted_tokens = compacted_tokens
+        self.truncated = truncated
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.original_tokens - self.compacted_tokens)
+
+    def __str__(self):
+        return self.text
+
+
+class PromptCompactor:
+    """
+    Canonicalizes, deduplicates and budgets tool results before they are put in a prompt
+    """
+
+    def __init__(self, token_budget: Optional[int] = None, max_field_chars: int = 300):
+        self.token_budget = int(token_budget if token_budget is not None else os.environ.get("LLM_PROMPT_TOKEN_BUDGET", 6000))
+        self.max_field_chars = max_field_chars
+        self._lock = threading.Lock()
+        self.stats = {'calls': 0, 'original_tokens': 0, 'compacted_tokens': 0, 'tokens_saved': 0, 'truncated': 0}
+
+    # -- canonicalization -------------------------------------------------
+
+    def _clean_text(self, value: str) -> str:
+        value = re.sub(r'\s+', ' ', value).strip()
+        if len(value) > self.max_field_chars:
+            value = value[:self.max_field_chars] + '…'
+        return value
+
+    def _service_row(self, record: Dict[str, Any], host: Optional[str]) -> Optional[Tuple[str, str]]:
+        record = {str(k).lower(): v for k, v in record.items()}
+        port = next((record[k] for k in PORT_KEYS if k in record), None)
+        if port is None:
+            return None
+        host = next((str(record[k]) for k in HOST_KEYS if record.get(k)), host) or '?'
+        proto = record.get('protocol') or record.get('proto') or 'tcp'
+        service = record.get('service') or record.get('name') or ''
+        if isinstance(service, dict):
+            record.update({k: v for k, v in service.items() if k not in record})
+            service = service.get('name', '')
+        parts = [f"{port}/{proto}", str(record.get('state', '') or ''), str(service or '')]
+        detail = " ".join(str(record[k]) for k in ('product', 'version', 'extrainfo') if record.get(k))
+        if detail:
+            parts.append(self._clean_text(detail))
+        # Findings attached to the port (vulnerability, CVE, severity, script output, ...) stay with it
+        extra = [
+            f"{k}={self._clean_text(v if isinstance(v, str) else json.dumps(v, default=str))}"
+            for k, v in sorted(record.items())
+            if k not in SERVICE_KEYS and k not in LOW_VALUE_KEYS and v not in (None, '', [], {})
+        ]
+        if extra:
+            parts.append(f"[{', '.join(extra)}]")
+        return host, " ".join(p for p in parts if p)
+
+    def _parse_nmap_text(self, text: str, host: Optional[str], rows: List[Tuple[str, str]]) -> List[str]:
+        """Pull port lines out of nmap's human-readable output; return the lines worth keeping"""
+        leftovers = []
+        for line in text.splitlines():
+            line = line.strip()
+            match = NMAP_PORT_LINE.match(line)
+            if match:
+                port, proto, state, service, version = match.groups()
+                rows.append((host or '?', " ".join(p for p in (f"{port}/{proto}", state, service, self._clean_text(version)) if p)))
+            elif line.startswith(('Nmap scan report for', 'Host is up', 'Starting Nmap', 'Nmap done',
+                                  'PORT ', 'Not shown', 'Service detection performed', 'Read data files')):
+                continue
+            elif line.startswith('|') or line.startswith('Service Info') or line.startswith('OS'):
+                leftovers.append(self._clean_text(line))
+        return leftovers
+
+    def _walk(self, value: Any, path: str, host: Optional[str], rows: List[Tuple[str, str]], other: List[str]):
+        if isinstance(value, dict):
+            row = self._service_row(value, host)
+            if row is not None:
+                rows.append(row)
+                return
+            record_host = next((str(value[k]) for k in HOST_KEYS if isinstance(value.get(k), str)), host)
+            for key in sorted(value, key=str):
+                if str(key).lower() in LOW_VALUE_KEYS or str(key).lower() in HOST_KEYS:
+                    continue
+                child_host = str(key) if IP_LIKE.match(str(key)) else record_host
+                child_path = path if IP_LIKE.match(str(key)) else (f"{path}.{key}" if path else str(key))
+                self._walk(value[key], child_path, child_host, rows, other)
+        elif isinstance(value, (list, tuple, set)):
+            for item in value:
+                self._walk(item, path, host, rows, other)
+        elif isinstance(value, str):
+            if any(NMAP_PORT_LINE.match(line.strip()) for line in value.splitlines()):
+                for line in self._parse_nmap_text(value, host, rows):
+                    other.append((host, path, line))
+                return
+            if value.strip():
+                other.append((host, path, self._clean_text(value)))
+        elif value is not None:
+            other.append((host, path, str(value)))
+
+    @staticmethod
+    def _compress_hosts(hosts: List[str]) -> str:
+        """Sort hosts and collapse consecutive IPv4 addresses into ranges (10.0.0.1-254)"""
+        ips, names = [], []
+        for host in hosts:
+            if IP_LIKE.match(host) and '/' not in host:
+                ips.append(tuple(int(o) for o in host.split('.')))
+            else:
+                names.append(host)
+        parts = []
+        ips.sort()
+        start = prev = None
+        for ip in ips + [None]:
+            if prev is not None and ip is not None and ip[:3] == prev[:3] and ip[3] == prev[3] + 1:
+                prev = ip
+                continue
+            if start is not None:
+                label = '.'.join(map(str, start))
+                parts.append(label if start == prev else f"{label}-{prev[3]}")
+            start = prev = ip
+        return ", ".join(parts + sorted(names))
+
+    def _render(self, rows: List[Tuple[str, str]], other: List[Tuple[Optional[str], str, str]]) -> List[str]:
+        lines = []
+        if rows:
+            # Hosts exposing the identical service set share one line
+            services_by_host = {}
+            for host, service in rows:
+                services = services_by_host.setdefault(host, [])
+                if service not in services:
+                    services.append(service)
+            hosts_by_signature = {}
+            for host, services in services_by_host.items():
+                ordered = sorted(services, key=lambda s: (int(s.split('/', 1)[0]) if s.split('/', 1)[0].isdigit() else 0, s))
+                hosts_by_signature.setdefault(tuple(ordered), []).append(host)
+            lines.append(f"SERVICES ({len(services_by_host)} hosts; host(s): port/proto state service version):")
+            for signature, hosts in hosts_by_signature.items():
+                lines.append(f"{self._compress_hosts(hosts)}: {'; '.join(signature)}")
+        if other:
+            # The same finding on many hosts is listed once with its hosts
+            grouped = {}
+            for host, path, text in other:
+                entry = grouped.setdefault((path, text), {'hosts': [], 'count': 0})
+                entry['count'] += 1
+                if host and host not in entry['hosts']:
+                    entry['hosts'].append(host)
+            lines.append("OTHER FINDINGS:")
+            for (path, text), entry in grouped.items():
+                line = f"- {path}: {text}" if path else f"- {text}"
+                if entry['hosts']:
+                    line += f" [{self._compress_hosts(entry['hosts'])}]"
+                elif entry['count'] > 1:
+                    line += f" (x{entry['count']})"
+                lines.append(line)
+        return lines
+
+    @staticmethod
+    def _cut_to_budget(line: str, tokens: int) -> str:
+        """The longest prefix of line that costs at most `tokens` tokens"""
+        if tokens <= 0:
+            return ''
+        low, high = 0, len(line)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if count_tokens(line[:middle]) <= tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return line[:low].rstrip()
+
+    # -- public API -------------------------------------------------------
+
+    def compact(self, data: Any, token_budget: Optional[int] = None) -> CompactionResult:
+        """Compact findings/tool results into prompt text within the token budget"""
+        budget = token_budget or self.token_budget
+        if isinstance(data, str):
+            try:
+                data = json.loads(data)
+            except ValueError:
+                pass
+        original = data if isinstance(data, str) else json.dumps(data, default=str)
+        original_tokens = count_tokens(original)
+
+        rows, other = [], []
+        if isinstance(data, str) and not any(NMAP_PORT_LINE.match(l.strip()) for l in data.splitlines()):
+            # Free text is kept as written; only the budget applies
+            lines = [line.rstrip() for line in data.splitlines()]
+        else:
+            self._walk(data, "", None, rows, other)
+            lines = self._render(rows, other)
+
+        kept, used, truncated = [], 0, False
+        for index, line in enumerate(lines):
+            cost = count_tokens(line) + 1
+            if used + cost > budget:
+                # The line that does not fit is cut to the remaining budget rather than dropped whole
+                head = self._cut_to_budget(line, budget - used - MARKER_TOKENS)
+                if head:
+                    kept.append(head + '…')
+                omitted = len(lines) - index - (1 if head else 0)
+                kept.append(f"... [{'line truncated' if not omitted else f'{omitted} more lines omitted'} to fit the token budget]")
+                truncated = True
+                break
+            kept.append(line)
+            used += cost
+        text = "\n".join(kept)
+        result = CompactionResult(text, original_tokens, count_tokens(text), truncated)
+
+        with self._lock:
+            self.stats['calls'] += 1
+            self.stats['original_tokens'] += result.original_tokens
+            self.stats['compacted_tokens'] += result.compacted_tokens
+            self.stats['tokens_saved'] += result.tokens_saved
+            self.stats['truncated'] += int(truncated)
+        return result
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get cumulative token savings"""
+        with self._lock:
+            return {'token_budget': self.token_budget, 'tokenizer': 'tiktoken' if _ENCODING else 'estimate', **self.stats}
+
+
+# Global instance for easy access
+prompt_compactor = PromptCompactor()
+
+
+def compact_for_prompt(data: Any, token_budget: Optional[int] = None) -> CompactionResult:
+    """Compact tool results or findings for use inside an LLM prompt"""
+    return prompt_compactor.compact(data, token_budget)
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+📊 Provider Scoreboard
+Latency EWMA, rolling error rate and recent 429s per provider/model, an
+expected-completion-time score for routing, and a half-open circuit breaker per provider
+that can be shared by every process on the host
+"""
+
+import time
+import threading
+from collections import deque
+from typing import Dict, Any, Optional, List, Callable
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised when a provider's circuit is open (or its half-open probe is already in flight)"""
+
+    def __init__(self, provider: str, retry_in: float = 0.0):
+        super().__init__(f"{provider} circuit open, next probe in {retry_in:.0f}s")
+        self.provider = provider
+        self.retry_in = retry_in
+
+
+class ProviderScoreboard:
+    """
+    Live routing statistics. A provider that answers but slowly scores worse than a fast
+    one; a provider that keeps failing is cut off and re-admitted through a single probe.
+    """
+
+    def __init__(self, failure_threshold: int = 3, recovery_timeout: float = 60.0,
+                 max_recovery_timeout: float = 600.0, error_rate_threshold: float = 0.5,
+                 alpha: float = 0.2, window: int = 50, rate_limit_window: float = 60.0,
+                 rate_limit_penalty: float = 5.0, default_latency: float = 2.0,
+                 probe_timeout: float = 120.0, shared=None):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.max_recovery_timeout = max_recovery_timeout
+        self.error_rate_threshold = error_rate_threshold
+        self.alpha = alpha
+        self.window = window
+        self.rate_limit_window = rate_limit_window
+        self.rate_limit_penalty = rate_limit_penalty
+        self.default_latency = default_latency
+
+        self.probe_timeout = probe_timeout
+        # Optional SharedStateStore: circuits are then shared by every process on the host
+        self.shared = shared
+
+        self._lock = threading.Lock()
+        self._models = {}
+        self._circuits = {}
+
+    # -- bookkeeping ------------------------------------------------------
+
+    def _model_stats(self, provider: str, model: Optional[str]) -> Dict[str, Any]:
+        key = (provider, model or 'default')
+        stats = self._models.get(key)
+        if stats is None:
+            stats = self._models[key] = {
+                'ewma_latency': None,
+                'outcomes': deque(maxlen=self.window),
+                'rate_limits': deque(),
+                'requests': 0,
+            }
+        return stats
+
+    def _circuit(self, provider: str) -> Dict[str, Any]:
+        circuit = self._circuits.get(provider)
+        if circuit is None:
+            circuit = self._circuits[provider] = {
+                'state': CLOSED, 'consecutive_failures': 0, 'opened_at': None,
+                'open_for': self.recovery_timeout, 'probe_until': 0.0, 'trips': 0,
+            }
+        return circuit
+
+    def _sync(self, provider: str) -> Dict[str, Any]:
+        """The provider's circuit, refreshed from the shared store when there is one"""
+        circuit = self._circuit(provider)
+        if self.shared is not None:
+            record = self.shared.get('circuit', provider)
+            if record:
+                circuit.update(record)
+        return circuit
+
+    def _mutate(self, provider: str, fn: Callable[[Dict[str, Any]], Any]) -> Any:
+        """Apply fn to the circuit, atomically across processes when the state is shared; returns fn's result"""
+        results = []
+
+        def apply(record):
+            circuit = self._circuit(provider)
+            if record is not None:
+                circuit.update(record)
+            results.append(fn(circuit))
+            return dict(circuit)
+
+        if self.shared is not None:
+            self.shared.update('circuit', provider, apply)
+        else:
+            apply(None)
+        return results[-1]
+
+    def _prune_rate_limits(self, stats: Dict[str, Any], now: float):
+        while stats['rate_limits'] and now - stats['rate_limits'][0] > self.rate_limit_window:
+            stats['rate_limits'].popleft()
+
+    def _open(self, provider: str, circuit: Dict[str, Any], now: float, backoff: bool):
+        if backoff:
+            circuit['open_for'] = min(self.max_recovery_timeout, circuit['open_for'] * 2)
+        circuit['state'] = OPEN
+        circuit['opened_at'] = now
+        circuit['probe_until'] = 0.0
+        circuit['trips'] += 1
+
+    # -- circuit breaker --------------------------------------------------
+
+    def is_available(self, provider: str) -> bool:
+        """Whether a request to the provider would be admitted right now (does not take the probe)"""
+        with self._lock:
+            circuit = self._sync(provider)
+            now = time.time()
+            if circuit['state'] == CLOSED:
+                return True
+            if circuit['state'] == HALF_OPEN:
+                return circuit['probe_until'] <= now
+            return now - circuit['opened_at'] >= circuit['open_for']
+
+    def acquire(self, provider: str) -> str:
+        """
+        Admit a request or raise CircuitOpenError. Once an open circuit's timeout has passed
+        exactly one caller (across all processes sharing the state) is let through as the
+        half-open probe; its outcome decides the state.
+        """
+        def claim(circuit):
+            now = time.time()
+            if circuit['state'] == CLOSED:
+                return CLOSED
+            if circuit['state'] == OPEN:
+                remaining = circuit['open_for'] - (now - circuit['opened_at'])
+                if remaining > 0:
+                    raise CircuitOpenError(provider, remaining)
+                circuit['state'] = HALF_OPEN
+            if circuit['probe_until'] > now:
+                raise CircuitOpenError(provider, circuit['probe_until'] - now)
+            # The probe slot is a lease, so a process that dies mid-probe cannot hold it forever
+            circuit['probe_until'] = now + self.probe_timeout
+            return HALF_OPEN
+
+        with self._lock:
+            if self._sync(provider)['state'] == CLOSED:
+                return CLOSED
+            return self._mutate(provider, claim)
+
+    def reset(self, provider: Optional[str] = None):
+        """Close one or all circuits"""
+        with self._lock:
+            for name in ([provider] if provider else list(self._circuits)):
+                self._circuits.pop(name, None)
+            if self.shared is not None:
+                self.shared.delete('circuit', provider)
+
+    # -- outcomes ---------------------------------------------------------
+
+    def record_success(self, provider: str, model: Optional[str], latency: float):
+        def close(circuit):
+            circuit['consecutive_failures'] = 0
+            if circuit['state'] != CLOSED:
+                circuit.update(state=CLOSED, opened_at=None, open_for=self.recovery_timeout, probe_until=0.0)
+
+        with self._lock:
+            stats = self._model_stats(provider, model)
+            stats['requests'] += 1
+            stats['outcomes'].append(1)
+            previous = stats['ewma_latency']
+            stats['ewma_latency'] = latency if previous is None else self.alpha * latency + (1 - self.alpha) * previous
+
+            circuit = self._sync(provider)
+            # Healthy traffic only reads the shared state; it is written when something changes
+            if circuit['state'] != CLOSED or circuit['consecutive_failures']:
+                self._mutate(provider, close)
+
+    def record_failure(self, provider: str, model: Optional[str], rate_limited: bool = False) -> bool:
+        """Record a failed call; returns True when this failure opened the circuit"""
+        with self._lock:
+            stats = self._model_stats(provider, model)
+            stats['requests'] += 1
+            stats['outcomes'].append(0)
+            if rate_limited:
+                stats['rate_limits'].append(time.monotonic())
+            outcomes = stats['outcomes']
+            error_rate = 1 - sum(outcomes) / len(outcomes)
+
+            def trip(circuit):
+                now = time.time()
+                circuit['consecutive_failures'] += 1
+                if circuit['state'] == HALF_OPEN:
+                    self._open(provider, circuit, now, backoff=True)
+                    return True
+                if circuit['state'] == CLOSED:
+                    if (circuit['consecutive_failures'] >= self.failure_threshold or
+                            (len(outcomes) >= 10 and error_rate >= self.error_rate_threshold)):
+                        self._open(provider, circuit, now, backoff=False)
+                        return True
+                return False
+
+            return self._mutate(provider, trip)
+
+    def release(self, provider: str):
+        """Give back a half-open probe slot without an outcome (e.g. the caller was cancelled)"""
+        def give_back(circuit):
+            if circuit['state'] == HALF_OPEN:
+                circuit['probe_until'] = 0.0
+
+        with self._lock:
+            self._mutate(provider, give_back)
+
+    # -- scoring ----------------------------------------------------------
+
+    def _score(self, provider: str, model: Optional[str], now: float) -> Dict[str, Any]:
+        stats = self._models.get((provider, model or 'default'))
+        if stats is None or stats['ewma_latency'] is None:
+            # No data for this model: fall back to the provider's busiest model
+            candidates = [s for (p, _), s in self._models.items() if p == provider]
+            stats = max(candidates, key=lambda s: s['requests'], default=stats)
+        if stats is None:
+            return {'ewma_latency': None, 'error_rate': 0.0, 'recent_429s': 0, 'expected_time': self.default_latency}
+        self._prune_rate_limits(stats, now)
+        outcomes = stats['outcomes']
+        error_rate = 1 - sum(outcomes) / len(outcomes) if outcomes else 0.0
+        latency = stats['ewma_latency'] if stats['ewma_latency'] is not None else self.default_latency
+        # Each attempt succeeds with p = 1 - error_rate, so the expected number of attempts is 1/p
+        success_rate = max(1.0 - error_rate, 0.05)
+        expected = latency / success_rate + len(stats['rate_limits']) * self.rate_limit_penalty
+        return {
+            'ewma_latency': stats['ewma_latency'],
+            'error_rate': error_rate,
+            'recent_429s': len(stats['rate_limits']),
+            'expected_time': expected,
+        }
+
+    def expected_time(self, provider: str, model: Optional[str] = None) -> float:
+        """Expected seconds to a successful completion from this provider/model"""
+        with self._lock:
+            return self._score(provider, model, time.monotonic())['expected_time']
+
+    def rank(self, providers: List[str], models: Optional[Dict[str, Optional[str]]] = None) -> List[str]:
+        """Order providers by expected completion time, fastest first"""
+        models = models or {}
+        return sorted(providers, key=lambda p: self.expected_time(p, models.get(p)))
+
+    def reopens_in(self, provider: str) -> float:
+        with self._lock:
+            circuit = self._sync(provider)
+            if circuit['state'] != OPEN:
+                return 0.0
+            return max(0.0, circuit['open_for'] - (time.time() - circuit['opened_at']))
+
+    def get_status(self) -> Dict[str, Any]:
+        """Live scores per provider/model and circuit state per provider"""
+        with self._lock:
+            now = time.monotonic()
+            wall = time.time()
+            circuits = {}
+            shared = self.shared.items('circuit') if self.shared is not None else {}
+            for provider in list(dict.fromkeys([*self._circuits, *shared])):
+                circuit = self._sync(provider)
+                circuits[provider] = {
+                    'state': circuit['state'],
+                    'consecutive_failures': circuit['consecutive_failures'],
+                    'trips': circuit['trips'],
+                    'reopens_in': (max(0.0, circuit['open_for'] - (wall - circuit['opened_at']))
+                                   if circuit['state'] == OPEN else 0.0),
+                }
+            scores = {
+                f"{provider}/{model}": {'requests': stats['requests'], **self._score(provider, model, now)}
+                for (provider, model), stats in self._models.items()
+            }
+        return {'circuits': circuits, 'scores': scores}
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+🚥 Priority-Aware LLM Request Scheduler
+One admission queue per provider in front of every router: priority classes (interactive,
+pipeline, background) share the provider's slots by weighted fair queuing, newly queued
+interactive calls overtake queued background work, and background work can never take the
+slots reserved for the other classes
+"""
+
+import os
+import asyncio
+import itertools
+import threading
+import contextvars
+import logging
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from typing import Dict, Any, Optional, Callable
+import time
+
+from llm.telemetry import LogHistogram, llm_telemetry
+
+# Share of slots each class gets while all of them have work queued
+PRIORITY_WEIGHTS = {'interactive': 8, 'pipeline': 3, 'background': 1}
+DEFAULT_PRIORITY = 'pipeline'
+
+# Routers name the same provider differently; they share one lane
+LANE_ALIASES = {'gemini': 'google'}
+
+# The local CPU model runs one request at a time anyway
+DEFAULT_LANE_SLOTS = {'local': 1}
+
+_current_priority = contextvars.ContextVar('llm_priority', default=None)
+_held_lanes = contextvars.ContextVar('llm_held_lanes', default=frozenset())
+
+
+@contextmanager
+def priority_scope(priority: str):
+    """Schedule every LLM call made inside the block (including awaited tasks) as `priority`"""
+    if priority not in PRIORITY_WEIGHTS:
+        raise ValueError(f"Unknown priority class: {priority} (expected one of {', '.join(PRIORITY_WEIGHTS)})")
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_priority() -> str:
+    return _current_priority.get() or DEFAULT_PRIORITY
+
+
+class _Waiter:
+    __slots__ = ('priority', 'seq', 'start', 'grant', 'granted', 'enqueued_at')
+
+    def __init__(self, priority: str, seq: int, grant: Callable[[], None]):
+        self.priority = priority
+        self.seq = seq
+        self.start = 0.0
+        self.grant = grant
+        self.granted = False
+        self.enqueued_at = time.monotonic()
+
+
+class _Lane:
+    def __init__(self, slots: int, reserve: int):
+        self.slots = slots
+        # Slots background work may not take, so an interactive call always finds one soon
+        self.reserve = min(reserve, slots - 1)
+        self.in_use = 0
+        self.queues = {priority: deque() for priority in PRIORITY_WEIGHTS}
+        self.virtual_time = 0.0
+        self.last_finish = {priority: 0.0 for priority in PRIORITY_WEIGHTS}
+
+
+class LLMRequestScheduler:
+    """
+    Start-time fair queuing over the priority classes: a request's virtual start is
+    max(virtual time, its class's last finish) and its finish adds 1/weight, and the queued
+    request with the smallest start is admitted next. LLM_SCHEDULER_SLOTS sets the concurrent
+    requests per provider and LLM_SCHEDULER_RESERVE the slots closed to background work.
+    """
+
+    def __init__(self, slots: Optional[int] = None, reserve: Optional[int] = None, enabled: Optional[bool] = None):
+        if enabled is None:
+            enabled = os.environ.get("LLM_SCHEDULER_DISABLED", "").lower() not in ("1", "true", "yes")
+        self.enabled = enabled
+        self.slots = int(slots or os.environ.get("LLM_SCHEDULER_SLOTS", 6))
+        self.reserve = int(reserve if reserve is not None else os.environ.get("LLM_SCHEDULER_RESERVE", 1))
+
+        self._lock = threading.Lock()
+        self._lanes = {}
+        self._seq = itertools.count()
+        self._admission_checks = []
+        self.stats = {
+            priority: {'admitted': 0, 'cancelled': 0, 'overtaken': 0, 'max_queue_depth': 0, 'wait_ms': LogHistogram()}
+            for priority in PRIORITY_WEIGHTS
+        }
+
+        self.setup_logging()
+
+    def setup_logging(self):
+        """Setup logging for the scheduler"""
+        self.logger = logging.getLogger('LLMRequestScheduler')
+        if not self.logger.handlers:
+            handler = logging.StreamHandler()
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+
+    def add_admission_check(self, check: Callable[[str], None]):
+        """Have check(lane) called before a new request is queued; it refuses the request by raising"""
+        self._admission_checks.append(check)
+
+    def _check_admission(self, lane_name: str):
+        for check in self._admission_checks:
+            check(lane_name)
+
+    def _lane(self, name: str) -> _Lane:
+        lane = self._lanes.get(name)
+        if lane is None:
+            lane = self._lanes[name] = _Lane(DEFAULT_LANE_SLOTS.get(name, self.slots), self.reserve)
+        return lane
+
+    # -- queuing (all under self._lock) -----------------------------------------
+
+    def _enqueue(self, lane: _Lane, waiter: _Waiter):
+        weight = PRIORITY_WEIGHTS[waiter.priority]
+        waiter.start = max(lane.virtual_time, lane.last_finish[waiter.priority])
+        lane.last_finish[waiter.priority] = waiter.start + 1.0 / weight
+        queue = lane.queues[waiter.priority]
+        queue.append(waiter)
+        stats = self.stats[waiter.priority]
+        stats['max_queue_depth'] = max(stats['max_queue_depth'], len(queue))
+
+    def _dispatch(self, lane: _Lane):
+        while lane.in_use < lane.slots:
+            candidates = [queue[0] for priority, queue in lane.queues.items() if queue
+                          and (priority != 'background' or lane.in_use < lane.slots - lane.reserve)]
+            if not candidates:
+                return
+            waiter = min(candidates, key=lambda w: (w.start, -PRIORITY_WEIGHTS[w.priority], w.seq))
+            lane.queues[waiter.priority].popleft()
+            background = lane.queues['background']
+            if waiter.priority != 'background' and background and background[0].seq < waiter.seq:
+                # Queued background work waits while a later, higher-priority call goes first
+                self.stats['background']['overtaken'] += 1
+            lane.virtual_time = max(lane.virtual_time, waiter.start)
+            lane.in_use += 1
+            waiter.granted = True
+            stats = self.stats[waiter.priority]
+            stats['admitted'] += 1
+            stats['wait_ms'].record((time.monotonic() - waiter.enqueued_at) * 1000)
+            waiter.grant()
+
+    def _release(self, lane: _Lane):
+        with self._lock:
+            lane.in_use -= 1
+            self._dispatch(lane)
+
+    def _abandon(self, lane: _Lane, waiter: _Waiter):
+        """A waiter gave up (interrupt or cancellation): leave the queue, or return its slot"""
+        with self._lock:
+            if waiter.granted:
+                lane.in_use -= 1
+                self._dispatch(lane)
+            else:
+                lane.queues[waiter.priority].remove(waiter)
+                self.stats[waiter.priority]['cancelled'] += 1
+
+    def _admit(self, provider: str, priority: Optional[str], grant: Callable[[], None]):
+        name = LANE_ALIASES.get(provider, provider)
+        priority = priority or current_priority()
+        with self._lock:
+            lane = self._lane(name)
+            waiter = _Waiter(priority, next(self._seq), grant)
+            self._enqueue(lane, waiter)
+            self._dispatch(lane)
+        return name, lane, waiter
+
+    # -- public -----------------------------------------------------------------
+
+    @contextmanager
+    def slot(self, provider: str, priority: Optional[str] = None, bind: bool = True):
+        """
+        Hold one of the provider's request slots for the duration of the block. Inside it, nested
+        calls on the same lane pass through; generators holding a slot across `yield` pass
+        bind=False, since that mark would otherwise be visible to their consumer between tokens
+        and let the consumer's own calls skip the queue.
+        """
+        lane_name = LANE_ALIASES.get(provider, provider)
+        # Nested calls on a lane this context already holds (e.g. continuations) pass through
+        if lane_name not in _held_lanes.get():
+            self._check_admission(lane_name)
+        if not self.enabled or lane_name in _held_lanes.get():
+            yield
+            return
+        event = threading.Event()
+        _, lane, waiter = self._admit(provider, priority, event.set)
+        queued_at = time.monotonic()
+        try:
+            event.wait()
+        except BaseException:
+            self._abandon(lane, waiter)
+            raise
+        llm_telemetry.note(queue_wait=time.monotonic() - queued_at)
+        token = _held_lanes.set(_held_lanes.get() | {lane_name}) if bind else None
+        try:
+            yield
+        finally:
+            if token is not None:
+                _held_lanes.reset(token)
+            self._release(lane)
+
+    @asynccontextmanager
+    async def aslot(self, provider: str, priority: Optional[str] = None, bind: bool = True):
+        """Async counterpart of slot(); waiting does not block the event loop"""
+        lane_name = LANE_ALIASES.get(provider, provider)
+        if lane_name not in _held_lanes.get():
+            self._check_admission(lane_name)
+        if not self.enabled or lane_name in _held_lanes.get():
+            yield
+            return
+        loop = asyncio.get_running_loop()
+        admitted = loop.create_future()
+
+        def grant():
+            # Called under the scheduler lock, possibly from another thread
+            loop.call_soon_threadsafe(lambda: admitted.done() or admitted.set_result(True))
+
+        _, lane, waiter = self._admit(provider, priority, grant)
+        queued_at = time.monotonic()
+        try:
+            await admitted
+        except BaseException:
+            self._abandon(lane, waiter)
+            raise
+        llm_telemetry.note(queue_wait=time.monotonic() - queued_at)
+        token = _held_lanes.set(_held_lanes.get() | {lane_name}) if bind else None
+        try:
+            yield
+        finally:
+            if token is not None:
+                _held_lanes.reset(token)
+            self._release(lane)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Per-class queue depth and wait times, and slot usage per provider lane"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'lanes': {
+                    name: {
+                        'slots': lane.slots,
+                        'reserved_from_background': lane.reserve,
+                        'in_use': lane.in_use,
+                        'queued': {priority: len(queue) for priority, queue in lane.queues.items()},
+                    }
+                    for name, lane in self._lanes.items()
+                },
+                'classes': {
+                    priority: {
+                        'weight': PRIORITY_WEIGHTS[priority],
+                        'queue_depth': sum(len(lane.queues[priority]) for lane in self._lanes.values()),
+                        **{k: v for k, v in stats.items() if k != 'wait_ms'},
+                        'wait_ms': stats['wait_ms'].summary(),
+                    }
+                    for priority, stats in self.stats.items()
+                },
+            }
+
+
+# Global instance for easy access
+request_scheduler = LLMRequestScheduler()
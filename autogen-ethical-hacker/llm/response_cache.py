@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+💾 Persistent LLM Response Cache
+Content-addressed SQLite cache shared by every router, with TTLs, LRU eviction and hit/miss counters
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_CACHE_PATH = PROJECT_ROOT / "cache" / "llm_responses.sqlite3"
+
+# Generation parameters that change the completion and therefore belong in the key
+CACHE_KEY_PARAMS = (
+    "temperature", "top_p", "max_tokens", "max_completion_tokens",
+    "reasoning_effort", "stop", "system", "response_format",
+)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalize line endings and trailing whitespace so cosmetic differences share an entry"""
+    text = str(prompt).replace("\r\n", "\n").replace("\r", "\n")
+    return "\n".join(line.rstrip() for line in text.split("\n")).strip()
+
+
+def make_cache_key(provider: str, model: Optional[str], prompt: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """Build the content address for a completion request"""
+    relevant = {k: v for k, v in (params or {}).items() if k in CACHE_KEY_PARAMS and v is not None}
+    payload = json.dumps({
+        "provider": provider,
+        "model": model or "",
+        "prompt": normalize_prompt(prompt),
+        "params": relevant,
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    On-disk response cache keyed by provider, model, normalized prompt and generation parameters
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl: Optional[float] = None,
+                 max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                 enabled: Optional[bool] = None):
+        self.path = Path(path or os.environ.get("LLM_CACHE_PATH", DEFAULT_CACHE_PATH))
+        self.ttl = float(ttl if ttl is not None else os.environ.get("LLM_CACHE_TTL", 7 * 24 * 3600))
+        self.max_entries = int(max_entries if max_entries is not None else os.environ.get("LLM_CACHE_MAX_ENTRIES", 50000))
+        self.max_bytes = int(max_bytes if max_bytes is not None else os.environ.get("LLM_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+        if enabled is None:
+            enabled = os.environ.get("LLM_CACHE_DISABLED", "").lower() not in ("1", "true", "yes")
+        self.enabled = enabled
+
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'writes': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+        self._conn = None
+
+        self.setup_logging()
+
+    def setup_logging(self):
+        """Setup logging for cache operations"""
+        self.logger = logging.getLogger('LLMResponseCache')
+        if not self.logger.handlers:
+            handler = logging.StreamHandler()
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the database lazily so importing the module never touches disk"""
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    provider TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, provider: str, model: Optional[str], prompt: str, params: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """Return a cached response, or None on a miss or expired entry"""
+        if not self.enabled:
+            return None
+        key = make_cache_key(provider, model, prompt, params)
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute("SELECT response, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.stats['misses'] += 1
+                    return None
+                response, expires_at = row
+                if expires_at < now:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    conn.commit()
+                    self.stats['expired'] += 1
+                    self.stats['misses'] += 1
+                    return None
+                conn.execute("UPDATE responses SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key))
+                conn.commit()
+                self.stats['hits'] += 1
+        except sqlite3.Error as e:
+            self.logger.warning(f"⚠️ Cache read failed: {e}")
+            return None
+        self.logger.info(f"💾 Cache hit for {provider}/{model}")
+        return response
+
+    def put(self, provider: str, model: Optional[str], prompt: str, response: str,
+            params: Optional[Dict[str, Any]] = None, ttl: Optional[float] = None):
+        """Store a successful response and enforce the size bounds"""
+        if not self.enabled or not isinstance(response, str) or not response:
+            return
+        key = make_cache_key(provider, model, prompt, params)
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, provider, model, response, size, created_at, expires_at, last_access, hits) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                    (key, provider, model or "", response, size, now, now + (ttl if ttl is not None else self.ttl), now)
+                )
+                self.stats['writes'] += 1
+                self._evict(conn)
+                conn.commit()
+        except sqlite3.Error as e:
+            self.logger.warning(f"⚠️ Cache write failed: {e}")
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Drop expired entries, then least recently used ones until within bounds"""
+        cursor = conn.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+        self.stats['evictions'] += cursor.rowcount
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        while count > self.max_entries or total > self.max_bytes:
+            batch = max(1, count - self.max_entries, count // 20)
+            rows = conn.execute(
+                "SELECT key, size FROM responses ORDER BY last_access ASC LIMIT ?", (batch,)
+            ).fetchall()
+            if not rows:
+                break
+            conn.executemany("DELETE FROM responses WHERE key = ?", [(r[0],) for r in rows])
+            self.stats['evictions'] += len(rows)
+            count -= len(rows)
+            total -= sum(r[1] for r in rows)
+
+    def clear(self):
+        """Remove every cached response"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get hit/miss counters and current cache size"""
+        status = {
+            'enabled': self.enabled,
+            'path': str(self.path),
+            'ttl': self.ttl,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            **self.stats,
+        }
+        lookups = self.stats['hits'] + self.stats['misses']
+        status['hit_rate'] = self.stats['hits'] / lookups if lookups else 0.0
+        if self.enabled:
+            try:
+                with self._lock:
+                    count, total = self._connect().execute(
+                        "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+                    ).fetchone()
+                status['entries'] = count
+                status['bytes'] = total
+            except sqlite3.Error as e:
+                status['error'] = str(e)
+        return status
+
+
+# Global instance for easy access
+response_cache = LLMResponseCache()
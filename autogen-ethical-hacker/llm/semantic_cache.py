@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+🧲 Semantic LLM Response Cache
+Serves near-duplicate prompts (same request, different IPs, timestamps or ordering) from
+earlier answers, using a local hashed bag-of-words vectorizer and a NumPy nearest-neighbour index
+"""
+
+import os
+import re
+import json
+import time
+import zlib
+import threading
+import logging
+from collections import deque
+from typing import Dict, Any, Optional, List, Tuple
+
+import numpy as np
+
+from llm.response_cache import PROJECT_ROOT, make_cache_key
+
+DEFAULT_AUDIT_PATH = PROJECT_ROOT / "cache" / "semantic_cache_audit.jsonl"
+
+# Volatile values that are abstracted to placeholders; first match wins, so specific patterns go first
+PLACEHOLDER_PATTERNS = (
+    ('TIMESTAMP', re.compile(r'\b\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?\b')),
+    ('UUID', re.compile(r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b')),
+    ('MAC', re.compile(r'\b(?:[0-9a-fA-F]{2}:){5}[0-9a-fA-F]{2}\b')),
+    ('IP', re.compile(r'\b(?:\d{1,3}\.){3}\d{1,3}(?:/\d{1,2})?\b')),
+    ('DATE', re.compile(r'\b\d{4}-\d{2}-\d{2}\b')),
+    ('TIME', re.compile(r'\b\d{2}:\d{2}:\d{2}(?:\.\d+)?\b')),
+    ('HASH', re.compile(r'\b[0-9a-fA-F]{32,64}\b')),
+)
+# Values that decide a security conclusion: prompts differing in any of them never share an answer
+FACT_PATTERN = re.compile(
+    r'\bCVE-\d{4}-\d{4,}\b'
+    r'|\b\d{1,5}/(?:tcp|udp|sctp)\b'
+    r'|\bports?\s+\d{1,5}\b'
+    r'|\bv?\d+(?:\.\d+)+[a-z0-9]*(?:[-+~][a-z0-9.]+)*\b'
+    r'|\b(?:open\|filtered|closed\|filtered|open|closed|filtered|unfiltered)\b',
+    re.IGNORECASE)
+_PLACEHOLDER = re.compile(r'<(' + '|'.join(kind for kind, _ in PLACEHOLDER_PATTERNS) + r')_(\d+)>')
+_WORD = re.compile(r'<[A-Z]+_\d+>|[A-Za-z0-9]+(?:[._/-][A-Za-z0-9]+)*')
+
+
+def extract_placeholders(text: str) -> Tuple[str, Dict[str, str]]:
+    """
+    Replace volatile values with numbered placeholders (<IP_1>, <TIMESTAMP_1>, ...)
+
+    Returns the template and {placeholder: value}; repeated values reuse one placeholder.
+    """
+    values = {}
+    counters = {}
+    seen = {}
+    template = str(text)
+    for kind, pattern in PLACEHOLDER_PATTERNS:
+        def substitute(match, kind=kind):
+            value = match.group(0)
+            label = seen.get(value)
+            if label is None:
+                counters[kind] = counters.get(kind, 0) + 1
+                label = seen[value] = f"<{kind}_{counters[kind]}>"
+                values[label] = value
+            return label
+        template = pattern.sub(substitute, template)
+    return template, values
+
+
+def extract_facts(template: str) -> Tuple[str, ...]:
+    """CVE ids, port numbers, port states and versions in a template, in order and normalised"""
+    return tuple(re.sub(r'\s+', ' ', fact).lower() for fact in FACT_PATTERN.findall(template))
+
+
+class HashingVectorizer:
+    """Signed feature hashing of unigrams and bigrams into a fixed-size, L2-normalised vector"""
+
+    def __init__(self, dimensions: int = 2048):
+        self.dimensions = dimensions
+
+    def tokens(self, template: str) -> List[str]:
+        # Placeholders count by kind only, so different addresses produce the same features
+        return [_PLACEHOLDER.sub(lambda m: f"<{m.group(1)}>", w) if w.startswith('<') else w.lower()
+                for w in _WORD.findall(template)]
+
+    def transform(self, template: str) -> np.ndarray:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        words = self.tokens(template)
+        features = [(w, 1.0) for w in words] + [(f"{a} {b}", 0.5) for a, b in zip(words, words[1:])]
+        for feature, weight in features:
+            digest = zlib.crc32(feature.encode('utf-8'))
+            vector[digest % self.dimensions] += weight if digest & 0x80000000 else -weight
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """
+    Opt-in near-duplicate cache (LLM_SEMANTIC_CACHE=1). A hit needs the same provider, model and
+    generation parameters, the same set of placeholders, the same CVE ids, ports, port states and
+    versions in the same order, and cosine similarity >= threshold.
+    """
+
+    def __init__(self, enabled: Optional[bool] = None, threshold: Optional[float] = None,
+                 max_entries: int = 5000, dimensions: int = 2048, audit_path: Optional[str] = None):
+        if enabled is None:
+            enabled = os.environ.get("LLM_SEMANTIC_CACHE", "").lower() in ("1", "true", "yes")
+        self.enabled = enabled
+        self.threshold = float(threshold if threshold is not None else os.environ.get("LLM_SEMANTIC_CACHE_THRESHOLD", 0.92))
+        self.max_entries = max_entries
+        self.audit_path = audit_path or os.environ.get("LLM_SEMANTIC_CACHE_AUDIT", str(DEFAULT_AUDIT_PATH))
+        self.vectorizer = HashingVectorizer(dimensions)
+
+        self._lock = threading.Lock()
+        # Grown on demand up to max_entries, so a disabled or idle cache costs no memory
+        self._vectors = np.zeros((0, dimensions), dtype=np.float32)
+        self._entries = []
+        # Each entry's scope as a small integer, so lookups filter by scope before ranking
+        self._scope_ids = np.zeros(0, dtype=np.int32)
+        self._scope_index = {}
+        self._next = 0
+        self._size = 0
+        self.recent_hits = deque(maxlen=50)
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'rejected_placeholders': 0, 'rejected_facts': 0}
+
+        self.setup_logging()
+
+    def setup_logging(self):
+        """Setup logging for semantic cache operations"""
+        self.logger = logging.getLogger('SemanticCache')
+        if not self.logger.handlers:
+            handler = logging.StreamHandler()
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+
+    def configure(self, enabled: Optional[bool] = None, threshold: Optional[float] = None):
+        """Enable/disable the cache or tune the similarity threshold at runtime"""
+        with self._lock:
+            if enabled is not None:
+                self.enabled = enabled
+            if threshold is not None:
+                self.threshold = float(threshold)
+
+    @staticmethod
+    def _scope(provider: str, model: Optional[str], params: Optional[Dict[str, Any]]) -> str:
+        return make_cache_key(provider, model, "", params)
+
+    def get(self, provider: str, model: Optional[str], prompt: str, params: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """Return a cached answer for a near-duplicate prompt, with this prompt's values filled in"""
+        if not self.enabled:
+            return None
+        template, values = extract_placeholders(prompt)
+        facts = extract_facts(template)
+        vector = self.vectorizer.transform(template)
+        scope = self._scope(provider, model, params)
+
+        with self._lock:
+            scope_id = self._scope_index.get(scope)
+            # Only entries of this provider, model and parameters compete for the top-k
+            candidates = np.flatnonzero(self._scope_ids[:self._size] == scope_id) if scope_id is not None else []
+            if not len(candidates):
+                self.stats['misses'] += 1
+                return None
+            similarities = self._vectors[candidates] @ vector
+            best = None
+            for rank in np.argsort(similarities)[::-1][:5]:
+                similarity = float(similarities[rank])
+                if similarity < self.threshold:
+                    break
+                entry = self._entries[candidates[rank]]
+                if set(entry['labels']) != set(values):
+                    self.stats['rejected_placeholders'] += 1
+                    continue
+                if entry['facts'] != facts:
+                    # e.g. another version, port or port state: the earlier conclusion does not carry over
+                    self.stats['rejected_facts'] += 1
+                    continue
+                best = (entry, similarity)
+                break
+            if best is None:
+                self.stats['misses'] += 1
+                return None
+            entry, similarity = best
+            self.stats['hits'] += 1
+
+        response = _PLACEHOLDER.sub(lambda m: values.get(m.group(0), m.group(0)), entry['response'])
+        self._audit(provider, model, prompt, entry['prompt'], similarity)
+        return response
+
+    def put(self, provider: str, model: Optional[str], prompt: str, response: str,
+            params: Optional[Dict[str, Any]] = None):
+        """Index a completed prompt; the prompt's volatile values are abstracted in the stored answer too"""
+        if not self.enabled or not response:
+            return
+        template, values = extract_placeholders(prompt)
+        response_template = response
+        for label, value in sorted(values.items(), key=lambda item: -len(item[1])):
+            response_template = re.sub(r'(?<![\w.])' + re.escape(value) + r'(?![\w/]|\.\d)', label, response_template)
+        vector = self.vectorizer.transform(template)
+
+        with self._lock:
+            if self._next >= len(self._vectors):
+                grown = min(self.max_entries, max(256, len(self._vectors) * 2))
+                self._vectors = np.vstack([self._vectors, np.zeros((grown - len(self._vectors), self.vectorizer.dimensions), dtype=np.float32)])
+                self._scope_ids = np.concatenate([self._scope_ids, np.full(grown - len(self._scope_ids), -1, dtype=np.int32)])
+                self._entries.extend([None] * (grown - len(self._entries)))
+            scope = self._scope(provider, model, params)
+            # Ring buffer: the oldest entry is overwritten once full
+            self._vectors[self._next] = vector
+            self._scope_ids[self._next] = self._scope_index.setdefault(scope, len(self._scope_index))
+            self._entries[self._next] = {
+                'scope': scope,
+                'labels': list(values),
+                'facts': extract_facts(template),
+                'prompt': prompt[:2000],
+                'response': response_template,
+            }
+            self._next = (self._next + 1) % self.max_entries
+            self._size = min(self._size + 1, self.max_entries)
+            self.stats['writes'] += 1
+
+    def _audit(self, provider: str, model: Optional[str], prompt: str, cached_prompt: str, similarity: float):
+        """Record every hit so reuse quality can be reviewed"""
+        record = {
+            'timestamp': time.time(),
+            'provider': provider,
+            'model': model,
+            'similarity': round(similarity, 4),
+            'threshold': self.threshold,
+            'prompt': prompt[:500],
+            'cached_prompt': cached_prompt[:500],
+        }
+        self.recent_hits.append(record)
+        self.logger.info(f"🧲 Semantic cache hit ({similarity:.3f}) for {provider}/{model}")
+        try:
+            os.makedirs(os.path.dirname(self.audit_path), exist_ok=True)
+            with open(self.audit_path, 'a') as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            self.logger.warning(f"⚠️ Could not write semantic cache audit: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._vectors = np.zeros((0, self.vectorizer.dimensions), dtype=np.float32)
+            self._entries = []
+            self._scope_ids = np.zeros(0, dtype=np.int32)
+            self._scope_index = {}
+            self._next = self._size = 0
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get semantic cache configuration, counters and the most recent audited hits"""
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                'enabled': self.enabled,
+                'threshold': self.threshold,
+                'entries': self._size,
+                'hit_rate': self.stats['hits'] / lookups if lookups else 0.0,
+                'audit_path': self.audit_path,
+                'recent_hits': list(self.recent_hits)[-5:],
+                **self.stats,
+            }
+
+
+# Global instance for easy access
+semantic_cache = SemanticCache()
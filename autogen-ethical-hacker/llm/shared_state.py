@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+🤝 Shared LLM Routing State
+Small SQLite (WAL) store for circuit-breaker, key-health and rate-limit state, read and
+updated atomically by every process on the host and kept across restarts
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+import logging
+from pathlib import Path
+from typing import Dict, Any, Optional, Callable, Union
+
+from llm.response_cache import PROJECT_ROOT
+
+DEFAULT_STATE_PATH = PROJECT_ROOT / "cache" / "llm_state.sqlite3"
+
+
+class SharedStateStore:
+    """
+    Namespaced JSON records with optional expiry. All timestamps stored in records are
+    wall-clock (time.time()) so that every process reads them the same way.
+    """
+
+    def __init__(self, path: Optional[str] = None, enabled: Optional[bool] = None):
+        self.path = Path(path or os.environ.get("LLM_SHARED_STATE_PATH", DEFAULT_STATE_PATH))
+        if enabled is None:
+            enabled = os.environ.get("LLM_SHARED_STATE_DISABLED", "").lower() not in ("1", "true", "yes")
+        self.enabled = enabled
+
+        self.stats = {'reads': 0, 'writes': 0, 'errors': 0}
+        self._lock = threading.Lock()
+        self._conn = None
+
+        self.setup_logging()
+
+    def setup_logging(self):
+        """Setup logging for shared state operations"""
+        self.logger = logging.getLogger('SharedStateStore')
+        if not self.logger.handlers:
+            handler = logging.StreamHandler()
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the database lazily so importing the module never touches disk"""
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+            conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS state (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    expires_at REAL,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+            self._conn = conn
+        return self._conn
+
+    def _failed(self, action: str, error: Exception):
+        # The store only saves rediscovery work; routing carries on with process-local state
+        self.stats['errors'] += 1
+        self.logger.warning(f"⚠️ Shared state {action} failed: {error}")
+
+    def get(self, namespace: str, key: str) -> Optional[Dict[str, Any]]:
+        """Return a record, or None when missing or expired"""
+        if not self.enabled:
+            return None
+        try:
+            with self._lock:
+                row = self._connect().execute(
+                    "SELECT value FROM state WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                    (namespace, key, time.time())
+                ).fetchone()
+                self.stats['reads'] += 1
+        except sqlite3.Error as e:
+            self._failed("read", e)
+            return None
+        return json.loads(row[0]) if row else None
+
+    def items(self, namespace: str) -> Dict[str, Dict[str, Any]]:
+        """All live records of a namespace"""
+        if not self.enabled:
+            return {}
+        try:
+            with self._lock:
+                rows = self._connect().execute(
+                    "SELECT key, value FROM state WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)",
+                    (namespace, time.time())
+                ).fetchall()
+                self.stats['reads'] += 1
+        except sqlite3.Error as e:
+            self._failed("read", e)
+            return {}
+        return {key: json.loads(value) for key, value in rows}
+
+    def put(self, namespace: str, key: str, value: Dict[str, Any], ttl: Optional[float] = None):
+        """Write a record; it disappears after ttl seconds when one is given"""
+        if not self.enabled:
+            return
+        now = time.time()
+        try:
+            with self._lock:
+                self._connect().execute(
+                    "INSERT OR REPLACE INTO state (namespace, key, value, updated_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                    (namespace, key, json.dumps(value), now, now + ttl if ttl else None)
+                )
+                self.stats['writes'] += 1
+        except sqlite3.Error as e:
+            self._failed("write", e)
+
+    def update(self, namespace: str, key: str, fn: Callable[[Optional[Dict[str, Any]]], Optional[Dict[str, Any]]],
+               ttl: Union[None, float, Callable[[Dict[str, Any]], Optional[float]]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Atomic read-modify-write across processes: fn(current or None) returns the new record
+        (None deletes it). ttl may depend on the new record. Returns the new record, or
+        fn(None) applied locally if the store is unusable.
+        """
+        if not self.enabled:
+            return fn(None)
+        now = time.time()
+        value = applied = None
+        try:
+            with self._lock:
+                conn = self._connect()
+                # BEGIN IMMEDIATE takes the write lock up front, so no other process can interleave
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    row = conn.execute(
+                        "SELECT value FROM state WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                        (namespace, key, now)
+                    ).fetchone()
+                    value = fn(json.loads(row[0]) if row else None)
+                    applied = True
+                    if value is None:
+                        conn.execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+                    else:
+                        if callable(ttl):
+                            ttl = ttl(value)
+                        conn.execute(
+                            "INSERT OR REPLACE INTO state (namespace, key, value, updated_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                            (namespace, key, json.dumps(value), now, now + ttl if ttl else None)
+                        )
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                self.stats['writes'] += 1
+                return value
+        except sqlite3.Error as e:
+            self._failed("update", e)
+            # fn runs exactly once: if only the write failed, its result still applies locally
+            return value if applied else fn(None)
+
+    def delete(self, namespace: str, key: Optional[str] = None):
+        """Delete one record, or a whole namespace"""
+        if not self.enabled:
+            return
+        try:
+            with self._lock:
+                if key is None:
+                    self._connect().execute("DELETE FROM state WHERE namespace = ?", (namespace,))
+                else:
+                    self._connect().execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+        except sqlite3.Error as e:
+            self._failed("delete", e)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get store location, counters and live record counts per namespace"""
+        status = {'enabled': self.enabled, 'path': str(self.path), **self.stats}
+        if self.enabled:
+            try:
+                with self._lock:
+                    rows = self._connect().execute(
+                        "SELECT namespace, COUNT(*) FROM state WHERE expires_at IS NULL OR expires_at > ? GROUP BY namespace",
+                        (time.time(),)
+                    ).fetchall()
+                status['records'] = dict(rows)
+            except sqlite3.Error as e:
+                status['error'] = str(e)
+        return status
+
+
+# Global instance for easy access
+shared_state = SharedStateStore()
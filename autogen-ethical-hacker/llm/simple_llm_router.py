@@ -2,15 +2,37 @@
 Simple LLM Router: Direct API calls without complex dependencies
 """
 import os
-import requests
 import json
+from llm.response_cache import response_cache, make_cache_key
+from llm.client_pool import client_registry
+from llm.single_flight import single_flight
+from llm.cassette import llm_cassette
+from llm.telemetry import llm_telemetry
+from llm.output_budget import output_budget, normalize_finish_reason
+from llm.request_scheduler import request_scheduler
+from llm.cost_ledger import cost_ledger
+
+
+class APIResponseError(Exception):
+    """Non-200 response; raised inside the cassette so error pages are never recorded"""
+
 
 def llm_complete(prompt, provider="groq", model=None, **kwargs):
     """Simple LLM completion using direct API calls"""
+    with llm_telemetry.call(provider, model, prompt) as call:
+        result = _complete(prompt, provider, model, **kwargs)
+        if result.startswith(("Error:", "Groq API Error", "Groq Error", "Google API Error", "Google Error", "Unknown provider")):
+            call.note(error=result)
+        call.set_result(result)
+        return result
+
+
+def _complete(prompt, provider, model, **kwargs):
+    use_cache = kwargs.pop("use_cache", True)
     
     if provider == "groq":
         api_key = os.environ.get("GROQ_API_KEY")
-        if not api_key:
+        if not api_key and not llm_cassette.replaying:
             return f"Error: GROQ_API_KEY not found in environment"
         
         url = "https://api.groq.com/openai/v1/chat/completions"
@@ -19,26 +41,56 @@ def llm_complete(prompt, provider="groq", model=None, **kwargs):
             "Content-Type": "application/json"
         }
         
+        model = cost_ledger.model_for(provider, model or "openai/gpt-oss-120b")
         data = {
-            "model": model or "openai/gpt-oss-120b",
+            "model": model,
             "messages": [{"role": "user", "content": prompt}],
             "temperature": kwargs.get("temperature", 0.7),
             "max_tokens": kwargs.get("max_tokens", 1024)
         }
+        # The caches and cassette are addressed with the default limit; the request carries the
+        # one sized from this call site's answer lengths unless given (truncated answers are continued)
+        key = data
+        if "max_tokens" not in kwargs:
+            data = {**data, "max_tokens": output_budget.limit(provider, model, 1024)}
+        
+        llm_telemetry.note(model=data["model"])
+        if use_cache:
+            cached = response_cache.get(provider, data["model"], prompt, key)
+            if cached is not None:
+                llm_telemetry.note(cache_hit=True)
+                return cached
         
-        try:
-            response = requests.post(url, headers=headers, json=data, timeout=30)
-            if response.status_code == 200:
-                result = response.json()
-                return result["choices"][0]["message"]["content"]
-            else:
-                return f"Groq API Error: {response.status_code} - {response.text}"
-        except Exception as e:
-            return f"Groq Error: {str(e)}"
+        def request(text):
+            meta = {}
+            body = {**data, "messages": [{"role": "user", "content": text}]}
+            def fetch():
+                response = client_registry.get_http_session(provider).post(url, headers=headers, json=body, timeout=30)
+                if response.status_code != 200:
+                    raise APIResponseError(f"Groq API Error: {response.status_code} - {response.text}")
+                choice = response.json()["choices"][0]
+                meta["finish_reason"] = normalize_finish_reason(choice.get("finish_reason"))
+                return choice["message"]["content"]
+            return llm_cassette.complete(provider, data["model"], text, key, fetch, meta), meta.get("finish_reason")
+        
+        def call():
+            try:
+                with request_scheduler.slot(provider):
+                    content = output_budget.complete(prompt, request)
+                if use_cache:
+                    response_cache.put(provider, data["model"], prompt, content, key)
+                return content
+            except APIResponseError as e:
+                return str(e)
+            except Exception as e:
+                return f"Groq Error: {str(e)}"
+        
+        # Identical concurrent requests share one API call
+        return single_flight.do(make_cache_key(provider, data["model"], prompt, key), call)
     
     elif provider == "google":
         api_key = os.environ.get("GOOGLE_API_KEY")
-        if not api_key:
+        if not api_key and not llm_cassette.replaying:
             return f"Error: GOOGLE_API_KEY not found in environment"
         
         url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-latest:generateContent?key={api_key}"
@@ -52,15 +104,32 @@ def llm_complete(prompt, provider="groq", model=None, **kwargs):
             }]
         }
         
-        try:
-            response = requests.post(url, headers=headers, json=data, timeout=30)
-            if response.status_code == 200:
-                result = response.json()
-                return result["candidates"][0]["content"]["parts"][0]["text"]
-            else:
-                return f"Google API Error: {response.status_code} - {response.text}"
-        except Exception as e:
-            return f"Google Error: {str(e)}"
+        llm_telemetry.note(model="gemini-1.5-flash-latest")
+        if use_cache:
+            cached = response_cache.get(provider, "gemini-1.5-flash-latest", prompt)
+            if cached is not None:
+                llm_telemetry.note(cache_hit=True)
+                return cached
+        
+        def fetch():
+            response = client_registry.get_http_session(provider).post(url, headers=headers, json=data, timeout=30)
+            if response.status_code != 200:
+                raise APIResponseError(f"Google API Error: {response.status_code} - {response.text}")
+            return response.json()["candidates"][0]["content"]["parts"][0]["text"]
+        
+        def call():
+            try:
+                with request_scheduler.slot(provider):
+                    content = llm_cassette.complete(provider, "gemini-1.5-flash-latest", prompt, None, fetch)
+                if use_cache:
+                    response_cache.put(provider, "gemini-1.5-flash-latest", prompt, content)
+                return content
+            except APIResponseError as e:
+                return str(e)
+            except Exception as e:
+                return f"Google Error: {str(e)}"
+        
+        return single_flight.do(make_cache_key(provider, "gemini-1.5-flash-latest", prompt), call)
     
     else:
         return f"Unknown provider: {provider}"
\ No newline at end of file
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+🪢 Single-Flight Request Coalescing
+Concurrent identical LLM requests attach to one outstanding call and share its result or error
+"""
+
+import asyncio
+import threading
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class _Call:
+    """An in-flight call that followers wait on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Thread-based single-flight for the synchronous routers
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = {'leaders': 0, 'coalesced': 0}
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """Run func once per key at a time; concurrent callers share the outcome"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.stats['coalesced'] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.stats['leaders'] += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, 'in_flight': len(self._calls)}
+
+
+class AsyncSingleFlight:
+    """
+    asyncio single-flight; the shared call runs as its own task so one caller's
+    cancellation does not cancel the others, and it is cancelled once nobody waits
+    """
+
+    def __init__(self):
+        self._calls = weakref.WeakKeyDictionary()
+        self.stats = {'leaders': 0, 'coalesced': 0}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        calls = self._calls.setdefault(loop, {})
+        entry = calls.get(key)
+        if entry is not None:
+            self.stats['coalesced'] += 1
+        else:
+            self.stats['leaders'] += 1
+            task = loop.create_task(func())
+            entry = calls[key] = {'task': task, 'waiters': 0}
+            task.add_done_callback(lambda _t: calls.pop(key, None) if calls.get(key) is entry else None)
+
+        entry['waiters'] += 1
+        try:
+            return await asyncio.shield(entry['task'])
+        except asyncio.CancelledError:
+            if not entry['task'].done() and entry['waiters'] == 1:
+                entry['task'].cancel()
+            raise
+        finally:
+            entry['waiters'] -= 1
+
+    def get_status(self) -> Dict[str, Any]:
+        return {**self.stats, 'in_flight': sum(len(c) for c in self._calls.values())}
+
+
+# Global instances shared by all routers
+single_flight = SingleFlight()
+async_single_flight = AsyncSingleFlight()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+⏱️ Streaming Metrics
+Time-to-first-token and tokens-per-second per provider for streamed completions
+"""
+
+import time
+import threading
+from collections import deque
+from typing import Dict, Any, Optional
+
+from llm.telemetry import llm_telemetry
+
+
+class StreamRecorder:
+    """Measures a single streamed completion; streamed deltas are counted as tokens"""
+
+    def __init__(self, metrics: "StreamMetrics", provider: str, model: Optional[str] = None):
+        self.metrics = metrics
+        self.provider = provider
+        self.model = model
+        self.started = time.monotonic()
+        self.first_token_at = None
+        self.tokens = 0
+        self.finished = False
+        # The logical call this stream serves, if one is being measured (its TTFT comes from here)
+        self.call = llm_telemetry.current()
+
+    def on_token(self, text: str):
+        if not text:
+            return
+        if self.call is not None:
+            self.call.on_token(text)
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+        self.tokens += 1
+
+    @property
+    def ttft(self) -> Optional[float]:
+        return None if self.first_token_at is None else self.first_token_at - self.started
+
+    def finish(self, error: Optional[BaseException] = None):
+        if self.finished:
+            return
+        self.finished = True
+        self.metrics._record(self, time.monotonic(), error)
+
+
+class StreamMetrics:
+    """
+    Rolling per-provider streaming statistics
+    """
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._providers = {}
+
+    def start(self, provider: str, model: Optional[str] = None) -> StreamRecorder:
+        """Begin measuring a streamed completion"""
+        return StreamRecorder(self, provider, model)
+
+    def _record(self, recorder: StreamRecorder, ended: float, error: Optional[BaseException]):
+        with self._lock:
+            stats = self._providers.get(recorder.provider)
+            if stats is None:
+                stats = self._providers[recorder.provider] = {
+                    'streams': 0, 'errors': 0, 'tokens': 0,
+                    'ttft': deque(maxlen=self.window), 'tps': deque(maxlen=self.window),
+                }
+            stats['streams'] += 1
+            stats['tokens'] += recorder.tokens
+            if error is not None:
+                stats['errors'] += 1
+            if recorder.ttft is not None:
+                stats['ttft'].append(recorder.ttft)
+                generation_time = ended - recorder.first_token_at
+                if recorder.tokens > 1 and generation_time > 0:
+                    stats['tps'].append((recorder.tokens - 1) / generation_time)
+
+    @staticmethod
+    def _summary(values) -> Dict[str, Optional[float]]:
+        ordered = sorted(values)
+        if not ordered:
+            return {'avg': None, 'p50': None, 'p95': None}
+        return {
+            'avg': sum(ordered) / len(ordered),
+            'p50': ordered[len(ordered) // 2],
+            'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        }
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get TTFT (seconds) and tokens-per-second summaries per provider"""
+        with self._lock:
+            return {
+                provider: {
+                    'streams': stats['streams'],
+                    'errors': stats['errors'],
+                    'tokens': stats['tokens'],
+                    'ttft_seconds': self._summary(stats['ttft']),
+                    'tokens_per_second': self._summary(stats['tps']),
+                }
+                for provider, stats in self._providers.items()
+            }
+
+
+# Global instance for easy access
+stream_metrics = StreamMetrics()
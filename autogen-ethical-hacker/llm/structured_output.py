@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+🧩 Structured LLM Output
+Schema-driven completions: provider JSON modes, incremental parsing and validation while
+tokens stream in, early stop once the object closes, and field-level repair
+"""
+
+import re
+import json
+import logging
+from typing import Dict, Any, Optional, List, Tuple
+
+from llm.llm_router import llm_stream
+from llm.response_cache import response_cache
+
+logger = logging.getLogger('StructuredOutput')
+
+JSON_TYPES = {
+    'object': dict, 'array': list, 'string': str, 'boolean': bool,
+    'number': (int, float), 'integer': int, 'null': type(None),
+}
+
+
+class StructuredOutputError(Exception):
+    """Raised when no JSON object can be recovered from a completion"""
+
+
+def validate(value: Any, schema: Dict[str, Any], path: str = "") -> List[Tuple[str, str]]:
+    """
+    Validate against a JSON-Schema subset (type, properties, required, items, enum,
+    minimum, maximum). Returns (path, message) pairs; an empty list means valid.
+    """
+    errors = []
+    expected = schema.get('type')
+    if expected:
+        types = expected if isinstance(expected, list) else [expected]
+        ok = any(isinstance(value, JSON_TYPES[t]) and not (t in ('number', 'integer') and isinstance(value, bool))
+                 for t in types if t in JSON_TYPES)
+        if not ok:
+            return [(path, f"expected {expected}, got {type(value).__name__}")]
+    if 'enum' in schema and value not in schema['enum']:
+        errors.append((path, f"expected one of {schema['enum']}"))
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if 'minimum' in schema and value < schema['minimum']:
+            errors.append((path, f"below minimum {schema['minimum']}"))
+        if 'maximum' in schema and value > schema['maximum']:
+            errors.append((path, f"above maximum {schema['maximum']}"))
+    if isinstance(value, dict):
+        for name in schema.get('required', []):
+            if name not in value:
+                errors.append((f"{path}.{name}" if path else name, "missing required field"))
+        for name, subschema in schema.get('properties', {}).items():
+            if name in value:
+                errors.extend(validate(value[name], subschema, f"{path}.{name}" if path else name))
+    if isinstance(value, list) and 'items' in schema:
+        for index, item in enumerate(value):
+            errors.extend(validate(item, schema['items'], f"{path}[{index}]"))
+    return errors
+
+
+# Where a JSON object can start: a brace followed by a key or by the closing brace
+OBJECT_START = re.compile(r'\{\s*["}]')
+
+
+class IncrementalJSONParser:
+    """
+    Consumes streamed text and tracks the first top-level JSON object, ignoring any prose or
+    code fences around it (a brace only starts the object when a key or '}' follows it).
+    Completed top-level fields are coerced and validated as soon as they close.
+    """
+
+    def __init__(self, schema: Optional[Dict[str, Any]] = None):
+        self.schema = schema or {}
+        self.buffer = []
+        self.started = False
+        self.complete = False
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.field_errors = {}
+        self._checked_fields = set()
+        self._candidate = None
+
+    def feed(self, text: str) -> bool:
+        """Feed a chunk; returns True once the top-level object has closed"""
+        for char in text:
+            if self.complete:
+                break
+            if not self.started:
+                # A '{' (and any whitespace after it) is held until the next character shows
+                # whether it opens an object or is just a brace in the prose
+                if self._candidate is not None and char.isspace():
+                    self._candidate += char
+                    continue
+                if self._candidate is not None and char in '"}':
+                    self.started = True
+                    self.buffer.extend(self._candidate)
+                    self.depth = 1
+                self._candidate = None
+                if not self.started:
+                    if char == '{':
+                        self._candidate = char
+                    continue
+            self.buffer.append(char)
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                continue
+            if char == '"':
+                self.in_string = True
+            elif char in '{[':
+                self.depth += 1
+            elif char in '}]':
+                self.depth -= 1
+                if self.depth == 0:
+                    self.complete = True
+            elif char == ',' and self.depth == 1:
+                self._check_fields("".join(self.buffer[:-1]) + "}")
+        return self.complete
+
+    def _check_fields(self, text: str):
+        """Validate fields that have fully arrived, before the rest of the object streams in"""
+        try:
+            partial = json.loads(text)
+        except ValueError:
+            return
+        properties = self.schema.get('properties', {})
+        for name, value in partial.items():
+            if name in self._checked_fields or name not in properties:
+                continue
+            self._checked_fields.add(name)
+            errors = validate(_coerce(value, properties[name]), properties[name], name)
+            if errors:
+                self.field_errors[name] = errors
+
+    @property
+    def text(self) -> str:
+        return "".join(self.buffer)
+
+
+def _close_open(text: str) -> str:
+    """Append whatever closing quotes/brackets are still open, innermost first"""
+    stack = []
+    in_string = escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+        elif char in '}]' and stack:
+            stack.pop()
+    return text + ('"' if in_string else '') + "".join(reversed(stack))
+
+
+def _repair_text(text: str) -> Optional[Any]:
+    """Best-effort local fixes for almost-JSON: code fences, trailing commas, truncated output"""
+    text = re.sub(r'^```(?:json)?|```$', '', text.strip(), flags=re.M).strip()
+    start = OBJECT_START.search(text)
+    if start is None:
+        return None
+    text = re.sub(r',\s*([}\]])', r'\1', text[start.start():])
+    # As written, with open brackets closed, and cut back to the last complete member
+    candidates = [text, _close_open(text)]
+    if ',' in text:
+        candidates.append(_close_open(text[:text.rindex(',')]))
+    for candidate in candidates:
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            continue
+    return None
+
+
+def _coerce(value: Any, schema: Dict[str, Any]) -> Any:
+    """Fix common type slips locally (numbers as strings, scalars for arrays, ...)"""
+    expected = schema.get('type')
+    try:
+        if expected in ('number', 'integer') and isinstance(value, str):
+            number = float(value.strip().rstrip('%'))
+            if value.strip().endswith('%'):
+                number /= 100.0
+            return int(number) if expected == 'integer' else number
+        if expected == 'boolean' and isinstance(value, str) and value.strip().lower() in ('true', 'false'):
+            return value.strip().lower() == 'true'
+        if expected == 'string' and isinstance(value, (int, float, bool)):
+            return str(value)
+        if isinstance(value, str) and 'enum' in schema and value not in schema['enum']:
+            folded = {str(option).lower(): option for option in schema['enum']}
+            return folded.get(value.strip().lower(), value)
+        if expected == 'array' and not isinstance(value, list):
+            return [value]
+    except ValueError:
+        pass
+    if isinstance(value, dict) and schema.get('properties'):
+        return {k: _coerce(v, schema['properties'][k]) if k in schema['properties'] else v for k, v in value.items()}
+    if isinstance(value, list) and isinstance(schema.get('items'), dict):
+        return [_coerce(item, schema['items']) for item in value]
+    return value
+
+
+class StructuredResult:
+    """Parsed object plus how it was obtained"""
+
+    def __init__(self, data: Dict[str, Any], errors: List[Tuple[str, str]], raw: str,
+                 repaired_fields: Optional[List[str]] = None, early_stop: bool = False):
+        self.data = data
+        self.errors = errors
+        self.raw = raw
+        self.repaired_fields = repaired_fields or []
+        self.early_stop = early_stop
+
+    @property
+    def valid(self) -> bool:
+        return not self.errors
+
+
+def _json_mode_kwargs(provider: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Provider-native JSON output settings"""
+    if provider == 'groq':
+        return {'response_format': {'type': 'json_object'}}
+    if provider == 'gemini':
+        return {'json_schema': schema}
+    return {}
+
+
+def _schema_prompt(prompt: str, schema: Dict[str, Any]) -> str:
+    return (f"{prompt}\n\nRespond with a single JSON object only, no prose, matching this JSON schema:\n"
+            f"{json.dumps(schema, separators=(',', ':'))}")
+
+
+def _stream_object(prompt: str, schema: Dict[str, Any], provider: str, model: Optional[str],
+                   kwargs: Dict[str, Any], cancel_event=None) -> Tuple[IncrementalJSONParser, str]:
+    parser = IncrementalJSONParser(schema)
+    parts = []
+    stream = llm_stream(_schema_prompt(prompt, schema), provider, model, **_json_mode_kwargs(provider, schema), **kwargs)
+    try:
+        for token in stream:
+            parts.append(token)
+            if parser.feed(token):
+                # Object closed: stop paying for tokens nobody will read
+                break
+            if parser.field_errors:
+                # A field is invalid even after coercion: the targeted repair re-requests it
+                # together with the fields not streamed yet, so the rest of this answer is not needed
+                logger.info(f"🧩 Field(s) invalid as streamed, stopping early: {', '.join(parser.field_errors)}")
+                break
+            if cancel_event is not None and cancel_event.is_set():
+                raise StructuredOutputError("cancelled")
+    finally:
+        stream.close()
+    return parser, "".join(parts)
+
+
+def structured_complete(prompt: str, schema: Dict[str, Any], provider: str = "groq",
+                        model: Optional[str] = None, max_repairs: int = 2, cancel_event=None,
+                        **kwargs) -> StructuredResult:
+    """
+    Complete a prompt into a JSON object matching `schema`
+
+    The response is parsed as it streams and generation stops when the object closes.
+    Invalid fields are first coerced locally; only fields that are still invalid are
+    re-requested, and the answers are merged back into the object. Setting cancel_event
+    (a threading.Event) abandons the stream with StructuredOutputError.
+    """
+    # Streams stop as soon as the object closes, so they never reach the router's cache; cache the result here
+    use_cache = kwargs.get("use_cache", True)
+    cache_prompt = _schema_prompt(prompt, schema)
+    cache_params = {"response_format": "json_schema"}
+    if use_cache:
+        cached = response_cache.get(provider, model, cache_prompt, cache_params)
+        if cached is not None:
+            return StructuredResult(json.loads(cached), [], cached)
+
+    parser, raw = _stream_object(prompt, schema, provider, model, kwargs, cancel_event)
+    early_stop = parser.complete or bool(parser.field_errors)
+    data = None
+    if parser.complete:
+        try:
+            data = json.loads(parser.text)
+        except ValueError:
+            data = None
+    if data is None:
+        data = _repair_text(parser.text or raw)
+    if not isinstance(data, dict):
+        # Nothing usable came back: one full re-ask is the only option
+        parser, raw = _stream_object(prompt, schema, provider, model, {**kwargs, 'use_cache': False}, cancel_event)
+        data = _repair_text(parser.text or raw)
+        if not isinstance(data, dict):
+            raise StructuredOutputError(f"No JSON object in response: {raw[:200]}")
+
+    data = _coerce(data, schema)
+    errors = validate(data, schema)
+    repaired = []
+    properties = schema.get('properties', {})
+
+    for _ in range(max_repairs):
+        failing = sorted({path.split('.')[0].split('[')[0] for path, _ in errors} & set(properties))
+        if not failing:
+            break
+        logger.info(f"🔧 Re-requesting invalid field(s): {', '.join(failing)}")
+        sub_schema = {
+            'type': 'object',
+            'properties': {name: properties[name] for name in failing},
+            'required': failing,
+        }
+        problems = "; ".join(f"{path}: {message}" for path, message in errors)
+        repair_prompt = (f"{prompt}\n\nA previous answer had invalid fields ({problems}). "
+                         f"Previous values: {json.dumps({k: data.get(k) for k in failing}, default=str)}. "
+                         f"Provide corrected values for only these fields.")
+        try:
+            repair_parser, repair_raw = _stream_object(repair_prompt, sub_schema, provider, model,
+                                                       {**kwargs, 'use_cache': False}, cancel_event)
+        except Exception as e:
+            logger.warning(f"⚠️ Field repair failed: {e}")
+            break
+        fixed = _repair_text(repair_parser.text or repair_raw)
+        if isinstance(fixed, dict):
+            fixed = _coerce(fixed, sub_schema)
+            for name in failing:
+                if name in fixed and not validate(fixed[name], properties[name], name):
+                    data[name] = fixed[name]
+                    repaired.append(name)
+        errors = validate(data, schema)
+
+    if use_cache and not errors:
+        response_cache.put(provider, model, cache_prompt, json.dumps(data), cache_params)
+    return StructuredResult(data, errors, raw, repaired, early_stop)
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+📈 LLM Call Telemetry
+Per-call records (provider, model, key, queue wait, TTFT, latency, tokens, retries, cache hits,
+calling agent) aggregated into HDR-style histograms, token counts and cost per model and per agent
+"""
+
+import os
+import sys
+import atexit
+import json
+import time
+import threading
+import contextvars
+import logging
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Callable
+
+from llm.response_cache import PROJECT_ROOT
+from llm.prompt_compaction import count_tokens
+
+DEFAULT_METRICS_PATH = PROJECT_ROOT / "cache" / "llm_metrics.json"
+LLM_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+STDLIB_DIR = os.path.dirname(os.path.abspath(os.__file__))
+
+# USD per million (prompt, completion) tokens; list prices, override with set_pricing()
+MODEL_PRICING = {
+    'openai/gpt-oss-120b': (0.15, 0.75),
+    'openai/gpt-oss-20b': (0.10, 0.50),
+    'llama3-70b-8192': (0.59, 0.79),
+    'llama-3.3-70b-versatile': (0.59, 0.79),
+    'llama3-8b-8192': (0.05, 0.08),
+    'llama-3.1-8b-instant': (0.05, 0.08),
+    'gemini-1.5-pro': (1.25, 5.00),
+    'gemini-1.5-flash': (0.075, 0.30),
+    'gemini-1.5-flash-latest': (0.075, 0.30),
+    'gemini-pro': (0.50, 1.50),
+}
+
+_current_agent = contextvars.ContextVar('llm_agent', default=None)
+_current_call = contextvars.ContextVar('llm_call', default=None)
+
+
+@contextmanager
+def agent_scope(name: str):
+    """Attribute every LLM call made inside the block (including awaited tasks) to `name`"""
+    token = _current_agent.set(name)
+    try:
+        yield
+    finally:
+        _current_agent.reset(token)
+
+
+def _caller_name() -> str:
+    """module.function of the first caller outside the llm package and the standard library"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        internal = filename.startswith(LLM_PACKAGE_DIR) or (
+            filename.startswith(STDLIB_DIR) and 'site-packages' not in filename) or filename.startswith('<')
+        if not internal:
+            return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return 'unknown'
+
+
+def current_agent() -> str:
+    """The agent LLM calls made here are attributed to: the enclosing agent_scope, else the caller"""
+    return _current_agent.get() or _caller_name()
+
+
+class LogHistogram:
+    """
+    HDR-style log-linear histogram over non-negative integers: every power-of-two range is
+    split into 2**precision_bits linear sub-buckets, so relative error stays under 2**-precision_bits
+    """
+
+    def __init__(self, precision_bits: int = 5):
+        self.precision_bits = precision_bits
+        self.sub_buckets = 1 << precision_bits
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value: int) -> int:
+        if value < self.sub_buckets:
+            return value
+        shift = value.bit_length() - self.precision_bits - 1
+        return self.sub_buckets * shift + (value >> shift)
+
+    def _bounds(self, index: int):
+        if index < self.sub_buckets:
+            return index, index
+        shift, top = divmod(index, self.sub_buckets)
+        top += self.sub_buckets
+        shift -= 1
+        return top << shift, ((top + 1) << shift) - 1
+
+    def record(self, value: float):
+        value = max(0, int(round(value)))
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Value at quantile q (0-100), reported as the middle of its bucket"""
+        if not self.count:
+            return None
+        rank = max(1, int(round(q / 100.0 * self.count)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                low, high = self._bounds(index)
+                return min(self.max, max(self.min, (low + high) / 2))
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'precision_bits': self.precision_bits, 'counts': {str(k): v for k, v in self.counts.items()},
+                'count': self.count, 'total': self.total, 'min': self.min, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LogHistogram":
+        histogram = cls(data.get('precision_bits', 5))
+        histogram.counts = {int(k): v for k, v in data.get('counts', {}).items()}
+        histogram.count = data.get('count', 0)
+        histogram.total = data.get('total', 0)
+        histogram.min = data.get('min')
+        histogram.max = data.get('max')
+        return histogram
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.min,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
+
+
+class LLMCall:
+    """
+    One logical LLM call. Used as a context manager it becomes the active call, so lower
+    layers (caches, retries, key selection, queues) can annotate it through llm_telemetry.note().
+    """
+
+    def __init__(self, telemetry: "LLMTelemetry", provider: str, model: Optional[str],
+                 prompt: Optional[str] = None, agent: Optional[str] = None):
+        self.telemetry = telemetry
+        self.provider = provider
+        self.model = model
+        self.agent = agent or current_agent()
+        self.started = time.monotonic()
+        self.first_token_at = None
+        self.queue_wait = 0.0
+        self.key_index = None
+        self.retries = 0
+        self.cache_hit = False
+        # Set once the provider answered; calls that never got a response are not billed
+        self.responded = False
+        self.prompt_tokens = count_tokens(prompt) if prompt else None
+        self.completion_tokens = None
+        self.completion_tokens_estimated = False
+        self.usage_reported = False
+        self.finish_reason = None
+        self.error = None
+        self.finished = False
+        self._token = None
+
+    def __enter__(self) -> "LLMCall":
+        self._token = _current_call.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            _current_call.reset(self._token)
+        except ValueError:
+            # A generator closed from another context (e.g. an async generator finalized by the loop)
+            pass
+        self.finish(exc if exc_type is not None and not issubclass(exc_type, GeneratorExit) else None)
+        return False
+
+    def on_token(self, text: str):
+        if text:
+            self.responded = True
+            if self.first_token_at is None:
+                self.first_token_at = time.monotonic()
+
+    def note(self, **fields):
+        for name, value in fields.items():
+            if value is None:
+                continue
+            if name == 'queue_wait':
+                self.queue_wait += value
+            else:
+                setattr(self, name, value)
+                if name in ('prompt_tokens', 'completion_tokens'):
+                    # Usage reported by the provider
+                    self.responded = True
+
+    def add_usage(self, prompt_tokens: Optional[int] = None, completion_tokens: Optional[int] = None):
+        """Provider-reported usage; the usage of each continuation (or hedged duplicate) adds up"""
+        if prompt_tokens is None and completion_tokens is None:
+            return
+        if not self.usage_reported:
+            # Reported counts replace the ones estimated from the text
+            self.usage_reported = True
+            self.prompt_tokens = self.completion_tokens = None
+            self.completion_tokens_estimated = False
+        self.responded = True
+        self.prompt_tokens = (self.prompt_tokens or 0) + (prompt_tokens or 0)
+        self.completion_tokens = (self.completion_tokens or 0) + (completion_tokens or 0)
+
+    def set_result(self, text: Optional[str]):
+        """Count completion tokens from the text, unless the provider reported them"""
+        if not text or self.error is not None:
+            # An "Error: ..." string returned in place of an answer is not model output
+            return
+        self.responded = True
+        if self.completion_tokens is None:
+            # Visible text only: a reasoning model's hidden reasoning tokens are not in it
+            self.completion_tokens = count_tokens(text)
+            self.completion_tokens_estimated = True
+
+    def finish(self, error: Optional[BaseException] = None, result: Optional[str] = None):
+        if self.finished:
+            return
+        self.finished = True
+        self.set_result(result)
+        self.telemetry._record(self, time.monotonic(), error or self.error)
+
+
+class LLMTelemetry:
+    """
+    Aggregates finished calls per provider/model and per calling agent. Set LLM_TELEMETRY_LOG
+    to also append every call as a JSON line.
+    """
+
+    def __init__(self, log_path: Optional[str] = None, recent: int = 200):
+        self.log_path = log_path or os.environ.get("LLM_TELEMETRY_LOG")
+        self.pricing = dict(MODEL_PRICING)
+        self._lock = threading.Lock()
+        self._groups = {}
+        self.recent = deque(maxlen=recent)
+        self._listeners = []
+        self.setup_logging()
+
+    def setup_logging(self):
+        """Setup logging for telemetry"""
+        self.logger = logging.getLogger('LLMTelemetry')
+        if not self.logger.handlers:
+            handler = logging.StreamHandler()
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+
+    def set_pricing(self, model: str, prompt_per_million: float, completion_per_million: float):
+        with self._lock:
+            self.pricing[model] = (prompt_per_million, completion_per_million)
+
+    def add_listener(self, listener: Callable[[Dict[str, Any]], None]):
+        """Have listener(record) called with every finished call's record"""
+        self._listeners.append(listener)
+
+    # -- recording ------------------------------------------------------------
+
+    def call(self, provider: str, model: Optional[str] = None, prompt: Optional[str] = None,
+             agent: Optional[str] = None) -> LLMCall:
+        """Start measuring a call; use as a context manager, or call finish() (e.g. in generators)"""
+        return LLMCall(self, provider, model, prompt, agent)
+
+    @staticmethod
+    def current() -> Optional[LLMCall]:
+        return _current_call.get()
+
+    @staticmethod
+    def note(**fields):
+        """Annotate the active call, if any (key_index, cache_hit, queue_wait, tokens, ...)"""
+        call = _current_call.get()
+        if call is not None:
+            call.note(**fields)
+
+    @staticmethod
+    def note_usage(prompt_tokens: Optional[int] = None, completion_tokens: Optional[int] = None):
+        """Add provider-reported token usage to the active call, if any"""
+        call = _current_call.get()
+        if call is not None:
+            call.add_usage(prompt_tokens, completion_tokens)
+
+    @staticmethod
+    def note_retry():
+        call = _current_call.get()
+        if call is not None:
+            call.retries += 1
+
+    def cost(self, model: Optional[str], prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> float:
+        rates = self.pricing.get((model or '').split('/', 1)[-1]) or self.pricing.get(model or '')
+        if not rates:
+            return 0.0
+        return ((prompt_tokens or 0) * rates[0] + (completion_tokens or 0) * rates[1]) / 1_000_000
+
+    def _group(self, name: str) -> Dict[str, Any]:
+        group = self._groups.get(name)
+        if group is None:
+            group = self._groups[name] = {
+                'calls': 0, 'errors': 0, 'cache_hits': 0, 'retries': 0,
+                'prompt_tokens': 0, 'completion_tokens': 0, 'cost_usd': 0.0, 'wall_time_s': 0.0,
+                'latency_ms': LogHistogram(), 'ttft_ms': LogHistogram(), 'queue_wait_ms': LogHistogram(),
+            }
+        return group
+
+    def _record(self, call: LLMCall, ended: float, error: Optional[BaseException]):
+        latency = ended - call.started
+        ttft = None if call.first_token_at is None else call.first_token_at - call.started
+        # Only requests a provider answered are billed: cached answers, refusals, missing keys
+        # and connection failures cost nothing, and count no tokens
+        sent = call.responded and not call.cache_hit
+        prompt_tokens = call.prompt_tokens if sent else None
+        completion_tokens = call.completion_tokens if sent else None
+        cost = self.cost(call.model, prompt_tokens, completion_tokens) if sent else 0.0
+        record = {
+            'timestamp': time.time(),
+            'provider': call.provider,
+            'model': call.model,
+            'agent': call.agent,
+            'key_index': call.key_index,
+            'queue_wait_s': round(call.queue_wait, 4),
+            'ttft_s': round(ttft, 4) if ttft is not None else None,
+            'latency_s': round(latency, 4),
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'completion_tokens_estimated': call.completion_tokens_estimated,
+            'responded': call.responded,
+            'retries': call.retries,
+            'cache_hit': call.cache_hit,
+            'finish_reason': call.finish_reason,
+            'cost_usd': round(cost, 6),
+            'error': str(error)[:200] if error is not None else None,
+        }
+        with self._lock:
+            for name in ('total', f"model:{call.provider}/{call.model}", f"agent:{call.agent}"):
+                group = self._group(name)
+                group['calls'] += 1
+                group['errors'] += error is not None
+                group['cache_hits'] += call.cache_hit
+                group['retries'] += call.retries
+                group['prompt_tokens'] += prompt_tokens or 0
+                group['completion_tokens'] += completion_tokens or 0
+                group['cost_usd'] += cost
+                group['wall_time_s'] += latency
+                group['latency_ms'].record(latency * 1000)
+                group['queue_wait_ms'].record(call.queue_wait * 1000)
+                if ttft is not None:
+                    group['ttft_ms'].record(ttft * 1000)
+            self.recent.append(record)
+        for listener in self._listeners:
+            try:
+                listener(record)
+            except Exception as e:
+                self.logger.warning(f"⚠️ Telemetry listener failed: {e}")
+        if self.log_path:
+            try:
+                with open(self.log_path, 'a') as f:
+                    f.write(json.dumps(record) + "\n")
+            except OSError as e:
+                self.logger.warning(f"⚠️ Could not write telemetry log: {e}")
+
+    # -- reporting --------------------------------------------------------------
+
+    @staticmethod
+    def _summary(group: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            **{k: v for k, v in group.items() if not isinstance(v, LogHistogram)},
+            'cost_usd': round(group['cost_usd'], 6),
+            'wall_time_s': round(group['wall_time_s'], 3),
+            'latency_ms': group['latency_ms'].summary(),
+            'ttft_ms': group['ttft_ms'].summary(),
+            'queue_wait_ms': group['queue_wait_ms'].summary(),
+        }
+
+    def top_agents(self, limit: int = 5) -> List[Dict[str, Any]]:
+        """Agents ordered by the LLM wall time they spent"""
+        with self._lock:
+            agents = [(name[6:], group) for name, group in self._groups.items() if name.startswith('agent:')]
+            agents.sort(key=lambda item: item[1]['wall_time_s'], reverse=True)
+            return [{'agent': name, 'wall_time_s': round(group['wall_time_s'], 3), 'calls': group['calls'],
+                     'cost_usd': round(group['cost_usd'], 6)} for name, group in agents[:limit]]
+
+    def get_status(self) -> Dict[str, Any]:
+        """Aggregates for all calls, per provider/model and per agent"""
+        with self._lock:
+            summaries = {name: self._summary(group) for name, group in self._groups.items()}
+        return {
+            'total': summaries.get('total', {}),
+            'by_model': {name[6:]: s for name, s in summaries.items() if name.startswith('model:')},
+            'by_agent': {name[6:]: s for name, s in summaries.items() if name.startswith('agent:')},
+            'top_agents': self.top_agents(),
+        }
+
+    def dump(self, path: Optional[str] = None) -> str:
+        """Write the aggregates and the most recent calls as JSON; returns the file written"""
+        path = Path(path or os.environ.get("LLM_METRICS_PATH", DEFAULT_METRICS_PATH))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            recent = list(self.recent)
+        with open(path, 'w') as f:
+            json.dump({'generated_at': time.time(), **self.get_status(), 'recent_calls': recent}, f, indent=2)
+        self.logger.info(f"📈 LLM metrics written to {path}")
+        return str(path)
+
+    def reset(self):
+        with self._lock:
+            self._groups.clear()
+            self.recent.clear()
+
+
+# Global instance for easy access
+llm_telemetry = LLMTelemetry()
+
+if os.environ.get("LLM_METRICS_PATH"):
+    # Leave a metrics dump behind every run when a destination is configured
+    atexit.register(llm_telemetry.dump)
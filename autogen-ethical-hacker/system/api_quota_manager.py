@@ -7,17 +7,29 @@ import json
 import time
 import random
 import os
-from groq import Groq
-import google.generativeai as genai
+from llm.response_cache import response_cache
+from llm.client_pool import client_registry
+from llm.key_rate_limiter import key_rate_limiter, retry_after_from_error
+from llm.key_health import key_health
+from llm.prompt_compaction import count_tokens
+from llm.cassette import llm_cassette, CassetteMiss
+from llm.telemetry import llm_telemetry
+from llm.cost_ledger import cost_ledger, BudgetExceededError
+from llm.local_backend import local_backend, LocalBackendError
+from llm.request_scheduler import request_scheduler
 
 class APIQuotaManager:
     def __init__(self, config_path="config/apis.json"):
         self.config_path = config_path
         self.apis = self.load_apis()
         self.api_usage = {}
-        self.failed_apis = set()
         self.current_groq_index = 0
         self.current_google_index = 0
+        self.max_attempts = int(os.environ.get("LLM_COMPLETION_MAX_ATTEMPTS", 4))
+        self.completion_deadline = float(os.environ.get("LLM_COMPLETION_DEADLINE", 90))
+        self.configure_rate_limits()
+        # Keys that fail real traffic are taken out of rotation and probed in the background
+        key_health.set_prober(self._probe_key)
         
     def load_apis(self):
         """Load API configuration"""
@@ -49,6 +61,16 @@ class APIQuotaManager:
         
         return template
     
+    def configure_rate_limits(self):
+        """Per-key request/token allowances, optionally set per provider in apis.json"""
+        for provider in ("groq", "google"):
+            config = self.apis.get(provider, {})
+            key_rate_limiter.configure(
+                provider,
+                requests_per_minute=config.get("requests_per_minute"),
+                tokens_per_minute=config.get("tokens_per_minute")
+            )
+    
     def add_api_key(self, provider, api_key):
         """Add new API key to configuration"""
         if provider not in self.apis:
@@ -71,80 +93,59 @@ class APIQuotaManager:
         with open(self.config_path, 'w') as f:
             json.dump(self.apis, f, indent=2)
     
+    def _first_usable_key(self, provider, start_index):
+        """Index of the first key not in cooldown or marked invalid, rotating from start_index"""
+        keys = self.apis.get(provider, {}).get("api_keys", [])
+        for i in range(len(keys)):
+            key_index = (start_index + i) % len(keys)
+            if key_health.is_usable(provider, keys[key_index]):
+                return key_index
+        return None
+    
+    def _probe_key(self, provider, api_key):
+        """Minimal call used by the background prober for keys in cooldown"""
+        if provider == "groq":
+            client_registry.get_groq_client(api_key).chat.completions.create(
+                model=self.apis["groq"].get("model", "openai/gpt-oss-120b"),
+                messages=[{"role": "user", "content": "Test"}],
+                max_tokens=1
+            )
+        else:
+            client_registry.get_genai_model(api_key, self.apis["google"].get("model", "gemini-pro")).generate_content(
+                "Test", generation_config={"max_output_tokens": 1}
+            )
+    
     def get_working_groq_client(self):
-        """Get working Groq client with automatic fallback"""
+        """Get a Groq client for the next healthy key (health comes from real traffic, no test call)"""
         groq_keys = self.apis.get("groq", {}).get("api_keys", [])
         
         if not groq_keys:
             print("[APIManager] ❌ No Groq API keys available")
             return None
         
-        # Try each Groq key
-        for i in range(len(groq_keys)):
-            key_index = (self.current_groq_index + i) % len(groq_keys)
-            api_key = groq_keys[key_index]
-            
-            if api_key in self.failed_apis:
-                continue
-            
-            try:
-                client = Groq(api_key=api_key)
-                # Test the client with a simple request
-                response = client.chat.completions.create(
-                    model=self.apis["groq"].get("model", "openai/gpt-oss-120b"),
-                    messages=[{"role": "user", "content": "Test"}],
-                    max_tokens=10
-                )
-                
-                self.current_groq_index = key_index
-                print(f"[APIManager] ✅ Using Groq API key #{key_index + 1}")
-                return client
-                
-            except Exception as e:
-                print(f"[APIManager] ❌ Groq key #{key_index + 1} failed: {e}")
-                self.failed_apis.add(api_key)
-                
-                # Check if quota exceeded
-                if "quota" in str(e).lower() or "limit" in str(e).lower():
-                    print(f"[APIManager] ⚠️ Groq API quota exhausted for key #{key_index + 1}")
+        key_index = self._first_usable_key("groq", self.current_groq_index)
+        if key_index is not None:
+            self.current_groq_index = key_index
+            print(f"[APIManager] ✅ Using Groq API key #{key_index + 1}")
+            return client_registry.get_groq_client(groq_keys[key_index])
         
         # All keys failed, request new one
         print("[APIManager] 🔑 All Groq API keys exhausted, requesting new key...")
         return self.request_new_groq_key()
     
     def get_working_google_client(self):
-        """Get working Google Gemini client with automatic fallback"""
+        """Get a Google Gemini client for the next healthy key (health comes from real traffic, no test call)"""
         google_keys = self.apis.get("google", {}).get("api_keys", [])
         
         if not google_keys:
             print("[APIManager] ❌ No Google API keys available")
             return None
         
-        # Try each Google key
-        for i in range(len(google_keys)):
-            key_index = (self.current_google_index + i) % len(google_keys)
-            api_key = google_keys[key_index]
-            
-            if api_key in self.failed_apis:
-                continue
-            
-            try:
-                genai.configure(api_key=api_key)
-                model = genai.GenerativeModel(self.apis["google"].get("model", "gemini-pro"))
-                
-                # Test the client
-                response = model.generate_content("Test")
-                
-                self.current_google_index = key_index
-                print(f"[APIManager] ✅ Using Google API key #{key_index + 1}")
-                return model
-                
-            except Exception as e:
-                print(f"[APIManager] ❌ Google key #{key_index + 1} failed: {e}")
-                self.failed_apis.add(api_key)
-                
-                if "quota" in str(e).lower() or "limit" in str(e).lower():
-                    print(f"[APIManager] ⚠️ Google API quota exhausted for key #{key_index + 1}")
+        key_index = self._first_usable_key("google", self.current_google_index)
+        if key_index is not None:
+            self.current_google_index = key_index
+            print(f"[APIManager] ✅ Using Google API key #{key_index + 1}")
+            return client_registry.get_genai_model(google_keys[key_index], self.apis["google"].get("model", "gemini-pro"))
         
         # All keys failed, request new one
         print("[APIManager] 🔑 All Google API keys exhausted, requesting new key...")
@@ -164,10 +165,8 @@ class APIQuotaManager:
             new_key = input("Enter new Groq API key (or press Enter to skip): ").strip()
             if new_key:
                 if self.add_api_key("groq", new_key):
-                    # Reset failed APIs for this provider
-                    groq_keys = self.apis.get("groq", {}).get("api_keys", [])
-                    for key in groq_keys:
-                        self.failed_apis.discard(key)
+                    # Give every key of this provider a fresh start
+                    key_health.reset("groq")
                     return self.get_working_groq_client()
             else:
                 print("[APIManager] ⚠️ Skipping Groq API, will try Google Gemini...")
@@ -189,10 +188,8 @@ class APIQuotaManager:
             new_key = input("Enter new Google Gemini API key (or press Enter to skip): ").strip()
             if new_key:
                 if self.add_api_key("google", new_key):
-                    # Reset failed APIs for this provider
-                    google_keys = self.apis.get("google", {}).get("api_keys", [])
-                    for key in google_keys:
-                        self.failed_apis.discard(key)
+                    # Give every key of this provider a fresh start
+                    key_health.reset("google")
                     return self.get_working_google_client()
             else:
                 print("[APIManager] ⚠️ No Google API key provided")
@@ -216,39 +213,172 @@ class APIQuotaManager:
         print("[APIManager] ❌ No working API clients available")
         return (None, None)
     
-    def make_completion(self, prompt, max_tokens=1000):
-        """Make AI completion with automatic provider fallback"""
-        provider, client = self.get_best_client()
-        
-        if not client:
-            return "Error: No working API clients available"
+    def _completion_cache_key(self, provider, max_tokens):
+        """Model and parameters used to address cached completions for a provider"""
+        # Over the engagement's soft budget the cheaper sibling model answers
+        if provider == "groq":
+            model = cost_ledger.model_for(provider, self.apis.get("groq", {}).get("model", "openai/gpt-oss-120b"))
+            return model, {"max_tokens": max_tokens, "temperature": 0.7}
+        return cost_ledger.model_for(provider, self.apis.get("google", {}).get("model", "gemini-pro")), {}
+    
+    def _complete_with_key(self, provider, api_key, prompt, max_tokens, estimated_tokens):
+        """Run one completion on a specific key, feeding usage and rate-limit headers back to its buckets"""
+        model, params = self._completion_cache_key(provider, max_tokens)
         
-        try:
+        def call():
             if provider == "groq":
-                response = client.chat.completions.create(
-                    model=self.apis["groq"].get("model", "openai/gpt-oss-120b"),
+                client = client_registry.get_groq_client(api_key)
+                raw = client.chat.completions.with_raw_response.create(
+                    model=model,
                     messages=[{"role": "user", "content": prompt}],
                     max_tokens=max_tokens,
                     temperature=0.7
                 )
+                key_rate_limiter.update_from_headers(provider, api_key, raw.headers)
+                response = raw.parse()
+                usage = getattr(response, "usage", None)
+                key_rate_limiter.record_usage(provider, api_key, estimated_tokens, getattr(usage, "total_tokens", None))
+                llm_telemetry.note(prompt_tokens=getattr(usage, "prompt_tokens", None),
+                                   completion_tokens=getattr(usage, "completion_tokens", None))
                 return response.choices[0].message.content
-            
-            elif provider == "google":
-                response = client.generate_content(prompt)
-                return response.text
+            response = client_registry.get_genai_model(api_key, model).generate_content(prompt)
+            usage = getattr(response, "usage_metadata", None)
+            key_rate_limiter.record_usage(provider, api_key, estimated_tokens, getattr(usage, "total_token_count", None))
+            llm_telemetry.note(prompt_tokens=getattr(usage, "prompt_token_count", None),
+                               completion_tokens=getattr(usage, "candidates_token_count", None))
+            return response.text
+        
+        result = llm_cassette.complete(provider, model, prompt, params, call)
+        response_cache.put(provider, model, prompt, result, params)
+        return result
+    
+    def _complete_local(self, prompt, max_tokens):
+        """Run one completion on the local CPU model, through the shared response cache"""
+        model = local_backend.model_name
+        params = {"max_tokens": max_tokens}
+        llm_telemetry.note(provider="local", model=model)
+        cached = response_cache.get("local", model, prompt, params)
+        if cached is not None:
+            llm_telemetry.note(cache_hit=True)
+            return cached
+        try:
+            with request_scheduler.slot("local"):
+                result = local_backend.complete(prompt, max_tokens)
+        except LocalBackendError as e:
+            return f"Error: Local model failed: {e}"
+        response_cache.put("local", model, prompt, result, params)
+        return result
+    
+    def make_completion(self, prompt, max_tokens=1000, deadline=None):
+        """
+        Make AI completion spread across all healthy keys by rate-limit headroom, with provider fallback
+        
+        Healthy traffic costs exactly one API call. Failed calls are retried on other keys or
+        the other provider, at most max_attempts times and never past the deadline (seconds).
+        """
+        # The provider and model that serve the request are noted once a key (or cache entry) is picked
+        with llm_telemetry.call("auto", None, prompt) as call:
+            result = self._make_completion(prompt, max_tokens, deadline)
+            if isinstance(result, str) and result.startswith("Error:"):
+                call.note(error=result)
+            call.set_result(result)
+            return result
+    
+    def _make_completion(self, prompt, max_tokens, deadline):
+        # Serve repeated prompts from the shared response cache before touching any key
+        for cached_provider in ("groq", "google"):
+            model, params = self._completion_cache_key(cached_provider, max_tokens)
+            cached = response_cache.get(cached_provider, model, prompt, params)
+            if cached is not None:
+                llm_telemetry.note(provider=cached_provider, model=model, cache_hit=True)
+                return cached
+        
+        if llm_cassette.replaying:
+            # Offline replay needs no keys: serve whichever provider the run was recorded against
+            for provider in ("groq", "google"):
+                model, params = self._completion_cache_key(provider, max_tokens)
+                if llm_cassette.has_recording(provider, model, prompt, params):
+                    llm_telemetry.note(provider=provider, model=model)
+                    return llm_cassette.complete(provider, model, prompt, params, None)
+            raise CassetteMiss(f"No cassette recording for completion in {llm_cassette.path}")
+        
+        estimated_tokens = count_tokens(prompt) + max_tokens
+        expires_at = time.monotonic() + (deadline if deadline is not None else self.completion_deadline)
+        attempts = 0
+        last_error = None
+        
+        for provider in ("groq", "google"):
+            try:
+                cost_ledger.admit(provider)
+            except BudgetExceededError as e:
+                # Past the hard budget paid providers are refused; asking for new keys would not help,
+                # so the local model answers, as in the routers
+                if local_backend.available:
+                    print(f"[APIManager] 🛑 {e}; answering with the local model")
+                    return self._complete_local(prompt, max_tokens)
+                return f"Error: {e}"
+            keys = self.apis.get(provider, {}).get("api_keys", [])
+            tried = set()
+            while attempts < self.max_attempts:
+                remaining = expires_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                # Waits briefly for a key with headroom rather than sending a request that would get a 429
+                queued_at = time.monotonic()
+                api_key = key_rate_limiter.acquire(
+                    provider, keys, estimated_tokens,
+                    exclude=key_health.unusable(provider, keys) | tried,
+                    max_wait=min(key_rate_limiter.max_wait, remaining)
+                )
+                llm_telemetry.note(queue_wait=time.monotonic() - queued_at)
+                if api_key is None:
+                    break
+                tried.add(api_key)
+                if attempts:
+                    llm_telemetry.note_retry()
+                attempts += 1
+                key_index = keys.index(api_key)
+                llm_telemetry.note(provider=provider, model=self._completion_cache_key(provider, max_tokens)[0],
+                                   key_index=key_index)
+                if provider == "groq":
+                    self.current_groq_index = key_index
+                else:
+                    self.current_google_index = key_index
                 
-        except Exception as e:
-            print(f"[APIManager] ❌ Completion failed: {e}")
-            # Mark this API as failed and try again
-            if provider == "groq":
-                current_key = self.apis["groq"]["api_keys"][self.current_groq_index]
-                self.failed_apis.add(current_key)
-            elif provider == "google":
-                current_key = self.apis["google"]["api_keys"][self.current_google_index]
-                self.failed_apis.add(current_key)
-            
-            # Recursive retry with different provider
-            return self.make_completion(prompt, max_tokens)
+                try:
+                    result = self._complete_with_key(provider, api_key, prompt, max_tokens, estimated_tokens)
+                    key_health.record_success(provider, api_key)
+                    return result
+                except Exception as e:
+                    last_error = e
+                    print(f"[APIManager] ❌ {provider.title()} key #{key_index + 1} completion failed: {e}")
+                    if key_health.record_failure(provider, api_key, e) == 'rate_limit':
+                        # Throttled, not broken: drain its buckets until it may be used again
+                        key_rate_limiter.record_rate_limited(provider, api_key, retry_after_from_error(e))
+        
+        configured = [(p, k) for p in ("groq", "google") for k in self.apis.get(p, {}).get("api_keys", [])]
+        if not configured or not any(key_health.is_usable(p, k) for p, k in configured):
+            # No usable key anywhere: fall back to the interactive flow that asks for a new one
+            provider, client = self.get_best_client()
+            if client and time.monotonic() < expires_at:
+                key_index = self.current_groq_index if provider == "groq" else self.current_google_index
+                api_key = self.apis[provider]["api_keys"][key_index]
+                llm_telemetry.note(provider=provider, model=self._completion_cache_key(provider, max_tokens)[0],
+                                   key_index=key_index)
+                attempts += 1
+                try:
+                    result = self._complete_with_key(provider, api_key, prompt, max_tokens, estimated_tokens)
+                    key_health.record_success(provider, api_key)
+                    return result
+                except Exception as e:
+                    last_error = e
+                    print(f"[APIManager] ❌ {provider.title()} key #{key_index + 1} completion failed: {e}")
+                    if key_health.record_failure(provider, api_key, e) == 'rate_limit':
+                        key_rate_limiter.record_rate_limited(provider, api_key, retry_after_from_error(e))
+        
+        if last_error is not None:
+            return f"Error: All API attempts failed ({attempts} attempts). Last error: {last_error}"
+        return "Error: No working API clients available"
     
     def get_api_status(self):
         """Get status of all API keys"""
@@ -269,9 +399,11 @@ class APIQuotaManager:
         for provider in ["groq", "google"]:
             keys = self.apis.get(provider, {}).get("api_keys", [])
             for key in keys:
-                if key in self.failed_apis:
-                    status[provider]["failed_keys"] += 1
-                else:
+                if key_health.is_usable(provider, key):
                     status[provider]["working_keys"] += 1
+                else:
+                    status[provider]["failed_keys"] += 1
         
+        status["key_health"] = key_health.get_status()
+        status["rate_limits"] = key_rate_limiter.get_status()
         return status
\ No newline at end of file
@@ -116,7 +116,7 @@ class SelfHealingManager:
             from llm.simple_llm_router import llm_complete
             result = self.exponential_backoff_retry(
                 llm_complete, 'api_calls',
-                "Health check", provider="groq", max_tokens=10
+                "Health check", provider="groq", max_tokens=10, use_cache=False
             )
             api_status['groq'] = "error" not in result.lower()
             self.components['api_groq']['status'] = 'healthy' if api_status['groq'] else 'failed'
@@ -132,7 +132,7 @@ class SelfHealingManager:
             from llm.simple_llm_router import llm_complete
             result = self.exponential_backoff_retry(
                 llm_complete, 'api_calls',
-                "Health check", provider="google", max_tokens=10
+                "Health check", provider="google", max_tokens=10, use_cache=False
             )
             api_status['google'] = "error" not in result.lower()
             self.components['api_google']['status'] = 'healthy' if api_status['google'] else 'failed'
@@ -0,0 +1,78 @@
+import pytest
+
+from llm.cost_ledger import CostLedger, BudgetExceededError
+from llm.shared_state import SharedStateStore
+from llm.telemetry import LLMTelemetry
+
+MODEL = 'llama-3.3-70b-versatile'
+
+
+@pytest.fixture
+def billing(tmp_path):
+    ledger = CostLedger(config={}, shared=SharedStateStore(path=str(tmp_path / 'state.db'), enabled=False))
+    telemetry = LLMTelemetry()
+    telemetry.add_listener(ledger.record_call)
+    return ledger, telemetry
+
+
+@pytest.mark.parametrize('error', [ConnectionError('connection refused'), BudgetExceededError('hard budget reached')])
+def test_calls_that_never_got_a_response_are_not_billed(billing, error):
+    ledger, telemetry = billing
+    with pytest.raises(type(error)):
+        with telemetry.call('groq', MODEL, prompt='Enumerate services on 10.0.0.5'):
+            raise error
+
+    assert telemetry.recent[-1]['prompt_tokens'] is None
+    assert telemetry.recent[-1]['cost_usd'] == 0.0
+    assert ledger.totals()['calls'] == 0
+    assert ledger.totals()['cost_usd'] == 0.0
+
+
+def test_error_string_in_place_of_an_answer_is_not_billed(billing):
+    ledger, telemetry = billing
+    with telemetry.call('groq', MODEL, prompt='Enumerate services on 10.0.0.5') as call:
+        telemetry.note(error='No API key configured')
+        call.set_result("Error: No API key configured")
+
+    assert telemetry.recent[-1]['responded'] is False
+    assert ledger.totals()['calls'] == 0
+
+
+def test_cache_hits_are_counted_but_not_charged(billing):
+    ledger, telemetry = billing
+    with telemetry.call('groq', MODEL, prompt='Enumerate services on 10.0.0.5') as call:
+        telemetry.note(cache_hit=True)
+        call.set_result("22/tcp open ssh")
+
+    totals = ledger.totals()
+    assert totals['cost_usd'] == 0.0
+    assert totals['prompt_tokens'] == 0
+
+
+def test_answered_calls_are_billed(billing):
+    ledger, telemetry = billing
+    with telemetry.call('groq', MODEL, prompt='Enumerate services on 10.0.0.5') as call:
+        for token in ("22/tcp ", "open ", "ssh"):
+            call.on_token(token)
+        call.set_result("22/tcp open ssh")
+    with telemetry.call('groq', MODEL, prompt='Summarize the findings'):
+        telemetry.note_usage(prompt_tokens=1000, completion_tokens=500)
+
+    totals = ledger.totals()
+    assert totals['calls'] == 2
+    assert totals['prompt_tokens'] > 1000
+    assert totals['completion_tokens'] > 500
+    assert totals['cost_usd'] > 0
+    assert totals['by_model'][MODEL]['calls'] == 2
+
+
+def test_record_call_ignores_errors_without_a_response(billing):
+    ledger, _ = billing
+    ledger.record_call({'model': MODEL, 'error': 'timed out', 'responded': False,
+                        'prompt_tokens': 100, 'cost_usd': 0.01})
+    assert ledger.totals()['calls'] == 0
+
+    # A stream that failed part-way was still answered, and is billed for what it used
+    ledger.record_call({'model': MODEL, 'error': 'stream reset', 'responded': True,
+                        'prompt_tokens': 100, 'completion_tokens': 20, 'cost_usd': 0.01})
+    assert ledger.totals()['calls'] == 1
@@ -0,0 +1,85 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from tools.nmap_xml import NmapXMLStream, parse_nmap_xml, hosts_from_results
+from tools.cve_lookup import lookup_cves
+
+SCAN = """<?xml version="1.0" encoding="UTF-8"?>
+<nmaprun scanner="nmap" args="nmap -sV -oX - 10.0.0.5 10.0.0.6" version="7.94" startstr="Mon Oct 12 10:00:00 2026">
+<host><status state="up" reason="syn-ack"/>
+<address addr="10.0.0.5" addrtype="ipv4"/>
+<hostnames><hostname name="web01.lab" type="PTR"/></hostnames>
+<ports>
+<port protocol="tcp" portid="22"><state state="open" reason="syn-ack"/>
+<service name="ssh" product="OpenSSH" version="8.9p1" extrainfo="protocol 2.0"><cpe>cpe:/a:openbsd:openssh:8.9p1</cpe></service>
+<script id="ssh-hostkey" output="&#xa;  256 aa:bb (ECDSA)"/></port>
+<port protocol="tcp" portid="80"><state state="closed" reason="reset"/><service name="http"/></port>
+</ports>
+</host>
+<host><status state="down" reason="no-response"/><address addr="10.0.0.6" addrtype="ipv4"/></host>
+<runstats><finished elapsed="12.34" exit="success" summary="2 IP addresses (1 host up)"/>
+<hosts up="1" down="1" total="2"/></runstats>
+</nmaprun>
+"""
+
+
+def test_stream_emits_each_host_as_it_completes():
+    stream = NmapXMLStream()
+    hosts = []
+    for i in range(0, len(SCAN), 17):
+        hosts.extend(stream.feed(SCAN[i:i + 17]))
+    hosts.extend(stream.close())
+
+    assert [host.address for host in hosts] == ['10.0.0.5', '10.0.0.6']
+    web, down = hosts
+    assert web.state == 'up' and down.state == 'down'
+    assert web.hostnames == ['web01.lab']
+    assert [port.port for port in web.open_ports] == [22]
+    ssh = web.ports[0].to_dict()
+    assert ssh == {'port': 22, 'protocol': 'tcp', 'state': 'open', 'reason': 'syn-ack', 'service': 'ssh',
+                   'product': 'OpenSSH', 'version': '8.9p1', 'extrainfo': 'protocol 2.0',
+                   'cpe': ['cpe:/a:openbsd:openssh:8.9p1'], 'scripts': {'ssh-hostkey': '256 aa:bb (ECDSA)'}}
+    assert str(web.ports[0]) == '22/tcp open ssh OpenSSH 8.9p1 (protocol 2.0)'
+    assert stream.scan['version'] == '7.94'
+    assert stream.stats == {'elapsed': '12.34', 'exit': 'success', 'summary': '2 IP addresses (1 host up)',
+                            'up': 1, 'down': 1, 'total': 2}
+
+
+def test_parsed_hosts_are_dropped_from_the_tree():
+    stream = NmapXMLStream()
+    stream.feed(SCAN[:SCAN.index('<runstats>')])
+    assert stream.hosts_parsed == 2
+    assert len(list(stream._root)) == 0
+
+
+def test_truncated_scan_raises_on_close():
+    stream = NmapXMLStream()
+    hosts = stream.feed(SCAN[:SCAN.index('<host><status state="down"')] + '<host><status state="do')
+    assert [host.address for host in hosts] == ['10.0.0.5']
+    with pytest.raises(ET.ParseError):
+        stream.close()
+
+
+def test_parse_nmap_xml_accepts_text_and_files(tmp_path):
+    path = tmp_path / 'scan.xml'
+    path.write_text(SCAN)
+    assert [host.address for host in parse_nmap_xml(SCAN)] == ['10.0.0.5', '10.0.0.6']
+    assert [host.address for host in parse_nmap_xml(str(path))] == ['10.0.0.5', '10.0.0.6']
+    with open(path, 'rb') as f:
+        assert len(list(parse_nmap_xml(f))) == 2
+
+
+def test_failed_scans_are_carried_to_the_cve_lookup():
+    web = next(parse_nmap_xml(SCAN))
+    results = {
+        '10.0.0.5': {'hosts': [web.to_dict()]},
+        '10.0.0.7': {'error': 'nmap timed out after 300s'},
+    }
+    hosts = hosts_from_results(results)
+    assert hosts['10.0.0.7'] == {'error': 'nmap timed out after 300s'}
+
+    cves = lookup_cves(hosts)
+    assert cves['10.0.0.5'] == [{'port': 22, 'service': 'ssh', 'product': 'OpenSSH', 'version': '8.9p1',
+                                 'cpe': ['cpe:/a:openbsd:openssh:8.9p1']}]
+    assert cves['10.0.0.7'] == [{'error': 'nmap timed out after 300s'}]
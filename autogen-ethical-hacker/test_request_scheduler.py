@@ -0,0 +1,93 @@
+import threading
+import time
+
+from llm.request_scheduler import LLMRequestScheduler, _held_lanes
+
+
+def _wait_queued(scheduler, lane, count):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        queued = scheduler.get_status()['lanes'][lane]['queued']
+        if sum(queued.values()) >= count:
+            return
+        time.sleep(0.005)
+    raise AssertionError(f"{count} request(s) never queued on {lane}")
+
+
+def test_weighted_fair_queuing_order():
+    scheduler = LLMRequestScheduler(slots=1, reserve=0, enabled=True)
+    order = []
+
+    def request(name, priority):
+        with scheduler.slot('groq', priority):
+            order.append(name)
+
+    threads = []
+    with scheduler.slot('groq', 'pipeline'):
+        # Queued one at a time so each gets its virtual start in this order
+        for index, (name, priority) in enumerate([('b1', 'background'), ('b2', 'background'), ('p1', 'pipeline'),
+                                                  ('i1', 'interactive'), ('i2', 'interactive')]):
+            thread = threading.Thread(target=request, args=(name, priority))
+            thread.start()
+            threads.append(thread)
+            _wait_queued(scheduler, 'groq', index + 1)
+    for thread in threads:
+        thread.join(5)
+
+    # Virtual starts: i1 0, b1 0, i2 1/8, p1 1/3 (after the holder's turn), b2 1; ties go to the heavier class
+    assert order == ['i1', 'b1', 'i2', 'p1', 'b2']
+    assert scheduler.stats['background']['overtaken'] >= 1
+
+
+def test_background_never_takes_reserved_slots():
+    scheduler = LLMRequestScheduler(slots=2, reserve=1, enabled=True)
+    admitted = threading.Event()
+
+    def background():
+        with scheduler.slot('groq', 'background'):
+            admitted.set()
+
+    with scheduler.slot('groq', 'pipeline'):
+        thread = threading.Thread(target=background)
+        thread.start()
+        # One slot is free, but it is the one reserved for the other classes
+        assert not admitted.wait(0.2)
+    thread.join(5)
+    assert admitted.is_set()
+
+
+def test_nested_slot_on_held_lane_passes_through():
+    scheduler = LLMRequestScheduler(slots=1, reserve=0, enabled=True)
+    with scheduler.slot('groq'):
+        assert 'groq' in _held_lanes.get()
+        # A continuation on the same lane would deadlock with one slot if it queued again
+        with scheduler.slot('groq'):
+            pass
+    assert 'groq' not in _held_lanes.get()
+    assert scheduler.get_status()['lanes']['groq']['in_use'] == 0
+
+
+def test_unbound_slot_is_not_visible_to_the_consumer():
+    scheduler = LLMRequestScheduler(slots=1, reserve=0, enabled=True)
+
+    def stream():
+        with scheduler.slot('groq', bind=False):
+            yield 'a'
+            yield 'b'
+
+    tokens = stream()
+    assert next(tokens) == 'a'
+    assert 'groq' not in _held_lanes.get()
+    # The consumer's own call queues behind the stream instead of passing through
+    admitted = threading.Event()
+
+    def call():
+        with scheduler.slot('groq'):
+            admitted.set()
+
+    thread = threading.Thread(target=call)
+    thread.start()
+    assert not admitted.wait(0.2)
+    assert list(tokens) == ['b']
+    thread.join(5)
+    assert admitted.is_set()
@@ -0,0 +1,59 @@
+import json
+
+from llm.structured_output import IncrementalJSONParser
+
+SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'port': {'type': 'integer'},
+        'service': {'type': 'string'},
+        'notes': {'type': 'string'},
+    },
+}
+
+
+def feed_in_chunks(parser, text, size=3):
+    for i in range(0, len(text), size):
+        if parser.feed(text[i:i + size]):
+            return True
+    return parser.complete
+
+
+def test_prose_and_code_fence_before_the_object_are_skipped():
+    parser = IncrementalJSONParser(SCHEMA)
+    text = 'Here is the result:\n```json\n{"port": 22, "service": "ssh"}\n```\nLet me know.'
+    assert parser.feed(text)
+    assert json.loads(parser.text) == {'port': 22, 'service': 'ssh'}
+
+
+def test_braces_in_prose_do_not_start_the_object():
+    parser = IncrementalJSONParser(SCHEMA)
+    assert not parser.feed('Use {curly} braces or {placeholders}, then: ')
+    assert not parser.started
+    assert parser.feed('{ "service": "http"}')
+    assert json.loads(parser.text) == {'service': 'http'}
+
+
+def test_chunked_feed_with_braces_and_quotes_inside_strings():
+    parser = IncrementalJSONParser(SCHEMA)
+    document = {'service': 'http', 'notes': 'body was {"a": [1, "}"]} and \\"quoted\\"'}
+    text = 'Result: ' + json.dumps(document) + ' trailing {"ignored": true}'
+    assert feed_in_chunks(parser, text)
+    assert json.loads(parser.text) == document
+
+
+def test_split_object_start_across_chunks():
+    parser = IncrementalJSONParser(SCHEMA)
+    assert not parser.feed('answer: {')
+    assert not parser.started
+    assert not parser.feed('\n  ')
+    assert parser.feed('"port": 443}')
+    assert json.loads(parser.text) == {'port': 443}
+
+
+def test_invalid_field_is_reported_before_the_object_completes():
+    parser = IncrementalJSONParser(SCHEMA)
+    assert not parser.feed('{"port": "not-a-number", "service": "ssh", "notes": "still strea')
+    assert 'port' in parser.field_errors
+    assert 'service' not in parser.field_errors
+    assert not parser.complete
@@ -2,5 +2,18 @@ def lookup_cves(recon_results):
     # Dummy CVE lookup for demonstration
     cve_results = {}
     for host, data in recon_results.items():
-        cve_results[host] = [{'service': 'ssh', 'cve': 'CVE-2023-1234', 'confidence': 0.9}]
+        if isinstance(data, dict) and 'address' in data and 'state' in data:
+            # Host records from tools.nmap_xml carry the detected service, version and CPEs per port;
+            # those are passed on as lookup candidates, with no CVE or confidence until a real lookup exists.
+            # A host that is down or has no open ports has nothing to look up.
+            ports = [p for p in data.get('ports', []) if p.get('state') == 'open']
+            cve_results[host] = [{'port': p['port'], 'service': p.get('service'), 'product': p.get('product'),
+                                  'version': p.get('version'), 'cpe': p.get('cpe', [])} for p in ports]
+            if data.get('error'):
+                cve_results[host].append({'error': data['error']})
+        elif isinstance(data, dict) and 'error' in data:
+            # The scan of this target failed or timed out
+            cve_results[host] = [{'error': data['error']}]
+        else:
+            cve_results[host] = [{'service': 'ssh', 'cve': 'CVE-2023-1234', 'confidence': 0.9}]
     return cve_results
@@ -12,6 +12,9 @@ from typing import Dict, List, Any, Optional, Callable
 from datetime import datetime
 from pathlib import Path
 
+from tools.target_executor import target_executor, expand_targets
+from tools.nmap_xml import parse_nmap_xml, describe_host
+
 class EnhancedToolWrapper:
     """
     Self-healing wrapper for security tools with automatic recovery
@@ -146,19 +149,25 @@ class EnhancedToolWrapper:
         self.logger.error(f"❌ Failed to recover {tool_name}")
         return False
     
-    def _execute_with_retry(self, tool_name: str, command: List[str], max_retries: int = 3) -> subprocess.CompletedProcess:
-        """Execute tool command with retry logic"""
+    def _execute_with_retry(self, tool_name: str, command: List[str], max_retries: int = 3,
+                            timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+        """Execute tool command with retry logic; timeout (the lab scope's by default) covers all attempts"""
+        deadline = time.monotonic() + (timeout or target_executor.timeout)
         for attempt in range(max_retries + 1):
             try:
                 # Ensure tool is available before execution
                 if not self._ensure_tool_available(tool_name):
                     raise Exception(f"Tool {tool_name} is not available")
                 
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise subprocess.TimeoutExpired(command, timeout or target_executor.timeout)
+                
                 # Execute the command
                 result = subprocess.run(
                     command,
                     capture_output=True,
-                    timeout=300,  # 5 minutes timeout
+                    timeout=remaining,
                     text=True
                 )
                 
@@ -171,7 +180,8 @@ class EnhancedToolWrapper:
                 
             except subprocess.TimeoutExpired as e:
                 self.logger.warning(f"⚠️ {tool_name} command timed out (attempt {attempt + 1})")
-                if attempt == max_retries:
+                if attempt == max_retries or time.monotonic() >= deadline:
+                    target_executor.note_timeout()
                     raise e
                 time.sleep(2 ** attempt)  # Exponential backoff
                 
@@ -189,28 +199,48 @@ class EnhancedToolWrapper:
         # This should never be reached
         raise Exception(f"All retry attempts exhausted for {tool_name}")
     
-    def enhanced_nmap(self, targets: List[str], additional_args: Optional[List[str]] = None) -> str:
-        """Enhanced Nmap execution with self-healing"""
+    def enhanced_nmap_hosts(self, targets: List[str], additional_args: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Nmap with self-healing, one scan per host in parallel, parsed from its XML output:
+        {target: [host records]} in target order, or {target: "Error: ..."} for failed scans
+        """
         self.logger.info(f"🔍 Running enhanced Nmap scan on {targets}")
         
-        command = ['nmap', '-sV', '-Pn'] + (additional_args or []) + targets
+        def scan(target: str, timeout: float) -> Any:
+            command = ['nmap', '-sV', '-Pn'] + (additional_args or []) + ['-oX', '-', target]
+            try:
+                result = self._execute_with_retry('nmap', command, timeout=timeout)
+                if result.returncode != 0:
+                    return f"Error: Nmap scan failed: {result.stderr}"
+                return [host.to_dict() for host in parse_nmap_xml(result.stdout)]
+            except Exception as e:
+                return f"Error: Nmap execution error: {str(e)}"
         
-        try:
-            result = self._execute_with_retry('nmap', command)
-            
-            if result.returncode == 0:
-                output = result.stdout
-                self.logger.info("✅ Nmap scan completed successfully")
-                return output
-            else:
-                error_msg = f"Nmap scan failed: {result.stderr}"
-                self.logger.error(f"❌ {error_msg}")
-                return f"Error: {error_msg}"
-                
-        except Exception as e:
-            error_msg = f"Nmap execution error: {str(e)}"
+        # Hosts are scanned concurrently up to the lab scope's max_threads; results keep target order
+        results = target_executor.map(scan, expand_targets(targets), label="nmap")
+        # Jobs abandoned past their timeout come back as {"error": ...}
+        return {target: f"Error: {output['error']}" if isinstance(output, dict) else output
+                for target, output in results.items()}
+    
+    def enhanced_nmap(self, targets: List[str], additional_args: Optional[List[str]] = None) -> str:
+        """Enhanced Nmap execution with self-healing, rendered as text from the parsed host records"""
+        results = self.enhanced_nmap_hosts(targets, additional_args)
+        failed = [target for target, output in results.items() if isinstance(output, str)]
+        
+        if not results:
+            return "Error: No targets to scan"
+        if len(failed) == len(results):
+            error_msg = "; ".join(f"{target}: {results[target][len('Error: '):]}" for target in failed)
             self.logger.error(f"❌ {error_msg}")
             return f"Error: {error_msg}"
+        
+        if failed:
+            self.logger.warning(f"⚠️ Nmap scan failed on {len(failed)}/{len(results)} target(s): {', '.join(failed)}")
+        else:
+            self.logger.info("✅ Nmap scan completed successfully")
+        return "\n".join("\n".join(describe_host(host) for host in output) if target not in failed
+                         else f"# {target}: {output}"
+                         for target, output in results.items())
     
     def enhanced_sqlmap(self, target_url: str, additional_args: Optional[List[str]] = None) -> str:
         """Enhanced SQLMap execution with self-healing"""
@@ -329,6 +359,7 @@ class EnhancedToolWrapper:
         """Get current status of all tools"""
         return {
             'tools': self.tools.copy(),
+            'executor': target_executor.get_status(),
             'last_health_check': datetime.now().isoformat()
         }
 
@@ -1,25 +1,19 @@
-import subprocess
+from tools.target_executor import target_executor, run_command
 
 def run_masscan(targets, ports="1-1000"):  # Example port range
     if isinstance(targets, str):
         targets = [targets]
-    results = {}
-    for target in targets:
-        try:
-            print(f"[masscan_tool] Running: masscan -p{ports} {target}")
-            proc = subprocess.Popen([
-                "masscan", "-p", ports, target
-            ], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
-            output_lines = []
-            if proc.stdout is not None:
-                for line in proc.stdout:
-                    print(f"[masscan_tool][{target}] {line.strip()}")
-                    output_lines.append(line)
-            proc.wait(timeout=60)
-            if proc.returncode == 0:
-                results[target] = {"output": ''.join(output_lines)}
-            else:
-                results[target] = {"error": ''.join(output_lines)}
-        except Exception as e:
-            results[target] = {"error": str(e)}
-    return results
+
+    def scan(target, timeout):
+        print(f"[masscan_tool] Running: masscan -p{ports} {target}")
+        result = run_command(["masscan", "-p", ports, target], timeout,
+                             on_line=lambda line: print(f"[masscan_tool][{target}] {line.strip()}\n", end=""))
+        if result.timed_out:
+            target_executor.note_timeout()
+            return {"error": f"Timed out after {timeout:.0f}s", "output": result.output}
+        if result.returncode == 0:
+            return {"output": result.output}
+        return {"error": result.output}
+
+    # Targets run in parallel; ranges stay whole since masscan sweeps them at its own packet rate
+    return target_executor.map(scan, targets, label="masscan")
@@ -1,23 +1,42 @@
-import subprocess
+import xml.etree.ElementTree as ET
+from tools.target_executor import target_executor, expand_targets, run_command
+from tools.nmap_xml import NmapXMLStream
 
-def run_nmap(targets):
-    results = {}
-    for target in targets:
-        try:
-            print(f"[nmap_tool] Running: nmap -sV -Pn {target}")
-            proc = subprocess.Popen([
-                "nmap", "-sV", "-Pn", target
-            ], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
-            output_lines = []
-            if proc.stdout is not None:
-                for line in proc.stdout:
-                    print(f"[nmap_tool][{target}] {line.strip()}")
-                    output_lines.append(line)
-            proc.wait(timeout=60)
-            if proc.returncode == 0:
-                results[target] = {"output": ''.join(output_lines)}
-            else:
-                results[target] = {"error": ''.join(output_lines)}
-        except Exception as e:
-            results[target] = {"error": str(e)}
-    return results
+def _scan(target, timeout, on_host=None):
+    print(f"[nmap_tool] Running: nmap -sV -Pn -oX - {target}")
+    stream = NmapXMLStream()
+    hosts = []
+
+    def on_line(line):
+        # Hosts are emitted as soon as nmap finishes them; the XML itself is not kept
+        for host in stream.feed(line):
+            # One write per line, so lines from parallel scans do not run together
+            print(f"[nmap_tool][{target}] {host.summary()}\n", end="")
+            record = host.to_dict()
+            hosts.append(record)
+            if on_host:
+                on_host(target, record)
+
+    result = run_command(["nmap", "-sV", "-Pn", "-oX", "-", target], timeout, on_line=on_line,
+                         merge_stderr=False, keep_output=False)
+    if result.timed_out:
+        target_executor.note_timeout()
+        return {"error": f"Timed out after {timeout:.0f}s", "hosts": hosts}
+    if result.returncode != 0:
+        return {"error": result.errors, "hosts": hosts}
+    try:
+        stream.close()
+    except ET.ParseError as e:
+        return {"error": f"Truncated nmap XML: {e}", "hosts": hosts}
+    return {"hosts": hosts, "stats": stream.stats}
+
+def run_nmap(targets, on_host=None):
+    """
+    Scan each target and return {target: {"hosts": [host records], "stats": {...}}} in target order;
+    on_host(target, record), if given, is called from the scanning threads as each host completes
+    """
+    if isinstance(targets, str):
+        targets = [targets]
+    # One scan per host, run in parallel up to the lab scope's max_threads
+    return target_executor.map(lambda target, timeout: _scan(target, timeout, on_host),
+                               expand_targets(targets), label="nmap")
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+🗂️ Streaming Nmap XML Parser
+Parses nmap's XML output (-oX -) incrementally and emits one compact, typed host record
+(addresses, ports, states, services, versions, CPEs, script output) as each host completes,
+dropping the parsed XML as it goes so memory stays flat however large the scan
+"""
+
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Any, Optional, Iterable, Iterator, Union, IO
+
+
+class NmapPort:
+    """One scanned port and the service detected on it"""
+
+    __slots__ = ('port', 'protocol', 'state', 'reason', 'service', 'product', 'version',
+                 'extrainfo', 'tunnel', 'cpe', 'scripts')
+
+    def __init__(self, port: int, protocol: str, state: str, reason: Optional[str] = None,
+                 service: Optional[str] = None, product: Optional[str] = None, version: Optional[str] = None,
+                 extrainfo: Optional[str] = None, tunnel: Optional[str] = None,
+                 cpe: Optional[List[str]] = None, scripts: Optional[Dict[str, str]] = None):
+        self.port = port
+        self.protocol = protocol
+        self.state = state
+        self.reason = reason
+        self.service = service
+        self.product = product
+        self.version = version
+        self.extrainfo = extrainfo
+        self.tunnel = tunnel
+        self.cpe = cpe or []
+        self.scripts = scripts or {}
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == 'open'
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Compact form: fields nmap did not report are left out"""
+        return {k: getattr(self, k) for k in self.__slots__ if getattr(self, k) not in (None, '', [], {})}
+
+    def __str__(self):
+        return describe_port(self.to_dict())
+
+
+class NmapHost:
+    """One scanned host: its addresses, names, state, ports and host-level script output"""
+
+    __slots__ = ('address', 'addresses', 'hostnames', 'state', 'ports', 'scripts', 'os')
+
+    def __init__(self, address: Optional[str], addresses: Dict[str, str], hostnames: List[str], state: str,
+                 ports: List[NmapPort], scripts: Optional[Dict[str, str]] = None, os: Optional[str] = None):
+        self.address = address
+        self.addresses = addresses
+        self.hostnames = hostnames
+        self.state = state
+        self.ports = ports
+        self.scripts = scripts or {}
+        self.os = os
+
+    @property
+    def open_ports(self) -> List[NmapPort]:
+        return [port for port in self.ports if port.is_open]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Compact form; the address map is only kept when it adds more than the primary address"""
+        record = {
+            'address': self.address,
+            'addresses': self.addresses if len(self.addresses) > 1 else None,
+            'hostnames': self.hostnames,
+            'state': self.state,
+            'ports': [port.to_dict() for port in self.ports],
+            'scripts': self.scripts,
+            'os': self.os,
+        }
+        return {k: v for k, v in record.items() if v not in (None, '', [], {})}
+
+    def summary(self) -> str:
+        """One line per host for logs and progress output"""
+        names = f" ({', '.join(self.hostnames)})" if self.hostnames else ""
+        ports = "; ".join(str(port) for port in self.open_ports) or "no open ports"
+        return f"{self.address}{names} {self.state}: {ports}"
+
+
+def describe_port(port: Dict[str, Any]) -> str:
+    """A port record as one line, e.g. '22/tcp open ssh OpenSSH 8.9p1 (protocol 2.0)'"""
+    extrainfo = port.get('extrainfo') and f"({port['extrainfo']})"
+    detail = " ".join(p for p in (port.get('product'), port.get('version'), extrainfo) if p)
+    return " ".join(p for p in (f"{port['port']}/{port.get('protocol', 'tcp')}", port.get('state'),
+                                port.get('service'), detail) if p)
+
+
+def describe_host(record: Dict[str, Any]) -> str:
+    """A host record as text: the host line, then its open ports and script output indented"""
+    names = f" ({', '.join(record['hostnames'])})" if record.get('hostnames') else ""
+    lines = [f"{record.get('address')}{names} {record.get('state', 'unknown')}"]
+    for port in record.get('ports', []):
+        if port.get('state') != 'open':
+            continue
+        lines.append(f"  {describe_port(port)}")
+        lines.extend(f"  | {script}: {output.splitlines()[0] if output else ''}"
+                     for script, output in port.get('scripts', {}).items())
+    lines.extend(f"  | {script}: {output.splitlines()[0] if output else ''}"
+                 for script, output in record.get('scripts', {}).items())
+    return "\n".join(lines)
+
+
+def _scripts(element: ET.Element) -> Dict[str, str]:
+    return {script.get('id'): (script.get('output') or '').strip() for script in element.findall('script')}
+
+
+def _port(element: ET.Element) -> NmapPort:
+    state = element.find('state')
+    service = element.find('service')
+    return NmapPort(
+        port=int(element.get('portid')),
+        protocol=element.get('protocol', 'tcp'),
+        state=state.get('state') if state is not None else 'unknown',
+        reason=state.get('reason') if state is not None else None,
+        service=service.get('name') if service is not None else None,
+        product=service.get('product') if service is not None else None,
+        version=service.get('version') if service is not None else None,
+        extrainfo=service.get('extrainfo') if service is not None else None,
+        tunnel=service.get('tunnel') if service is not None else None,
+        cpe=[cpe.text for cpe in service.findall('cpe') if cpe.text] if service is not None else [],
+        scripts=_scripts(element),
+    )
+
+
+def _host(element: ET.Element) -> NmapHost:
+    addresses = {address.get('addrtype', 'ipv4'): address.get('addr') for address in element.findall('address')}
+    status = element.find('status')
+    ports = element.find('ports')
+    hostscript = element.find('hostscript')
+    osmatch = element.find('os/osmatch')
+    return NmapHost(
+        address=addresses.get('ipv4') or addresses.get('ipv6') or next(iter(addresses.values()), None),
+        addresses=addresses,
+        hostnames=[name.get('name') for name in element.findall('hostnames/hostname') if name.get('name')],
+        state=status.get('state') if status is not None else 'unknown',
+        ports=[_port(port) for port in ports.findall('port')] if ports is not None else [],
+        scripts=_scripts(hostscript) if hostscript is not None else {},
+        os=osmatch.get('name') if osmatch is not None else None,
+    )
+
+
+class NmapXMLStream:
+    """
+    Push parser: feed() it chunks of nmap's XML as they arrive and it returns the hosts
+    completed so far. Each host (and every other top-level element) is dropped from the tree once parsed.
+    """
+
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=('start', 'end'))
+        self._root = None
+        self._depth = 0
+        self.scan = {}
+        self.stats = {}
+        self.hosts_parsed = 0
+
+    def _drain(self) -> List[NmapHost]:
+        hosts = []
+        for event, element in self._parser.read_events():
+            if event == 'start':
+                self._depth += 1
+                if self._root is None:
+                    self._root = element
+                    self.scan = {k: element.get(k) for k in ('scanner', 'args', 'version', 'startstr') if element.get(k)}
+                continue
+            self._depth -= 1
+            if element.tag == 'host':
+                hosts.append(_host(element))
+                self.hosts_parsed += 1
+            elif element.tag == 'finished':
+                self.stats.update({k: element.get(k) for k in ('elapsed', 'exit', 'summary') if element.get(k)})
+            elif element.tag == 'hosts':
+                self.stats.update({k: int(element.get(k)) for k in ('up', 'down', 'total') if element.get(k)})
+            if self._depth == 1:
+                # A finished child of <nmaprun> (host, hosthint, taskprogress, ...): drop it so the tree stays empty
+                self._root.remove(element)
+        return hosts
+
+    def feed(self, data: Union[str, bytes]) -> List[NmapHost]:
+        self._parser.feed(data)
+        return self._drain()
+
+    def close(self) -> List[NmapHost]:
+        """Finish parsing; raises ET.ParseError if the document was cut short (e.g. a killed scan)"""
+        self._parser.close()
+        return self._drain()
+
+
+def parse_nmap_xml(source: Union[str, IO, Iterable[Union[str, bytes]]]) -> Iterator[NmapHost]:
+    """Yield the hosts of an nmap XML document: its text, a file path, an open file, or an iterable of chunks"""
+    if isinstance(source, str) and source.lstrip().startswith('<'):
+        source = [source]
+    elif isinstance(source, str):
+        with open(source, 'rb') as f:
+            yield from parse_nmap_xml(iter(lambda: f.read(65536), b''))
+        return
+    if hasattr(source, 'read'):
+        f = source
+        source = iter(lambda: f.read(65536), f.read(0))
+    stream = NmapXMLStream()
+    for chunk in source:
+        yield from stream.feed(chunk)
+    yield from stream.close()
+
+
+def hosts_from_results(results: Any) -> Dict[str, Dict[str, Any]]:
+    """
+    Collect host records ({address: record}) from tool results of any shape: run_nmap()'s
+    {target: {"hosts": [...]}}, a list of records, or NmapHost objects. A target whose scan
+    failed or timed out is kept as {target: {"error": ...}}, or its host record gets the
+    "error" when the scan still reported the host.
+    """
+    hosts = {}
+
+    def walk(value, name=None):
+        if isinstance(value, NmapHost):
+            hosts[value.address] = value.to_dict()
+        elif isinstance(value, dict):
+            if 'address' in value and 'state' in value:
+                hosts[value['address']] = value
+                return
+            for key, item in value.items():
+                walk(item, key if isinstance(item, dict) else name)
+            if value.get('error') and name is not None:
+                hosts[name] = {**hosts.get(name, {}), 'error': value['error']}
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                walk(item, name)
+
+    walk(results)
+    return hosts
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+🧵 Concurrent Multi-Target Executor
+Runs per-target tool jobs in parallel on one shared worker pool sized by the lab scope's
+max_threads, hands every job the scope's timeout, and returns results in target order
+"""
+
+import os
+import json
+import signal
+import time
+import threading
+import ipaddress
+import subprocess
+import tempfile
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Callable, Iterable
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_SCOPE_PATH = PROJECT_ROOT / "config" / "lab_scope.json"
+
+DEFAULT_MAX_THREADS = 10
+DEFAULT_TIMEOUT = 300
+
+# Extra time a job gets to return after its timeout before the caller stops waiting for it
+ABANDON_GRACE = 10.0
+
+# Networks larger than this are passed to the tool whole rather than split into hosts
+MAX_EXPANDED_HOSTS = 4096
+
+
+def expand_targets(targets: Iterable[str], max_hosts: int = MAX_EXPANDED_HOSTS) -> List[str]:
+    """Split CIDR networks into their hosts and drop duplicates, keeping the order given"""
+    expanded = []
+    for target in targets:
+        try:
+            network = ipaddress.ip_network(target, strict=False)
+        except ValueError:
+            expanded.append(target)
+            continue
+        if network.num_addresses == 1 or network.num_addresses > max_hosts:
+            expanded.append(target)
+        else:
+            expanded.extend(str(host) for host in network.hosts())
+    return list(dict.fromkeys(expanded))
+
+
+class CommandResult:
+    """Exit status and output of one tool run (stderr is in `errors` when kept apart from stdout)"""
+
+    def __init__(self, returncode: Optional[int], output: str, timed_out: bool, elapsed: float, errors: str = ''):
+        self.returncode = returncode
+        self.output = output
+        self.timed_out = timed_out
+        self.elapsed = elapsed
+        self.errors = errors
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.timed_out
+
+
+def run_command(command: List[str], timeout: Optional[float] = None,
+                on_line: Optional[Callable[[str], None]] = None, merge_stderr: bool = True,
+                keep_output: bool = True) -> CommandResult:
+    """
+    Run a tool, passing each output line to on_line as it arrives; the process is killed once
+    it has run for `timeout` seconds. merge_stderr=False keeps stderr out of the lines (for
+    machine-readable output), and keep_output=False does not buffer what on_line consumed.
+    """
+    started = time.monotonic()
+    stderr = subprocess.STDOUT if merge_stderr else tempfile.TemporaryFile(mode='w+')
+    # Its own process group, so helpers the tool spawns die with it and release the output pipe
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr, text=True, bufsize=1,
+                            start_new_session=True)
+    timed_out = threading.Event()
+
+    def kill_group():
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            proc.kill()
+
+    def kill():
+        timed_out.set()
+        kill_group()
+
+    timer = threading.Timer(timeout, kill) if timeout else None
+    if timer:
+        timer.daemon = True
+        timer.start()
+    output_lines = []
+    try:
+        if proc.stdout is not None:
+            for line in proc.stdout:
+                if on_line:
+                    on_line(line)
+                if keep_output:
+                    output_lines.append(line)
+        proc.wait()
+    finally:
+        if timer:
+            timer.cancel()
+        if proc.poll() is None:
+            kill_group()
+            proc.wait()
+        errors = ''
+        if not merge_stderr:
+            stderr.seek(0)
+            errors = stderr.read()
+            stderr.close()
+    return CommandResult(proc.returncode, ''.join(output_lines), timed_out.is_set(), time.monotonic() - started, errors)
+
+
+class TargetExecutor:
+    """
+    One pool shared by every tool, so concurrent sweeps together never run more than
+    max_threads tool processes. Limits come from config/lab_scope.json ("max_threads" and
+    "timeout", in seconds per target); LAB_MAX_THREADS and LAB_TOOL_TIMEOUT override them.
+    """
+
+    def __init__(self, max_threads: Optional[int] = None, timeout: Optional[float] = None,
+                 scope_path: Optional[str] = None):
+        self.setup_logging()
+        scope = self._read_scope(scope_path or str(DEFAULT_SCOPE_PATH))
+        self.max_threads = int(max_threads or os.environ.get("LAB_MAX_THREADS") or scope.get('max_threads') or DEFAULT_MAX_THREADS)
+        self.timeout = float(timeout or os.environ.get("LAB_TOOL_TIMEOUT") or scope.get('timeout') or DEFAULT_TIMEOUT)
+
+        self._lock = threading.Lock()
+        self._pool = None
+        self._local = threading.local()
+        self.stats = {'runs': 0, 'jobs': 0, 'failed': 0, 'timed_out': 0, 'abandoned': 0,
+                      'active': 0, 'wall_seconds': 0.0, 'job_seconds': 0.0}
+
+    def setup_logging(self):
+        """Setup logging for target execution"""
+        self.logger = logging.getLogger('TargetExecutor')
+        if not self.logger.handlers:
+            handler = logging.StreamHandler()
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+            handler.setFormatter(formatter)
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+
+    def _read_scope(self, path: str) -> Dict[str, Any]:
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"⚠️ Could not read lab scope from {path}: {e}")
+            return {}
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_threads, thread_name_prefix='target')
+            return self._pool
+
+    def _run_job(self, job: Callable[[str, float], Any], target: str, timeout: float, starts: Dict[str, float],
+                 in_pool: bool = False):
+        if in_pool:
+            self._local.worker = True
+        starts[target] = time.monotonic()
+        with self._lock:
+            self.stats['active'] += 1
+        try:
+            return job(target, timeout)
+        finally:
+            with self._lock:
+                self.stats['active'] -= 1
+                self.stats['job_seconds'] += time.monotonic() - starts[target]
+
+    def _error(self, target: str, label: str, message: str) -> Dict[str, Any]:
+        self.logger.warning(f"⚠️ {label} on {target}: {message}")
+        return {"error": message}
+
+    def map(self, job: Callable[[str, float], Any], targets: Iterable[str], timeout: Optional[float] = None,
+            label: str = "job") -> Dict[str, Any]:
+        """
+        Run job(target, timeout) for every target on the shared pool and return
+        {target: result} in target order. A job that raises yields {"error": ...}; one still
+        running ABANDON_GRACE seconds past its timeout is reported as timed out and left behind.
+        """
+        targets = list(dict.fromkeys(targets))
+        timeout = timeout or self.timeout
+        results = {}
+        if not targets:
+            return results
+        started = time.monotonic()
+
+        if getattr(self._local, 'worker', False) or len(targets) == 1:
+            # A single target, or a job fanning out again from a pool worker: run inline
+            for target in targets:
+                try:
+                    results[target] = self._run_job(job, target, timeout, {})
+                except Exception as e:
+                    self.stats['failed'] += 1
+                    results[target] = self._error(target, label, str(e))
+            self._record(len(targets), started)
+            return results
+
+        pool = self._get_pool()
+        starts = {}
+        pending = {pool.submit(self._run_job, job, target, timeout, starts, True): target for target in targets}
+        self.logger.info(f"🧵 {label}: {len(targets)} target(s), {min(self.max_threads, len(targets))} at a time, "
+                         f"{timeout:.0f}s each")
+        while pending:
+            done, _ = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+            for future in done:
+                target = pending.pop(future)
+                try:
+                    results[target] = future.result()
+                except Exception as e:
+                    self.stats['failed'] += 1
+                    results[target] = self._error(target, label, str(e))
+            now = time.monotonic()
+            for future, target in list(pending.items()):
+                if target in starts and now - starts[target] > timeout + ABANDON_GRACE:
+                    # The job ignored its timeout; its worker stays busy until it returns
+                    del pending[future]
+                    self.stats['abandoned'] += 1
+                    results[target] = self._error(target, label, f"Timed out after {timeout:.0f}s")
+
+        self._record(len(targets), started)
+        return {target: results[target] for target in targets}
+
+    def _record(self, jobs: int, started: float):
+        with self._lock:
+            self.stats['runs'] += 1
+            self.stats['jobs'] += jobs
+            self.stats['wall_seconds'] += time.monotonic() - started
+
+    def note_timeout(self):
+        """Count a job that hit its timeout (jobs kill their own tool process)"""
+        with self._lock:
+            self.stats['timed_out'] += 1
+
+    def get_status(self) -> Dict[str, Any]:
+        """Pool limits and how much parallelism the sweeps achieved"""
+        with self._lock:
+            stats = dict(self.stats)
+        return {
+            'max_threads': self.max_threads,
+            'timeout': self.timeout,
+            **stats,
+            # Summed job time over wall time: ~1 is sequential, ~max_threads is a full pool
+            'parallelism': round(stats['job_seconds'] / stats['wall_seconds'], 2) if stats['wall_seconds'] else None,
+        }
+
+
+# Global instance for easy access
+target_executor = TargetExecutor()
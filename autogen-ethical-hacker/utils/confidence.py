@@ -3,5 +3,6 @@ def compute_confidence(evidence):
     if evidence.get('nvd_exact_match'): score += 0.5
     if evidence.get('exploitdb'): score += 0.2
     if evidence.get('secondary_confirm'): score += 0.15
-    if evidence.get('llm_consensus'): score += 0.1
+    # llm_consensus may be a flag or the fraction of an LLM ensemble that agreed
+    if evidence.get('llm_consensus'): score += 0.1 * min(1.0, float(evidence['llm_consensus']))
     return min(1.0, score)